@@ -0,0 +1,89 @@
+"""
+Compare the latency of calling several OAuth providers one after the other
+with calling them through ``fan_out``. Each provider is a local HTTP server
+that waits before it responds, standing in for a slow provider API.
+
+Run it with:
+
+    python benchmarks/fan_out_latency.py
+"""
+
+import argparse
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import flask
+
+from flask_dance.consumer import OAuth2ConsumerBlueprint
+from flask_dance.consumer.requests import fan_out
+from flask_dance.consumer.storage import MemoryStorage
+
+# the stub providers don't use HTTPS
+os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+
+
+def start_provider(delay):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--providers", type=int, default=3)
+    parser.add_argument("--delay", type=float, default=0.2)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    app = flask.Flask(__name__)
+    blueprints = []
+    servers = []
+    for i in range(args.providers):
+        server = start_provider(args.delay)
+        servers.append(server)
+        bp = OAuth2ConsumerBlueprint(
+            f"provider-{i}",
+            __name__,
+            client_id="client_id",
+            base_url="http://127.0.0.1:{}".format(server.server_address[1]),
+            storage=MemoryStorage({"access_token": "token", "token_type": "bearer"}),
+        )
+        app.register_blueprint(bp, url_prefix=f"/{i}")
+        blueprints.append(bp)
+
+    def sequential():
+        return [bp.session.get("/user") for bp in blueprints]
+
+    def parallel():
+        return fan_out([(bp.session, "GET", "/user") for bp in blueprints])
+
+    print(f"{args.providers} providers, each taking {args.delay * 1000:.0f} ms")
+    print(f"{'strategy':>10}  {'ms/view':>8}")
+    for name, view in (("sequential", sequential), ("fan_out", parallel)):
+        elapsed = 0
+        for _ in range(args.rounds):
+            with app.test_request_context("/"):
+                start = time.perf_counter()
+                view()
+                elapsed += time.perf_counter() - start
+        print(f"{name:>10}  {elapsed / args.rounds * 1000:>8.1f}")
+
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
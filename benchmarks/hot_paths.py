@@ -0,0 +1,347 @@
+"""
+Time the hot paths of the Flask-Dance consumer blueprints, so that the
+results of two commits can be compared:
+
+* the overhead of a request that doesn't use OAuth, with 0, 4 and 8
+  provider blueprints registered
+* reading ``blueprint.token`` from ``SessionStorage``, and from
+  ``SQLAlchemyStorage`` with SQLite, with and without a cache
+* generating the redirect in the ``login`` view
+* handling the callback in the ``authorized`` view, with a stubbed token
+  endpoint
+* making a session with ``offline_session()``
+* signing an OAuth 1 request
+
+Nothing is sent over the network. Run it with:
+
+    python benchmarks/hot_paths.py
+
+The provider apps are the ones from ``provider_overhead.py``, which is
+imported from the same directory.
+
+To compare two commits, save the results of one with ``--save`` and pass
+them to the other with ``--compare``. Older commits don't have these
+benchmarks, so copy them out of the way first, and run the copy from the
+checkout of each commit, so that it imports that commit's Flask-Dance:
+
+    cp -r benchmarks /tmp/benchmarks
+    git checkout main
+    PYTHONPATH=. python /tmp/benchmarks/hot_paths.py --save main.json
+    git checkout my-branch
+    PYTHONPATH=. python /tmp/benchmarks/hot_paths.py --compare main.json
+
+Benchmarks of features that the checked out commit doesn't have, like
+``offline_session()``, are skipped.
+
+Each benchmark is timed ``--repeat`` times, and the fastest run is
+reported, since it is the least disturbed by everything else that is
+running on the machine. The ``SQLAlchemyStorage`` benchmarks require
+SQLAlchemy, and the cached one requires Flask-Caching as well.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import timeit
+
+import flask
+from provider_overhead import make_app as make_provider_app
+from requests import Request, Response
+from requests.adapters import BaseAdapter
+
+from flask_dance.consumer import OAuth1ConsumerBlueprint, OAuth2ConsumerBlueprint
+from flask_dance.consumer.storage import MemoryStorage
+
+# the stub token endpoint doesn't use HTTPS
+os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+
+TOKEN = {"access_token": "benchmark", "token_type": "bearer", "scope": ["user"]}
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    "Register a function that sets up a benchmark, and returns what to time"
+
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+class StubAdapter(BaseAdapter):
+    "A transport adapter that answers every request with the same JSON"
+
+    def __init__(self, body):
+        super().__init__()
+        self.body = json.dumps(body).encode("utf-8")
+
+    def send(self, request, **kwargs):
+        response = Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/json"
+        response._content = self.body
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class Unsupported(Exception):
+    "Raised by benchmarks of features that this Flask-Dance doesn't have"
+
+
+def make_oauth2_app(**kwargs):
+    app = flask.Flask(__name__)
+    app.secret_key = "benchmark"
+    bp = OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client-id",
+        client_secret="client-secret",
+        scope="user",
+        state="benchmark-state",
+        base_url="https://api.example.com/",
+        authorization_url="https://example.com/oauth/authorize",
+        token_url="https://example.com/oauth/token",
+        redirect_url="/",
+        **kwargs,
+    )
+    app.register_blueprint(bp, url_prefix="/login")
+    return app, bp
+
+
+def request_overhead(count):
+    app = make_provider_app(count)
+    client = app.test_client()
+    return lambda: client.get("/health")
+
+
+for _count in (0, 4, 8):
+    benchmark(f"request_overhead[{_count} providers]")(
+        lambda count=_count: request_overhead(count)
+    )
+
+
+def read_token(app, bp):
+    ctx = app.test_request_context("/")
+    ctx.push()
+
+    # older versions load the token from the storage every time anyway
+    forget_token = getattr(bp, "forget_token", None)
+
+    def run():
+        # forget the token that was loaded earlier in this request
+        if forget_token:
+            forget_token()
+        return bp.token
+
+    return run, ctx.pop
+
+
+@benchmark("token_read[SessionStorage]")
+def token_read_session():
+    app, bp = make_oauth2_app()
+    run, teardown = read_token(app, bp)
+    flask.session["test-service_oauth_token"] = TOKEN
+    return run, teardown
+
+
+def token_read_sqla(cache_type):
+    from sqlalchemy import Column, ForeignKey, Integer, String, create_engine
+    from sqlalchemy.orm import Session, declarative_base, relationship
+
+    from flask_dance.consumer.storage.sqla import OAuthConsumerMixin, SQLAlchemyStorage
+
+    Base = declarative_base()
+
+    class User(Base):
+        __tablename__ = "user"
+        id = Column(Integer, primary_key=True)
+        name = Column(String(80))
+
+    class OAuth(OAuthConsumerMixin, Base):
+        user_id = Column(Integer, ForeignKey(User.id))
+        user = relationship(User)
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    alice = User(name="Alice")
+    session.add(alice)
+    session.add(OAuth(provider="test-service", token=TOKEN, user=alice))
+    session.commit()
+
+    cache = None
+    if cache_type:
+        from flask_caching import Cache
+
+        cache = Cache(config={"CACHE_TYPE": cache_type})
+    storage = SQLAlchemyStorage(OAuth, session, user=lambda: alice, cache=cache)
+    app, bp = make_oauth2_app(storage=storage)
+    if cache:
+        cache.init_app(app)
+    run, teardown = read_token(app, bp)
+
+    def teardown_all():
+        teardown()
+        session.close()
+        engine.dispose()
+
+    return run, teardown_all
+
+
+benchmark("token_read[SQLAlchemyStorage]")(lambda: token_read_sqla(None))
+benchmark("token_read[SQLAlchemyStorage+SimpleCache]")(
+    lambda: token_read_sqla("SimpleCache")
+)
+
+
+@benchmark("login_redirect")
+def login_redirect():
+    app, bp = make_oauth2_app()
+    client = app.test_client()
+    return lambda: client.get("/login/test-service")
+
+
+@benchmark("authorized_callback")
+def authorized_callback():
+    app, bp = make_oauth2_app(storage=MemoryStorage())
+    adapter = StubAdapter(TOKEN)
+
+    def session_created(session):
+        # older versions don't have the transport_adapter argument
+        session.mount("https://", adapter)
+        return session
+
+    bp.session_created = session_created
+    client = app.test_client()
+    url = "/login/test-service/authorized?code=secret-code&state=benchmark-state"
+
+    def run():
+        with client.session_transaction() as sess:
+            sess["test-service_oauth_state"] = "benchmark-state"
+        resp = client.get(url)
+        assert resp.status_code == 302, resp.status_code
+
+    return run
+
+
+@benchmark("offline_session")
+def offline_session():
+    app, bp = make_oauth2_app(storage=MemoryStorage())
+    if not hasattr(bp, "offline_session"):
+        raise Unsupported("no offline_session()")
+    return lambda: bp.offline_session(user_id=1, token=TOKEN)
+
+
+@benchmark("oauth1_signing")
+def oauth1_signing():
+    app = flask.Flask(__name__)
+    bp = OAuth1ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_key="client-key",
+        client_secret="client-secret",
+        base_url="https://api.example.com/",
+        storage=MemoryStorage(
+            {"oauth_token": "token", "oauth_token_secret": "token-secret"}
+        ),
+    )
+    app.register_blueprint(bp, url_prefix="/login")
+    ctx = app.test_request_context("/")
+    ctx.push()
+    bp.session.load_token()
+    request = Request("GET", "statuses/home_timeline.json", params={"count": 20})
+    # preparing the request signs it
+    return lambda: bp.session.prepare_request(request), ctx.pop
+
+
+def run_benchmark(setup, number, repeat):
+    result = setup()
+    if isinstance(result, tuple):
+        func, teardown = result
+    else:
+        func, teardown = result, None
+    try:
+        func()  # warm up
+        times = timeit.repeat(func, number=number, repeat=repeat)
+    finally:
+        if teardown:
+            teardown()
+    return min(times) / number * 1e6
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "-k", dest="keyword", help="only run benchmarks with this in their name"
+    )
+    parser.add_argument("--save", metavar="PATH", help="save the results as JSON")
+    parser.add_argument(
+        "--compare", metavar="PATH", help="compare with results saved with --save"
+    )
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    width = max(len(name) for name in BENCHMARKS)
+    header = f"{'benchmark':<{width}}  {'usec/op':>10}"
+    if baseline:
+        header += f"  {'baseline':>10}  {'change':>7}"
+    print(header)
+    for name, setup in BENCHMARKS.items():
+        if args.keyword and args.keyword not in name:
+            continue
+        try:
+            usec = run_benchmark(setup, args.number, args.repeat)
+        except (ImportError, Unsupported) as exc:
+            print(f"{name:<{width}}  {'skipped':>10}  ({exc})")
+            continue
+        results[name] = usec
+        line = f"{name:<{width}}  {usec:>10.1f}"
+        if name in baseline:
+            change = (usec - baseline[name]) / baseline[name] * 100
+            line += f"  {baseline[name]:>10.1f}  {change:>+6.1f}%"
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "python": platform.python_version(),
+                    "number": args.number,
+                    "repeat": args.repeat,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Measure the per-request overhead of registering Flask-Dance provider
+blueprints on an application, for a view that never touches OAuth
+(like a health check or a static file).
+
+Run it with:
+
+    python benchmarks/provider_overhead.py
+
+For each number of registered providers, this prints the mean time per
+request and the number of provider sessions that were constructed.
+"""
+
+import argparse
+import timeit
+from importlib import import_module
+
+import flask
+
+from flask_dance.consumer import OAuth2ConsumerBlueprint
+
+PROVIDERS = [
+    "github",
+    "google",
+    "gitlab",
+    "discord",
+    "spotify",
+    "twitch",
+    "azure",
+    "slack",
+]
+
+
+def make_app(count):
+    app = flask.Flask(__name__)
+    app.secret_key = "benchmark"
+    for name in PROVIDERS[:count]:
+        module = import_module(f"flask_dance.contrib.{name}")
+        factory = getattr(module, f"make_{name}_blueprint")
+        app.config[f"{name.upper()}_OAUTH_CLIENT_ID"] = "client-id"
+        app.config[f"{name.upper()}_OAUTH_CLIENT_SECRET"] = "client-secret"
+        app.register_blueprint(factory(), url_prefix="/login")
+
+    @app.route("/health")
+    def health():
+        return "ok"
+
+    return app
+
+
+def count_sessions(func):
+    "Call `func`, and return how many blueprint sessions it constructed"
+    original = OAuth2ConsumerBlueprint.session_created
+    created = []
+
+    def session_created(self, session):
+        created.append(session)
+        return original(self, session)
+
+    OAuth2ConsumerBlueprint.session_created = session_created
+    try:
+        func()
+    finally:
+        OAuth2ConsumerBlueprint.session_created = original
+    return len(created)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'providers':>9}  {'usec/request':>12}  {'sessions/request':>16}")
+    for count in range(len(PROVIDERS) + 1):
+        app = make_app(count)
+        client = app.test_client()
+        client.get("/health")  # warm up
+
+        sessions = count_sessions(lambda: client.get("/health"))
+        elapsed = timeit.timeit(lambda: client.get("/health"), number=args.requests)
+        usec = elapsed / args.requests * 1e6
+        print(f"{count:>9}  {usec:>12.1f}  {sessions:>16}")
+
+
+if __name__ == "__main__":
+    main()
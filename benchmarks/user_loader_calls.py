@@ -0,0 +1,88 @@
+"""
+Count how many times ``SQLAlchemyStorage`` resolves the current user
+for each ``authorized`` check, with and without a cache. The user is
+represented by a function, which stands in for a user loader like
+Flask-Login's ``current_user``.
+
+Run it with:
+
+    python benchmarks/user_loader_calls.py
+
+Requires SQLAlchemy and Flask-Caching.
+"""
+
+import argparse
+import timeit
+
+import flask
+from flask_caching import Cache
+from sqlalchemy import Column, ForeignKey, Integer, String, create_engine
+from sqlalchemy.orm import Session, declarative_base, relationship
+
+from flask_dance.consumer import OAuth2ConsumerBlueprint
+from flask_dance.consumer.storage.sqla import OAuthConsumerMixin, SQLAlchemyStorage
+
+Base = declarative_base()
+
+
+class User(Base):
+    __tablename__ = "user"
+    id = Column(Integer, primary_key=True)
+    name = Column(String(80))
+
+
+class OAuth(OAuthConsumerMixin, Base):
+    user_id = Column(Integer, ForeignKey(User.id))
+    user = relationship(User)
+
+
+def run(cache_type, checks):
+    app = flask.Flask(__name__)
+    if cache_type:
+        app.config["CACHE_TYPE"] = cache_type
+        cache = Cache(app)
+    else:
+        cache = None
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    alice = User(name="Alice")
+    session.add(alice)
+    session.commit()
+
+    calls = []
+
+    def load_user():
+        calls.append(alice)
+        return alice
+
+    bp = OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client_id",
+        storage=SQLAlchemyStorage(OAuth, session, user=load_user, cache=cache),
+    )
+    app.register_blueprint(bp)
+
+    def check():
+        # each check is a new request, which loads the token again
+        with app.test_request_context("/"):
+            return bp.session.authorized
+
+    elapsed = timeit.timeit(check, number=checks)
+    return len(calls) / checks, elapsed / checks * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--checks", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'cache':>12}  {'loader calls/check':>18}  {'usec/check':>10}")
+    for cache_type in (None, "SimpleCache"):
+        calls, usec = run(cache_type, args.checks)
+        print(f"{cache_type or 'no cache':>12}  {calls:>18.2f}  {usec:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Flask-Dance adds a ``flask dance`` command group to the
+:doc:`Flask command line interface <flask:cli>`, for managing OAuth tokens
+outside of a request. If Flask-Dance is installed, the commands are
+registered automatically. You can also register them yourself:
+
+.. code-block:: python
+
+    from flask_dance.cli import dance
+
+    app.cli.add_command(dance)
+
+"""
+
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from flask_dance.consumer import OAuth2ConsumerBlueprint
+from flask_dance.consumer.base import BaseOAuthConsumerBlueprint
+from flask_dance.consumer.refresh import refresh_expiring_tokens
+
+dance = AppGroup("dance", help="Manage the OAuth tokens stored by Flask-Dance.")
+
+
+def _blueprints(names, cls):
+    blueprints = [bp for bp in current_app.blueprints.values() if isinstance(bp, cls)]
+    if names:
+        unknown = set(names) - {bp.name for bp in blueprints}
+        if unknown:
+            raise click.BadParameter(
+                "no such blueprint: {}".format(", ".join(sorted(unknown))),
+                param_hint="--blueprint",
+            )
+        blueprints = [bp for bp in blueprints if bp.name in names]
+    return blueprints
+
+
+@dance.command("refresh")
+@click.option(
+    "--window",
+    default=300,
+    show_default=True,
+    help="Refresh tokens that expire within this many seconds.",
+)
+@click.option(
+    "--workers",
+    default=4,
+    show_default=True,
+    help="The number of tokens to refresh at the same time.",
+)
+@click.option(
+    "--blueprint",
+    "names",
+    multiple=True,
+    help="Only refresh tokens for this blueprint. Can be used more than once.",
+)
+def refresh_command(window, workers, names):
+    """
+    Refresh OAuth 2 tokens that are about to expire.
+
+    Only blueprints that have an ``auto_refresh_url``, and that use a token
+    storage that can look up tokens for all users, are refreshed.
+    """
+    for bp in _blueprints(names, OAuth2ConsumerBlueprint):
+        if not bp.auto_refresh_url:
+            continue
+        try:
+            refreshed, failed = refresh_expiring_tokens(
+                bp, window=window, max_workers=workers
+            )
+        except NotImplementedError:
+            click.echo(f"{bp.name}: skipped, token storage can't list tokens")
+            continue
+        click.echo(f"{bp.name}: refreshed {refreshed} tokens, {failed} failed")
+
+
+@dance.command("gc")
+@click.option(
+    "--grace",
+    default=0,
+    show_default=True,
+    help="Only delete tokens that expired at least this many seconds ago.",
+)
+@click.option(
+    "--batch-size",
+    default=1000,
+    show_default=True,
+    help="The number of tokens to delete in each transaction.",
+)
+@click.option(
+    "--sleep",
+    default=0.1,
+    show_default=True,
+    help="The number of seconds to wait between batches.",
+)
+@click.option(
+    "--blueprint",
+    "names",
+    multiple=True,
+    help="Only delete tokens for this blueprint. Can be used more than once.",
+)
+def gc_command(grace, batch_size, sleep, names):
+    """
+    Delete OAuth tokens that can't be used any more.
+
+    These are tokens that have expired and have no refresh token, and tokens
+    of users that no longer exist. They are deleted in batches, with a pause
+    between batches, so that the table isn't locked for long. Blueprints that
+    use a token storage that can't look up tokens for all users are skipped.
+    """
+    before = time.time() - grace
+    for bp in _blueprints(names, BaseOAuthConsumerBlueprint):
+        try:
+            expired = bp.storage.delete_expired_tokens(
+                bp, before, batch_size=batch_size, sleep=sleep
+            )
+            orphaned = bp.storage.delete_orphaned_tokens(
+                bp, batch_size=batch_size, sleep=sleep
+            )
+        except NotImplementedError:
+            click.echo(f"{bp.name}: skipped, token storage can't list tokens")
+            continue
+        click.echo(
+            f"{bp.name}: deleted {expired} expired tokens, {orphaned} orphaned tokens"
+        )
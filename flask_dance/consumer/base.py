@@ -1,3 +1,4 @@
+import time
 from abc import ABCMeta, abstractmethod, abstractproperty
 from datetime import datetime, timedelta, timezone
 
@@ -5,6 +6,8 @@ import flask
 from flask.signals import Namespace
 from werkzeug.datastructures import CallbackDict
 
+from flask_dance.consumer.instrumentation import instrument
+from flask_dance.consumer.metrics import registry as metrics_registry
 from flask_dance.consumer.storage.session import SessionStorage
 from flask_dance.utils import getattrd
 
@@ -31,6 +34,13 @@ class BaseOAuthConsumerBlueprint(flask.Blueprint, metaclass=ABCMeta):
         authorized_url=None,
         storage=None,
         rule_kwargs=None,
+        transport_adapter=None,
+        retry_policy=None,
+        timeout=None,
+        request_deadline=None,
+        circuit_breaker=None,
+        instrumentation=None,
+        metrics=None,
     ):
         bp_kwargs = dict(
             name=name,
@@ -69,17 +79,23 @@ class BaseOAuthConsumerBlueprint(flask.Blueprint, metaclass=ABCMeta):
         else:
             self.storage = storage
 
+        self.transport_adapter = transport_adapter
+        self.retry_policy = retry_policy
+        self.timeout = timeout
+        self.request_deadline = request_deadline
+        self.circuit_breaker = circuit_breaker
+        self.instrumentation = instrumentation
+        self.metrics = metrics if metrics is not None else metrics_registry
         self.logged_in_funcs = []
         self.from_config = {}
+        self._loaded_config = None
 
         def invalidate_token(d):
-            try:
-                del self.session.token
-            except KeyError:
-                pass
+            self.forget_token()
 
         self.config = CallbackDict(on_update=invalidate_token)
         self.before_app_request(self.load_config)
+        self.teardown_app_request(self.forget_token)
 
     def load_config(self):
         """
@@ -92,9 +108,23 @@ class BaseOAuthConsumerBlueprint(flask.Blueprint, metaclass=ABCMeta):
 
             blueprint.from_config["session.client_id"] = "GITHUB_OAUTH_CLIENT_ID"
 
+        The values are only set on the blueprint when they differ from the
+        values that were loaded on the previous request, so in the common case
+        where the application config doesn't change, this does very little
+        work. Dotpaths are the exception: they may refer to an object that
+        only lives for a single request (like the ``session``), so they are
+        set on every request.
         """
-        for local_var, config_var in self.from_config.items():
-            value = flask.current_app.config.get(config_var)
+        config = flask.current_app.config
+        resolved = tuple(
+            (local_var, config.get(config_var))
+            for local_var, config_var in self.from_config.items()
+        )
+        if resolved == self._loaded_config:
+            resolved = tuple(item for item in resolved if "." in item[0])
+        else:
+            self._loaded_config = resolved
+        for local_var, value in resolved:
             if value:
                 if "." in local_var:
                     # this is a dotpath -- needs special handling
@@ -105,6 +135,22 @@ class BaseOAuthConsumerBlueprint(flask.Blueprint, metaclass=ABCMeta):
                     # just use a normal setattr call
                     setattr(self, local_var, value)
 
+    def mount_transport_adapter(self, session, default=None):
+        """
+        Mount the blueprint's ``transport_adapter`` (or else ``default``, if
+        any) on the given session, for both ``http://`` and ``https://`` URLs.
+        If it is a function, like
+        :func:`~flask_dance.consumer.requests.get_shared_adapter`, it is
+        called to get the adapter each time. The session is returned.
+        """
+        adapter = self.transport_adapter or default
+        if callable(adapter):
+            adapter = adapter()
+        if adapter is not None:
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        return session
+
     @property
     def storage(self):
         """
@@ -116,6 +162,7 @@ class BaseOAuthConsumerBlueprint(flask.Blueprint, metaclass=ABCMeta):
     @storage.setter
     def storage(self, value):
         self._storage = value
+        self.forget_token()
 
     @storage.deleter
     def storage(self):
@@ -128,39 +175,52 @@ class BaseOAuthConsumerBlueprint(flask.Blueprint, metaclass=ABCMeta):
         If you read from this property, you will receive the current
         value from the token storage. If you assign a value to this
         property, it will get set in the token storage.
+
+        Within a request, the token is only loaded from the token storage
+        the first time this property is read. Assigning to or deleting this
+        property, changing the :attr:`config`, or replacing the
+        :attr:`storage` causes it to be loaded again.
         """
-        _token = self.storage.get(self)
-        if _token and _token.get("expires_in") and _token.get("expires_at"):
-            # Update the `expires_in` value, so that requests-oauthlib
-            # can handle automatic token refreshing. Assume that
-            # `expires_at` is a valid Unix timestamp.
-            expires_at = datetime.fromtimestamp(_token["expires_at"], timezone.utc)
-            expires_in = expires_at - datetime.now(timezone.utc)
-            _token["expires_in"] = expires_in.total_seconds()
-        return _token
+        tokens = _request_tokens()
+        if tokens is not None and self in tokens:
+            _token = tokens[self]
+        else:
+            with self._instrument_storage("storage.get"):
+                _token = self.storage.get(self)
+            if tokens is not None:
+                tokens[self] = _token
+        return update_expires_in(_token)
 
     @token.setter
     def token(self, value):
-        _token = value
-        if _token and _token.get("expires_in"):
-            # Set the `expires_at` value, overwriting any value
-            # that may already be there.
-            delta = timedelta(seconds=int(_token["expires_in"]))
-            expires_at = datetime.now(timezone.utc) + delta
-            _token["expires_at"] = expires_at.replace(tzinfo=timezone.utc).timestamp()
-        self.storage.set(self, _token)
-        try:
-            del self.session.token
-        except KeyError:
-            pass
+        _token = set_expires_at(value)
+        with self._instrument_storage("storage.set"):
+            self.storage.set(self, _token)
+        self.forget_token()
 
     @token.deleter
     def token(self):
-        self.storage.delete(self)
-        try:
-            del self.session.token
-        except KeyError:
-            pass
+        with self._instrument_storage("storage.delete"):
+            self.storage.delete(self)
+        self.forget_token()
+
+    def _instrument_storage(self, name):
+        return instrument(self, name, storage=type(self.storage).__name__)
+
+    def forget_token(self, exception=None):
+        """
+        Forget the token that was loaded from the token storage for this
+        request, both on the blueprint and on its sessions, so that it
+        will be loaded from the token storage again the next time it is
+        needed. This is called automatically at the end of every request.
+        """
+        if flask.has_app_context():
+            flask.g.get("flask_dance_tokens", {}).pop(self, None)
+        if "session" in self.__dict__:
+            try:
+                del self.__dict__["session"].token
+            except KeyError:
+                pass
 
     @abstractproperty
     def session(self):
@@ -183,3 +243,46 @@ class BaseOAuthConsumerBlueprint(flask.Blueprint, metaclass=ABCMeta):
         provider's website and authorized your app to access their account.
         """
         raise NotImplementedError()
+
+
+def update_expires_in(token):
+    """
+    Update the ``expires_in`` value of the token to the number of seconds
+    until it expires, based on its ``expires_at`` value, so that
+    requests-oauthlib can handle automatic token refreshing. The token is
+    returned.
+    """
+    if token and token.get("expires_in") and token.get("expires_at"):
+        # Assume that `expires_at` is a valid Unix timestamp.
+        token["expires_in"] = token["expires_at"] - time.time()
+    return token
+
+
+def set_expires_at(token):
+    """
+    Set the ``expires_at`` value of the token to the Unix timestamp at which
+    it expires, based on its ``expires_in`` value, overwriting any value that
+    may already be there. Returns the token.
+    """
+    if token and token.get("expires_in"):
+        delta = timedelta(seconds=int(token["expires_in"]))
+        expires_at = datetime.now(timezone.utc) + delta
+        token["expires_at"] = expires_at.replace(tzinfo=timezone.utc).timestamp()
+    return token
+
+
+def _feature(blueprint, name, cls):
+    # only use the feature if it is really set on the blueprint, so that
+    # stand-ins for blueprints (like mocks) don't turn it on
+    feature = getattr(blueprint, name, None)
+    return feature if isinstance(feature, cls) else None
+
+
+def _request_tokens():
+    """
+    The tokens that have been loaded from token storages during the current
+    request, by blueprint. Returns ``None`` outside of a request.
+    """
+    if not flask.has_request_context():
+        return None
+    return flask.g.setdefault("flask_dance_tokens", {})
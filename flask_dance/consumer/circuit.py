@@ -0,0 +1,176 @@
+import logging
+import time
+
+from requests.exceptions import ConnectionError, RequestException, Timeout
+
+from ..utils import LRUCache
+from .timeouts import DeadlineExceeded
+
+log = logging.getLogger(__name__)
+
+TOKEN_URL_ATTRS = (
+    "token_url",
+    "auto_refresh_url",
+    "request_token_url",
+    "access_token_url",
+)
+
+
+class CircuitOpen(RequestException):
+    """
+    Raised instead of making a request to the OAuth provider, while the
+    circuit for that part of the provider is open, because too many requests
+    to it have failed in a row.
+    """
+
+    def __init__(self, message, circuit=None, retry_at=None, **kwargs):
+        super().__init__(message, **kwargs)
+        self.circuit = circuit
+        self.retry_at = retry_at
+
+
+def circuit_name(blueprint, url):
+    """
+    .. versionadded:: 7.2.0
+
+    Return the name of the circuit that a request to ``url`` belongs to:
+    ``"token"`` for the URLs that the blueprint uses to get and refresh
+    tokens, and ``"api"`` for everything else.
+    """
+    for attr in TOKEN_URL_ATTRS:
+        token_url = getattr(blueprint, attr, None)
+        if token_url and url == token_url:
+            return "token"
+    return "api"
+
+
+class CircuitBreaker:
+    """
+    .. versionadded:: 7.2.0
+
+    Stops making requests to an OAuth provider that is failing, so that
+    users get an error straight away instead of waiting for every request
+    to time out. Each blueprint has two circuits: one for the token
+    endpoints, which are used in the ``authorized`` view and to refresh
+    tokens, and one for the rest of the provider's API.
+
+    A circuit starts out closed, and requests go through as usual. Once
+    ``failure_threshold`` requests in a row have failed with a connection
+    error, a timeout or one of the ``failure_statuses``, the circuit opens,
+    and requests raise :exc:`CircuitOpen` without being made. The
+    ``authorized`` view sends the :data:`~flask_dance.consumer.oauth_error`
+    signal when this happens, with ``error="circuit_open"``. After
+    ``recovery_timeout`` seconds, the circuit is half-open: a single request
+    is let through to see whether the provider has recovered. If it
+    succeeds, the circuit closes again; if not, it stays open for another
+    ``recovery_timeout`` seconds.
+
+    The state of the circuits is kept in the ``backend``, which can be any
+    object with the same ``get``, ``set`` and ``delete`` methods as
+    Flask-Caching. By default, it is a :class:`~flask_dance.utils.LRUCache`,
+    local to the process. To share the state between several processes,
+    use a cache that they all use, like Redis.
+
+    Args:
+        failure_threshold: The number of failed requests in a row that
+            opens the circuit. Defaults to 5.
+        recovery_timeout: The number of seconds to wait before letting a
+            request through an open circuit. Defaults to 30.
+        failure_statuses: The response statuses that count as failures.
+        backend: Where to keep the state of the circuits.
+    """
+
+    DEFAULT_FAILURE_STATUSES = frozenset({500, 502, 503, 504})
+
+    def __init__(
+        self,
+        failure_threshold=5,
+        recovery_timeout=30,
+        failure_statuses=DEFAULT_FAILURE_STATUSES,
+        backend=None,
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failure_statuses = frozenset(failure_statuses)
+        self.backend = backend if backend is not None else LRUCache()
+
+    def _key(self, blueprint, circuit):
+        return f"flask_dance_circuit|{blueprint.name}|{circuit}"
+
+    def state(self, blueprint, circuit="api"):
+        """
+        The state of the given circuit of the blueprint: ``"closed"``,
+        ``"open"`` or ``"half-open"``.
+        """
+        state = self.backend.get(self._key(blueprint, circuit))
+        if not state or state.get("opened_at") is None:
+            return "closed"
+        if time.time() < state["opened_at"] + self.recovery_timeout:
+            return "open"
+        return "half-open"
+
+    def reset(self, blueprint, circuit="api"):
+        """
+        Close the given circuit of the blueprint.
+        """
+        self.backend.delete(self._key(blueprint, circuit))
+
+    def call(self, blueprint, circuit, send):
+        """
+        Call ``send`` to make a request through the given circuit of the
+        blueprint, and record whether it failed. Raises :exc:`CircuitOpen`
+        instead, if the circuit is open.
+        """
+        key = self._key(blueprint, circuit)
+        self._before(key, blueprint, circuit)
+        try:
+            response = send()
+        except DeadlineExceeded:
+            raise
+        except (ConnectionError, Timeout):
+            self._failure(key, blueprint, circuit)
+            raise
+        if response.status_code in self.failure_statuses:
+            self._failure(key, blueprint, circuit)
+        else:
+            self._success(key)
+        return response
+
+    def _before(self, key, blueprint, circuit):
+        state = self.backend.get(key)
+        if not state or state.get("opened_at") is None:
+            return
+        now = time.time()
+        retry_at = state["opened_at"] + self.recovery_timeout
+        probe_at = state.get("probe_at")
+        if probe_at is not None:
+            # only one request probes the provider at a time, unless it
+            # didn't report back in time
+            retry_at = max(retry_at, probe_at + self.recovery_timeout)
+        if now < retry_at:
+            raise CircuitOpen(
+                f"{blueprint.name} {circuit} circuit is open", circuit, retry_at
+            )
+        log.debug("%s %s circuit is half-open, probing", blueprint.name, circuit)
+        self.backend.set(key, dict(state, probe_at=now))
+
+    def _failure(self, key, blueprint, circuit):
+        state = self.backend.get(key) or {}
+        failures = state.get("failures", 0) + 1
+        opened_at = state.get("opened_at")
+        if opened_at is not None or failures >= self.failure_threshold:
+            if opened_at is None:
+                log.warning(
+                    "%s %s circuit opened after %d failures",
+                    blueprint.name,
+                    circuit,
+                    failures,
+                )
+            opened_at = time.time()
+        self.backend.set(
+            key, {"failures": failures, "opened_at": opened_at, "probe_at": None}
+        )
+
+    def _success(self, key):
+        if self.backend.get(key):
+            self.backend.delete(key)
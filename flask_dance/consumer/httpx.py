@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import time
+
+import httpx
+from oauthlib.oauth2 import TokenExpiredError, WebApplicationClient
+from urlobject import URLObject
+from werkzeug.utils import cached_property
+
+from .instrumentation import _url_attribute, instrument
+from .metrics import count
+from .timeouts import DeadlineExceeded, request_deadline
+
+log = logging.getLogger(__name__)
+
+
+class AsyncOAuth2Session(httpx.AsyncClient):
+    """
+    .. versionadded:: 7.2.0
+
+    An :class:`httpx.AsyncClient` subclass that does the same special things
+    as :class:`~flask_dance.consumer.requests.OAuth2Session`, for use in
+    ``async def`` views:
+
+    * lazy-loads OAuth2 tokens from the storage via the blueprint
+    * adds the OAuth2 token to every request
+    * refreshes expired tokens, if ``auto_refresh_url`` is set, and saves
+      them with ``token_updater``
+    * has a ``base_url`` property used for relative URL resolution
+
+    You don't normally create this yourself: use
+    :meth:`~flask_dance.consumer.OAuth2ConsumerBlueprint.make_async_session`
+    on the blueprint, or on a provider proxy, like
+    ``github.make_async_session()``. Requires `HTTPX`_.
+
+    Concurrent requests on the same session that find the same expired
+    token only refresh it once. Requests are measured by the blueprint's
+    ``instrumentation``, and count towards its ``request_deadline``. The
+    blueprint's ``refresh_lock``, ``retry_policy``, ``circuit_breaker``,
+    ``rate_limiter`` and ``response_cache`` are not used, since they wait
+    by blocking the event loop, or work with Requests responses and
+    exceptions.
+
+    .. _HTTPX: https://www.python-httpx.org/
+    """
+
+    def __init__(
+        self,
+        blueprint=None,
+        base_url=None,
+        client_id=None,
+        client=None,
+        auto_refresh_url=None,
+        auto_refresh_kwargs=None,
+        scope=None,
+        token_updater=None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.blueprint = blueprint
+        self.base_url = base_url
+        self._client = client or WebApplicationClient(client_id)
+        self.auto_refresh_url = auto_refresh_url
+        self.auto_refresh_kwargs = auto_refresh_kwargs or {}
+        self.scope = scope
+        self.token_updater = token_updater
+        self._token_refresh = None
+
+    @property
+    def base_url(self):
+        return self._base_url
+
+    @base_url.setter
+    def base_url(self, url):
+        self._base_url = URLObject(url or "")
+
+    @property
+    def client_id(self):
+        return self._client.client_id
+
+    @client_id.setter
+    def client_id(self, value):
+        self._client.client_id = value
+
+    @cached_property
+    def token(self):
+        """
+        Get and set the values in the OAuth token, structured as a dictionary.
+        """
+        return self.blueprint.token
+
+    def load_token(self):
+        self._client.token = self.token
+        if self.token:
+            self._client.populate_token_attributes(self.token)
+            return True
+        return False
+
+    @property
+    def access_token(self):
+        """
+        Returns the ``access_token`` from the OAuth token.
+        """
+        return self.token and self.token.get("access_token")
+
+    @property
+    def authorized(self):
+        """
+        Whether there is an OAuth token for the current user. Loading the token
+        doesn't make any requests, so this doesn't need to be awaited.
+        """
+        self.load_token()
+        return bool(self.access_token)
+
+    def build_request(self, method, url, **kwargs):
+        if self.base_url:
+            url = self.base_url.relative(str(url))
+        return super().build_request(method, url, **kwargs)
+
+    async def refresh_token(self, token_url, refresh_token=None, auth=None, **kwargs):
+        """
+        Get a new token from the OAuth provider, using the refresh token.
+        Works like :meth:`requests_oauthlib.OAuth2Session.refresh_token`.
+        """
+        refresh_token = refresh_token or self.token.get("refresh_token")
+        kwargs.update(self.auto_refresh_kwargs)
+        body = self._client.prepare_refresh_body(
+            refresh_token=refresh_token, scope=self.scope, **kwargs
+        )
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/x-www-form-urlencoded;charset=UTF-8",
+        }
+        if auth is None and self.client_id and self.blueprint.client_secret:
+            auth = (self.client_id, self.blueprint.client_secret)
+        log.debug("refreshing token at %s", token_url)
+        with instrument(self.blueprint, "token.refresh"):
+            resp = await super().request(
+                "POST", token_url, content=body, headers=headers, auth=auth
+            )
+            token = self._client.parse_request_body_response(
+                resp.text, scope=self.scope
+            )
+        count(self.blueprint, "token_refreshes")
+        if "refresh_token" not in token:
+            # keep the old refresh token, if the provider doesn't send a new one
+            token["refresh_token"] = refresh_token
+        self.token = token
+        return token
+
+    async def _refresh_and_update(self, auth=None):
+        token = await self.refresh_token(self.auto_refresh_url, auth=auth)
+        if self.token_updater:
+            self.token_updater(token)
+            # load the token from the token storage again, in case it changed
+            try:
+                del self.token
+            except KeyError:
+                pass
+
+    async def refresh_expired_token(self, auth=None):
+        """
+        Refresh the current token, which has expired. If another request on
+        this session is already refreshing it, wait for that refresh instead
+        of starting a new one.
+        """
+        if self._token_refresh is None:
+            self._token_refresh = asyncio.ensure_future(self._refresh_and_update(auth))
+        refresh = self._token_refresh
+        try:
+            # one request being cancelled shouldn't cancel the refresh
+            await asyncio.shield(refresh)
+        finally:
+            if self._token_refresh is refresh and refresh.done():
+                self._token_refresh = None
+        return self.load_token()
+
+    def _add_token(self, method, url, headers):
+        url, headers, _ = self._client.add_token(
+            str(url), http_method=method, headers=headers
+        )
+        return url, headers
+
+    async def request(self, method, url, *, withhold_token=False, **kwargs):
+        url = self.base_url.relative(str(url)) if self.base_url else str(url)
+        headers = dict(kwargs.pop("headers", None) or {})
+
+        self.load_token()
+        if self.token and not withhold_token:
+            try:
+                url, headers = self._add_token(method, url, headers)
+            except TokenExpiredError:
+                if not self.auto_refresh_url:
+                    raise
+                await self.refresh_expired_token(auth=kwargs.get("auth"))
+                url, headers = self._add_token(method, url, headers)
+
+        with instrument(
+            self.blueprint, "request", method=method, url=_url_attribute(url)
+        ) as attributes:
+            send = super().request(method, url, headers=headers, **kwargs)
+            resp = await self._within_deadline(send)
+            attributes["status_code"] = resp.status_code
+        return resp
+
+    async def _within_deadline(self, send):
+        deadline = request_deadline(self.blueprint)
+        if deadline is None:
+            return await send
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            return await asyncio.wait_for(send, remaining)
+        except asyncio.TimeoutError:
+            send.close()
+            raise DeadlineExceeded(
+                f"{self.blueprint.name} request deadline of "
+                f"{self.blueprint.request_deadline} seconds exceeded"
+            ) from None
@@ -0,0 +1,125 @@
+import time
+from contextlib import contextmanager, nullcontext
+
+
+def instrument(blueprint, name, **attributes):
+    """
+    .. versionadded:: 7.2.0
+
+    Return a context manager that measures the step of the OAuth dance
+    called ``name`` with the ``instrumentation`` of the blueprint, or does
+    nothing if the blueprint doesn't have any. The context manager yields
+    the ``attributes`` dict, so more attributes can be added to it once
+    they are known, like the status code of a response.
+    """
+    instrumentation = getattr(blueprint, "instrumentation", None)
+    if not isinstance(instrumentation, Instrumentation):
+        return nullcontext(attributes)
+    return instrumentation.span(name, blueprint, **attributes)
+
+
+def _url_attribute(url):
+    # leave out the query string, which may contain secrets
+    return str(url).split("?", 1)[0].split("#", 1)[0]
+
+
+class Instrumentation:
+    """
+    .. versionadded:: 7.2.0
+
+    Measures how long each step of the OAuth dance takes. Every time a step
+    is done, ``callback`` is called with the name of the step, the
+    blueprint, the duration in seconds, a dict of attributes, and the
+    exception that the step raised, or ``None``. Subclasses can override
+    :meth:`record` instead, or override :meth:`span` to wrap each step,
+    like :class:`OpenTelemetryInstrumentation` does.
+
+    The steps are:
+
+    ``storage.get``, ``storage.set``, ``storage.delete``
+        Loading, saving and deleting a token in the token storage. The
+        ``storage`` attribute is the class name of the token storage.
+    ``request_token.fetch``
+        Getting a request token in the ``login`` view of an OAuth 1
+        blueprint.
+    ``token.fetch``
+        Getting a token in the ``authorized`` view.
+    ``token.refresh``
+        Refreshing an OAuth 2 token.
+    ``request``
+        Each request to the OAuth provider made with the blueprint's
+        session, including the ones above. The ``method``, ``url`` (without
+        the query string) and ``status_code`` attributes describe it.
+    ``signal.oauth_authorized``, ``signal.oauth_error``
+        Running the receivers of the
+        :data:`~flask_dance.consumer.oauth_authorized` and
+        :data:`~flask_dance.consumer.oauth_error` signals.
+
+    Every step has a ``blueprint`` attribute with the name of the
+    blueprint, so that providers can be compared.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+
+    @contextmanager
+    def span(self, name, blueprint, **attributes):
+        """
+        A context manager that measures the step called ``name``, and
+        yields its attributes.
+        """
+        attributes["blueprint"] = blueprint.name
+        error = None
+        start = time.perf_counter()
+        try:
+            yield attributes
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.record(name, blueprint, duration, attributes, error)
+
+    def record(self, name, blueprint, duration, attributes, error=None):
+        """
+        Called every time a step of the OAuth dance is done.
+        """
+        if self.callback is not None:
+            self.callback(name, blueprint, duration, attributes, error)
+
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    """
+    .. versionadded:: 7.2.0
+
+    Records each step of the OAuth dance as an `OpenTelemetry`_ span,
+    named ``flask_dance.`` followed by the name of the step, with its
+    attributes prefixed by ``flask_dance.`` as well. Uses the given
+    ``tracer``, or else a tracer from the global tracer provider, which
+    requires the ``opentelemetry-api`` package.
+
+    .. _OpenTelemetry: https://opentelemetry.io/docs/languages/python/
+    """
+
+    def __init__(self, tracer=None, callback=None):
+        super().__init__(callback)
+        if tracer is None:
+            from opentelemetry import trace
+
+            tracer = trace.get_tracer("flask_dance")
+        self.tracer = tracer
+
+    @contextmanager
+    def span(self, name, blueprint, **attributes):
+        with self.tracer.start_as_current_span(f"flask_dance.{name}") as span:
+            with super().span(name, blueprint, **attributes) as attributes:
+                try:
+                    yield attributes
+                finally:
+                    span.set_attributes(
+                        {
+                            f"flask_dance.{key}": value
+                            for key, value in attributes.items()
+                            if value is not None
+                        }
+                    )
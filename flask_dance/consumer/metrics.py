@@ -0,0 +1,153 @@
+import threading
+
+#: The counters that Flask-Dance keeps, and what they count.
+COUNTERS = {
+    "logins_started": "Users sent to the OAuth provider by the login view.",
+    "authorizations_succeeded": "Tokens obtained by the authorized view.",
+    "authorizations_failed": "Errors from the OAuth provider in the authorized view.",
+    "state_missing": (
+        "Users sent back to the login view, because the OAuth state was missing."
+    ),
+    "pkce_verifier_missing": (
+        "Users sent back to the login view, because the PKCE code verifier "
+        "was missing."
+    ),
+    "token_refreshes": "OAuth 2 tokens refreshed.",
+    "storage_cache_hits": "Tokens found in the cache of the token storage.",
+    "storage_cache_misses": (
+        "Tokens not found in the cache of the token storage, if it has one."
+    ),
+}
+
+
+class MetricsRegistry:
+    """
+    .. versionadded:: 7.2.0
+
+    Counts events in the OAuth dance for each blueprint, like logins started
+    and tokens refreshed, in this process. See :data:`COUNTERS` for the
+    counters that Flask-Dance keeps.
+
+    Each thread counts in its own dict, so counting never waits for a lock.
+    The counts of all threads are added up when they are read.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+
+    def _counts(self):
+        try:
+            return self._local.counts
+        except AttributeError:
+            pass
+        counts = self._local.counts = {}
+        with self._lock:
+            self._retire_shards()
+            self._shards.append((threading.current_thread(), counts))
+        return counts
+
+    def _retire_shards(self):
+        # fold the counts of threads that have finished into one dict, so
+        # that servers that start a thread per request don't pile them up
+        live = []
+        for thread, counts in self._shards:
+            if thread.is_alive():
+                live.append((thread, counts))
+            else:
+                _add(self._retired, counts)
+        self._shards = live
+
+    def inc(self, name, blueprint_name, amount=1):
+        """
+        Add ``amount`` to the counter called ``name`` for the blueprint.
+        """
+        counts = self._counts()
+        key = (name, blueprint_name)
+        counts[key] = counts.get(key, 0) + amount
+
+    def counters(self):
+        """
+        Return a dict of all the counts, whose keys are
+        ``(name, blueprint_name)`` tuples.
+        """
+        with self._lock:
+            self._retire_shards()
+            totals = dict(self._retired)
+            for _, counts in self._shards:
+                _add(totals, dict(counts))
+        return totals
+
+    def get(self, name, blueprint_name):
+        """
+        Return the count of the counter called ``name`` for the blueprint.
+        """
+        return self.counters().get((name, blueprint_name), 0)
+
+    def clear(self):
+        """
+        Set all counters back to zero.
+        """
+        with self._lock:
+            for _, counts in self._shards:
+                counts.clear()
+            self._retired.clear()
+
+
+def _add(totals, counts):
+    for key, value in counts.items():
+        totals[key] = totals.get(key, 0) + value
+
+
+#: The :class:`MetricsRegistry` that blueprints use by default.
+registry = MetricsRegistry()
+
+
+def count(blueprint, name, amount=1):
+    """
+    .. versionadded:: 7.2.0
+
+    Add ``amount`` to the counter called ``name`` for the blueprint, in the
+    blueprint's ``metrics`` registry.
+    """
+    metrics = getattr(blueprint, "metrics", None)
+    if metrics is not None:
+        metrics.inc(name, blueprint.name, amount)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(metrics=None, prefix="flask_dance"):
+    """
+    .. versionadded:: 7.2.0
+
+    Return the counters of the given :class:`MetricsRegistry` (by default,
+    :data:`registry`) in the `Prometheus text format`_, with a
+    ``blueprint`` label, so that they can be served from a view for
+    Prometheus to scrape::
+
+        @app.route("/metrics")
+        def metrics():
+            return prometheus_text(), {"Content-Type": "text/plain; version=0.0.4"}
+
+    .. _Prometheus text format: https://prometheus.io/docs/instrumenting/exposition_formats/
+    """
+    if metrics is None:
+        metrics = registry
+    by_name = {}
+    for (name, blueprint_name), value in metrics.counters().items():
+        by_name.setdefault(name, []).append((blueprint_name, value))
+    lines = []
+    for name in sorted(by_name):
+        metric = f"{prefix}_{name}_total"
+        help_text = COUNTERS.get(name)
+        if help_text:
+            lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for blueprint_name, value in sorted(by_name[name], key=lambda v: str(v[0])):
+            lines.append(f'{metric}{{blueprint="{_escape(blueprint_name)}"}} {value}')
+    return "\n".join(lines) + "\n" if lines else ""
@@ -13,6 +13,9 @@ from .base import (
     oauth_before_login,
     oauth_error,
 )
+from .circuit import CircuitOpen
+from .instrumentation import instrument
+from .metrics import count
 from .requests import OAuth1Session
 
 log = logging.getLogger(__name__)
@@ -53,6 +56,13 @@ class OAuth1ConsumerBlueprint(BaseOAuthConsumerBlueprint):
         session_class=None,
         storage=None,
         rule_kwargs=None,
+        transport_adapter=None,
+        retry_policy=None,
+        timeout=None,
+        request_deadline=None,
+        circuit_breaker=None,
+        instrumentation=None,
+        metrics=None,
         **kwargs,
     ):
         """
@@ -63,6 +73,12 @@ class OAuth1ConsumerBlueprint(BaseOAuthConsumerBlueprint):
         :class:`~requests_oauthlib.OAuth1Session`).
         Only the arguments that are relevant to Flask-Dance are documented here.
 
+        The optional features, like ``retry_policy`` or ``instrumentation``,
+        are kept in attributes of the blueprint with the same names as the
+        arguments. To turn one on for a blueprint made by one of the pre-set
+        configurations, set the attribute instead, like
+        ``blueprint.retry_policy = RetryPolicy()``.
+
         Args:
             base_url: The base URL of the OAuth provider.
                 If specified, all URLs passed to this instance will be
@@ -110,6 +126,44 @@ class OAuth1ConsumerBlueprint(BaseOAuthConsumerBlueprint):
                 :class:`~flask_dance.consumer.storage.session.SessionStorage`.
             rule_kwargs (dict, optional): Additional arguments that should be passed when adding
                 the login and authorized routes. Defaults to ``None``.
+            transport_adapter: A :class:`requests.adapters.HTTPAdapter` to
+                mount on every session that this blueprint creates, or a
+                function that returns one. Sessions are created and thrown
+                away on every request, but the adapter (and its connection
+                pool) is not, so connections to the provider can be reused
+                across requests. Pass
+                :func:`~flask_dance.consumer.requests.get_shared_adapter`
+                itself to share a single adapter across the whole process.
+                Defaults to ``None``, which gives each session its own
+                connection pool.
+            retry_policy: A :class:`~flask_dance.consumer.retry.RetryPolicy`
+                for retrying requests to the provider that fail for temporary
+                reasons, like a ``503 Service Unavailable`` response.
+                Defaults to ``None``, which doesn't retry requests.
+            timeout: The default timeout for requests to the provider, as
+                a number of seconds or a ``(connect, read)`` tuple, like
+                the ``timeout`` argument of :meth:`requests.Session.request`.
+                This includes the requests made to get and refresh tokens.
+                Defaults to ``None``, which waits forever.
+            request_deadline: The longest time, in seconds, to spend waiting
+                for OAuth providers during a single Flask request, counted
+                from the first request to any provider. Requests that would
+                go on past it are cut short, and requests made after it fail
+                with :exc:`~flask_dance.consumer.timeouts.DeadlineExceeded`.
+                Defaults to ``None``, which means there is no deadline.
+            circuit_breaker: A :class:`~flask_dance.consumer.circuit.CircuitBreaker`
+                that stops making requests to the provider while it is
+                failing, so that they fail straight away instead of waiting
+                to time out. Defaults to ``None``.
+            instrumentation: An
+                :class:`~flask_dance.consumer.instrumentation.Instrumentation`
+                that measures how long each step of the OAuth dance takes.
+                Defaults to ``None``.
+            metrics: The
+                :class:`~flask_dance.consumer.metrics.MetricsRegistry` that
+                counts events in the OAuth dance, like logins and token
+                refreshes. Defaults to
+                :data:`flask_dance.consumer.metrics.registry`.
         """
         BaseOAuthConsumerBlueprint.__init__(
             self,
@@ -126,6 +180,13 @@ class OAuth1ConsumerBlueprint(BaseOAuthConsumerBlueprint):
             authorized_url=authorized_url,
             storage=storage,
             rule_kwargs=rule_kwargs,
+            transport_adapter=transport_adapter,
+            retry_policy=retry_policy,
+            timeout=timeout,
+            request_deadline=request_deadline,
+            circuit_breaker=circuit_breaker,
+            instrumentation=instrumentation,
+            metrics=metrics,
         )
 
         self.base_url = base_url
@@ -158,7 +219,7 @@ class OAuth1ConsumerBlueprint(BaseOAuthConsumerBlueprint):
         and your website.
         :return:
         """
-        return self.session_class(
+        ret = self.session_class(
             client_key=self.client_key,
             client_secret=self.client_secret,
             signature_method=self.signature_method,
@@ -170,6 +231,7 @@ class OAuth1ConsumerBlueprint(BaseOAuthConsumerBlueprint):
             base_url=self.base_url,
             **self.kwargs,
         )
+        return self.mount_transport_adapter(ret)
 
     def teardown_session(self, exception=None):
         try:
@@ -182,14 +244,16 @@ class OAuth1ConsumerBlueprint(BaseOAuthConsumerBlueprint):
         self.session._client.client.callback_uri = to_unicode(callback_uri)
 
         try:
-            self.session.fetch_request_token(
-                self.request_token_url, should_load_token=False
-            )
-        except TokenRequestDenied as err:
+            with instrument(self, "request_token.fetch"):
+                self.session.fetch_request_token(
+                    self.request_token_url, should_load_token=False
+                )
+        except (TokenRequestDenied, CircuitOpen) as err:
             message = err.args[0]
             response = getattr(err, "response", None)
             log.warning("OAuth 1 request token error: %s", message)
-            oauth_error.send(self, message=message, response=response)
+            with instrument(self, "signal.oauth_error"):
+                oauth_error.send(self, **_error_kwargs(err, message, response))
             # can't proceed with OAuth, have to just redirect to next_url
             if self.redirect_url:
                 next_url = self.redirect_url
@@ -200,6 +264,7 @@ class OAuth1ConsumerBlueprint(BaseOAuthConsumerBlueprint):
             return redirect(next_url)
 
         url = self.session.authorization_url(self.authorization_url)
+        count(self, "logins_started")
         oauth_before_login.send(self, url=url)
         return redirect(url)
 
@@ -222,22 +287,29 @@ class OAuth1ConsumerBlueprint(BaseOAuthConsumerBlueprint):
             message = err.args[0]
             response = getattr(err, "response", None)
             log.warning("OAuth 1 access token error: %s", message)
-            oauth_error.send(self, message=message, response=response)
+            count(self, "authorizations_failed")
+            with instrument(self, "signal.oauth_error"):
+                oauth_error.send(self, message=message, response=response)
             return redirect(next_url)
 
         try:
-            token = self.session.fetch_access_token(
-                self.access_token_url, should_load_token=False
-            )
-        except ValueError as err:
+            with instrument(self, "token.fetch"):
+                token = self.session.fetch_access_token(
+                    self.access_token_url, should_load_token=False
+                )
+        except (ValueError, CircuitOpen) as err:
             # can't proceed with OAuth, have to just redirect to next_url
             message = err.args[0]
             response = getattr(err, "response", None)
             log.warning("OAuth 1 access token error: %s", message)
-            oauth_error.send(self, message=message, response=response)
+            count(self, "authorizations_failed")
+            with instrument(self, "signal.oauth_error"):
+                oauth_error.send(self, **_error_kwargs(err, message, response))
             return redirect(next_url)
+        count(self, "authorizations_succeeded")
 
-        results = oauth_authorized.send(self, token=token) or []
+        with instrument(self, "signal.oauth_authorized"):
+            results = oauth_authorized.send(self, token=token) or []
         set_token = True
         for func, ret in results:
             if isinstance(ret, (Response, current_app.response_class)):
@@ -248,3 +320,11 @@ class OAuth1ConsumerBlueprint(BaseOAuthConsumerBlueprint):
         if set_token:
             self.token = token
         return redirect(next_url)
+
+
+def _error_kwargs(err, message, response):
+    kwargs = {"message": message, "response": response}
+    if isinstance(err, CircuitOpen):
+        # the same error as OAuth 2 blueprints send
+        kwargs["error"] = "circuit_open"
+    return kwargs
@@ -1,3 +1,4 @@
+import copy
 import json
 import logging
 
@@ -13,8 +14,13 @@ from .base import (
     oauth_authorized,
     oauth_before_login,
     oauth_error,
+    set_expires_at,
+    update_expires_in,
 )
-from .requests import OAuth2Session
+from .circuit import CircuitOpen
+from .instrumentation import instrument
+from .metrics import count
+from .requests import OAuth2Session, get_shared_adapter
 
 log = logging.getLogger(__name__)
 
@@ -34,6 +40,9 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
         client=None,
         auto_refresh_url=None,
         auto_refresh_kwargs=None,
+        refresh_lock=None,
+        response_cache=None,
+        rate_limiter=None,
         scope=None,
         state=None,
         static_folder=None,
@@ -55,6 +64,14 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
         session_class=None,
         storage=None,
         rule_kwargs=None,
+        transport_adapter=None,
+        retry_policy=None,
+        timeout=None,
+        request_deadline=None,
+        circuit_breaker=None,
+        instrumentation=None,
+        metrics=None,
+        async_session_kwargs=None,
         use_pkce=False,
         code_challenge_method="S256",
         **kwargs,
@@ -67,6 +84,12 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
         :class:`~requests_oauthlib.OAuth2Session`).
         Only the arguments that are relevant to Flask-Dance are documented here.
 
+        The optional features, like ``retry_policy`` or ``instrumentation``,
+        are kept in attributes of the blueprint with the same names as the
+        arguments. To turn one on for a blueprint made by one of the pre-set
+        configurations, set the attribute instead, like
+        ``blueprint.retry_policy = RetryPolicy()``.
+
         Args:
             base_url: The base URL of the OAuth provider.
                 If specified, all URLs passed to this instance will be
@@ -115,13 +138,79 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
             storage: A token storage class, or an instance of a token storage
                 class, to use for this blueprint. Defaults to
                 :class:`~flask_dance.consumer.storage.session.SessionStorage`.
+            refresh_lock: A
+                :class:`~flask_dance.consumer.refresh.BaseRefreshLock` to hold
+                while automatically refreshing an expired token, when
+                ``auto_refresh_url`` is set. This makes sure that concurrent
+                requests for the same user only refresh the token once, which
+                matters for providers that invalidate the old refresh token.
+                Defaults to ``None``, which lets every request refresh the
+                token on its own.
+            response_cache: A cache with the same API as `Flask-Caching`_,
+                like :class:`~flask_dance.utils.LRUCache`, in which to keep
+                responses to ``GET`` requests that have an ``ETag`` or
+                ``Last-Modified`` header. Later requests for the same URL
+                and user are sent as conditional requests, and if the
+                response hasn't changed, the cached response is used. See
+                :meth:`~flask_dance.consumer.requests.OAuth2Session.conditional_get`.
+                Defaults to ``None``, which doesn't cache responses.
+            rate_limiter: A
+                :class:`~flask_dance.consumer.ratelimit.RateLimiter` that keeps
+                track of the rate limit budget the provider reports for each
+                token, and delays requests when it is used up.
+                Defaults to ``None``, which sends requests regardless.
             rule_kwargs (dict, optional): Additional arguments that should be passed when adding
                 the login and authorized routes. Defaults to ``None``.
+            transport_adapter: A :class:`requests.adapters.HTTPAdapter` to
+                mount on every session that this blueprint creates, or a
+                function that returns one. Sessions are created and thrown
+                away on every request, but the adapter (and its connection
+                pool) is not, so connections to the provider can be reused
+                across requests. Pass
+                :func:`~flask_dance.consumer.requests.get_shared_adapter`
+                itself to share a single adapter across the whole process.
+                Defaults to ``None``, which gives each session its own
+                connection pool.
+            retry_policy: A :class:`~flask_dance.consumer.retry.RetryPolicy`
+                for retrying requests to the provider that fail for temporary
+                reasons, like a ``503 Service Unavailable`` response.
+                Defaults to ``None``, which doesn't retry requests.
+            timeout: The default timeout for requests to the provider, as
+                a number of seconds or a ``(connect, read)`` tuple, like
+                the ``timeout`` argument of :meth:`requests.Session.request`.
+                This includes the requests made to get and refresh tokens.
+                Defaults to ``None``, which waits forever.
+            request_deadline: The longest time, in seconds, to spend waiting
+                for OAuth providers during a single Flask request, counted
+                from the first request to any provider. Requests that would
+                go on past it are cut short, and requests made after it fail
+                with :exc:`~flask_dance.consumer.timeouts.DeadlineExceeded`.
+                Defaults to ``None``, which means there is no deadline.
+            circuit_breaker: A :class:`~flask_dance.consumer.circuit.CircuitBreaker`
+                that stops making requests to the provider while it is
+                failing, so that they fail straight away instead of waiting
+                to time out. Defaults to ``None``.
+            instrumentation: An
+                :class:`~flask_dance.consumer.instrumentation.Instrumentation`
+                that measures how long each step of the OAuth dance takes.
+                Defaults to ``None``.
+            metrics: The
+                :class:`~flask_dance.consumer.metrics.MetricsRegistry` that
+                counts events in the OAuth dance, like logins and token
+                refreshes. Defaults to
+                :data:`flask_dance.consumer.metrics.registry`.
+            async_session_kwargs (dict, optional): Additional arguments for
+                the :class:`~flask_dance.consumer.httpx.AsyncOAuth2Session`
+                used by ``async def`` views, which are forwarded to
+                :class:`httpx.AsyncClient`, like ``timeout`` or
+                ``transport``. Defaults to ``None``.
             use_pkce: If true then the authorization flow will follow the PKCE (Proof Key for Code Exchange).
                 For more details please refer to `RFC7636 <https://www.rfc-editor.org/rfc/rfc7636#section-4.1>`__
             code_challenge_method: Code challenge method to be used in authorization code flow with PKCE
                 instead of client secret. It will be used only if ``use_pkce`` is set to True.
                 Defaults to ``S256``.
+
+        .. _Flask-Caching: https://flask-caching.readthedocs.io/en/latest/
         """
         BaseOAuthConsumerBlueprint.__init__(
             self,
@@ -138,6 +227,13 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
             authorized_url=authorized_url,
             storage=storage,
             rule_kwargs=rule_kwargs,
+            transport_adapter=transport_adapter,
+            retry_policy=retry_policy,
+            timeout=timeout,
+            request_deadline=request_deadline,
+            circuit_breaker=circuit_breaker,
+            instrumentation=instrumentation,
+            metrics=metrics,
         )
 
         self.base_url = base_url
@@ -148,9 +244,13 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
         self.client = client
         self.auto_refresh_url = auto_refresh_url
         self.auto_refresh_kwargs = auto_refresh_kwargs
+        self.refresh_lock = refresh_lock
+        self.response_cache = response_cache
+        self.rate_limiter = rate_limiter
         self.scope = scope
         self.state = state
         self.kwargs = kwargs
+        self.async_session_kwargs = async_session_kwargs or {}
         self.client_secret = client_secret
 
         # used by view functions
@@ -167,13 +267,19 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
 
     @property
     def client_id(self):
-        return self.session.client_id
+        if "session" in self.__dict__:
+            return self.session.client_id
+        return self._client_id
 
     @client_id.setter
     def client_id(self, value):
-        self.session.client_id = value
-        # due to a bug in requests-oauthlib, we need to set this manually
-        self.session._client.client_id = value
+        self._client_id = value
+        # don't create a session just to set the client ID on it:
+        # the session will pick up the new value when it is created
+        if "session" in self.__dict__:
+            self.session.client_id = value
+            # due to a bug in requests-oauthlib, we need to set this manually
+            self.session._client.client_id = value
 
     @cached_property
     def session(self):
@@ -194,16 +300,120 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
             base_url=self.base_url,
             **self.kwargs,
         )
+        if self.client is not None and self._client_id is not None:
+            # requests-oauthlib ignores `client_id` when given a `client`
+            ret.client_id = self._client_id
 
         def token_updater(token):
             self.token = token
 
         ret.token_updater = token_updater
+        ret.response_cache = self.response_cache
+        self.mount_transport_adapter(ret)
         return self.session_created(ret)
 
     def session_created(self, session):
         return session
 
+    def offline_session(self, user_id=None, token=None):
+        """
+        .. versionadded:: 7.2.0
+
+        Return a new session for the user with the given ``user_id``, for use
+        outside of requests, like in a background job or a CLI command. It
+        has the same base URL, client credentials and automatic token
+        refreshing as :attr:`session`, but it doesn't need a request context,
+        and it isn't torn down at the end of a request.
+
+        The session uses the given ``token``, or else loads the user's token
+        from the token storage the first time it is needed, by passing the
+        ``user_id`` to the storage through the blueprint ``config``. Refreshed
+        tokens are saved to the token storage for that user as well. Token
+        storages that depend on the current request, like
+        :class:`~flask_dance.consumer.storage.session.SessionStorage`,
+        can't be used this way.
+
+        Sessions share the blueprint's ``transport_adapter``, or else
+        :func:`~flask_dance.consumer.requests.get_shared_adapter`, so they
+        are cheap to make, and reuse connections to the OAuth provider. To
+        go through the tokens of many users, combine this with
+        :meth:`~flask_dance.consumer.storage.BaseStorage.iter_tokens`::
+
+            for user_id, token in blueprint.storage.iter_tokens(blueprint):
+                session = blueprint.offline_session(user_id, token)
+                resp = session.get("/user")
+        """
+        if flask.has_app_context():
+            self.load_config()
+        blueprint = _UserBlueprint(self, user_id, token)
+        # the client keeps track of the token, so it can't be shared
+        client = copy.copy(self.client) if self.client is not None else None
+        session = self.session_class(
+            client_id=self._client_id,
+            client=client,
+            auto_refresh_url=self.auto_refresh_url,
+            auto_refresh_kwargs=self.auto_refresh_kwargs,
+            scope=self.scope,
+            blueprint=blueprint,
+            base_url=self.base_url,
+            **self.kwargs,
+        )
+        if client is not None and self._client_id is not None:
+            session.client_id = self._client_id
+
+        def token_updater(token):
+            blueprint.token = token
+
+        session.token_updater = token_updater
+        session.response_cache = self.response_cache
+        self.mount_transport_adapter(session, default=get_shared_adapter)
+        return self.session_created(session)
+
+    def make_async_session(self):
+        """
+        .. versionadded:: 7.2.0
+
+        Like :attr:`session`, but for use in ``async def`` views: return a
+        new :class:`~flask_dance.consumer.httpx.AsyncOAuth2Session` with the
+        same client ID, base URL, token, timeout and automatic token
+        refreshing, whose requests must be awaited. Requires `HTTPX`_.
+
+        Its connection pool belongs to the event loop of the view, so make
+        a new one in each view, and close it before the view returns, by
+        using it as an async context manager::
+
+            async with blueprint.make_async_session() as session:
+                resp = await session.get("/user")
+
+        .. _HTTPX: https://www.python-httpx.org/
+        """
+        import httpx
+
+        from .httpx import AsyncOAuth2Session
+
+        def token_updater(token):
+            self.token = token
+
+        kwargs = dict(self.async_session_kwargs)
+        if "timeout" not in kwargs and self.timeout is not None:
+            if isinstance(self.timeout, tuple):
+                connect, read = self.timeout
+                kwargs["timeout"] = httpx.Timeout(read, connect=connect)
+            else:
+                kwargs["timeout"] = self.timeout
+
+        return AsyncOAuth2Session(
+            blueprint=self,
+            base_url=self.base_url,
+            client_id=self._client_id,
+            client=self.client,
+            auto_refresh_url=self.auto_refresh_url,
+            auto_refresh_kwargs=self.auto_refresh_kwargs,
+            scope=self.scope,
+            token_updater=token_updater,
+            **kwargs,
+        )
+
     def teardown_session(self, exception=None):
         try:
             del self.session
@@ -236,6 +446,7 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
         flask.session[state_key] = state
         log.debug("state = %s", state)
         log.debug("redirect URL = %s", url)
+        count(self, "logins_started")
         oauth_before_login.send(self, url=url)
         return redirect(url)
 
@@ -264,9 +475,11 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
                 error_desc,
                 error_uri,
             )
-            results = oauth_error.send(
-                self, error=error, error_description=error_desc, error_uri=error_uri
-            )
+            count(self, "authorizations_failed")
+            with instrument(self, "signal.oauth_error"):
+                results = oauth_error.send(
+                    self, error=error, error_description=error_desc, error_uri=error_uri
+                )
             if results:
                 for _, ret in results:
                     if isinstance(ret, (Response, current_app.response_class)):
@@ -277,6 +490,7 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
         if state_key not in flask.session:
             # can't validate state, so redirect back to login view
             log.info("state not found, redirecting user to login")
+            count(self, "state_missing")
             return redirect(url_for(".login"))
 
         state = flask.session[state_key]
@@ -289,6 +503,7 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
             if code_verifier_key not in flask.session:
                 # can't find code_verifier, so redirect back to login view
                 log.info("code_verifier not found, redirecting user to login")
+                count(self, "pkce_verifier_missing")
                 return redirect(url_for(".login"))
 
             code_verifier = flask.session[code_verifier_key]
@@ -301,13 +516,15 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
         log.debug("client_id = %s", self.client_id)
         log.debug("client_secret = %s", self.client_secret)
         try:
-            token = self.session.fetch_token(
-                self.token_url,
-                authorization_response=request.url,
-                client_secret=self.client_secret,
-                **self.token_url_params,
-            )
+            with instrument(self, "token.fetch"):
+                token = self.session.fetch_token(
+                    self.token_url,
+                    authorization_response=request.url,
+                    client_secret=self.client_secret,
+                    **self.token_url_params,
+                )
         except MissingCodeError as e:
+            count(self, "authorizations_failed")
             e.args = (
                 e.args[0],
                 "The redirect request did not contain the expected parameters. Instead I got: {}".format(
@@ -315,8 +532,26 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
                 ),
             )
             raise
+        except CircuitOpen as err:
+            # the provider is down, so don't keep the user waiting for it
+            log.warning("OAuth 2 token error: %s", err.args[0])
+            count(self, "authorizations_failed")
+            with instrument(self, "signal.oauth_error"):
+                results = oauth_error.send(
+                    self, error="circuit_open", error_description=err.args[0]
+                )
+            if results:
+                for _, ret in results:
+                    if isinstance(ret, (Response, current_app.response_class)):
+                        return ret
+            return redirect(next_url)
+        except Exception:
+            count(self, "authorizations_failed")
+            raise
+        count(self, "authorizations_succeeded")
 
-        results = oauth_authorized.send(self, token=token) or []
+        with instrument(self, "signal.oauth_authorized"):
+            results = oauth_authorized.send(self, token=token) or []
         set_token = True
         for func, ret in results:
             if isinstance(ret, (Response, current_app.response_class)):
@@ -329,5 +564,54 @@ class OAuth2ConsumerBlueprint(BaseOAuthConsumerBlueprint):
                 self.token = token
             except ValueError as error:
                 log.warning("OAuth 2 authorization error: %s", str(error))
-                oauth_error.send(self, error=error)
+                with instrument(self, "signal.oauth_error"):
+                    oauth_error.send(self, error=error)
         return redirect(next_url)
+
+
+class _UserBlueprint:
+    """
+    Stands in for the blueprint of a session made by
+    :meth:`OAuth2ConsumerBlueprint.offline_session`. It has all the attributes
+    of the blueprint, except that its token belongs to the given user rather
+    than to the user of the current request, and is kept on this object
+    rather than on :data:`flask.g`.
+    """
+
+    def __init__(self, blueprint, user_id=None, token=None):
+        self._blueprint = blueprint
+        self.config = dict(blueprint.config)
+        if user_id is not None:
+            self.config["user_id"] = user_id
+        self._token = token
+        self._loaded = token is not None
+
+    def __getattr__(self, name):
+        return getattr(self._blueprint, name)
+
+    @property
+    def token(self):
+        if not self._loaded:
+            with self._instrument_storage("storage.get"):
+                self._token = self._blueprint.storage.get(self)
+            self._loaded = True
+        return update_expires_in(self._token)
+
+    @token.setter
+    def token(self, value):
+        value = set_expires_at(value)
+        with self._instrument_storage("storage.set"):
+            self._blueprint.storage.set(self, value)
+        self._token = value
+        self._loaded = True
+
+    @token.deleter
+    def token(self):
+        with self._instrument_storage("storage.delete"):
+            self._blueprint.storage.delete(self)
+        self._token = None
+        self._loaded = True
+
+    def forget_token(self, exception=None):
+        self._token = None
+        self._loaded = False
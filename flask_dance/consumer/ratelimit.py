@@ -0,0 +1,202 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlsplit
+
+from requests.exceptions import RequestException
+
+from .refresh import token_lock_key
+
+log = logging.getLogger(__name__)
+
+# the header prefixes used by GitHub, Reddit and Discord, and by Twitch
+_PREFIXES = ("X-RateLimit-", "RateLimit-")
+
+# reset times below this are a number of seconds, rather than a Unix timestamp
+_RELATIVE_RESET_LIMIT = 10**9
+
+
+RateLimit = namedtuple("RateLimit", ["limit", "remaining", "reset"])
+RateLimit.__doc__ = """
+The rate limit budget of a token, as last reported by the OAuth provider.
+``reset`` is the Unix timestamp at which the budget is replenished.
+Any of these may be ``None``, if the provider didn't send them.
+"""
+
+
+class RateLimitExceeded(RequestException):
+    """
+    Raised instead of making a request, when the rate limit budget for the
+    token is used up, and won't be replenished for longer than the
+    ``max_delay`` of the :class:`RateLimiter`, or before the
+    ``request_deadline`` of the blueprint.
+    """
+
+    def __init__(self, message, reset=None, **kwargs):
+        super().__init__(message, **kwargs)
+        self.reset = reset
+
+
+def _number(value):
+    if value is None:
+        return None
+    # some providers send a list of limits, like "100, 100;w=60"
+    value = value.split(",")[0].split(";")[0]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_rate_limit(headers, now=None):
+    """
+    Parse the rate limit headers of a response from an OAuth provider.
+    Returns a ``(rate_limit, bucket)`` tuple, where ``rate_limit`` is a
+    :class:`RateLimit` and ``bucket`` is the name of the rate limit bucket
+    (only Discord sends this), or ``None`` if there are no rate limit headers.
+    """
+    now = time.time() if now is None else now
+    for prefix in _PREFIXES:
+        remaining = _number(headers.get(prefix + "Remaining"))
+        if remaining is not None:
+            break
+    else:
+        return None
+
+    reset = _number(headers.get(prefix + "Reset-After"))
+    if reset is not None:
+        reset = now + reset
+    else:
+        reset = _number(headers.get(prefix + "Reset"))
+        if reset is not None and reset < _RELATIVE_RESET_LIMIT:
+            reset = now + reset
+    rate_limit = RateLimit(
+        limit=_number(headers.get(prefix + "Limit")),
+        remaining=remaining,
+        reset=reset,
+    )
+    return rate_limit, headers.get(prefix + "Bucket")
+
+
+class RateLimiter:
+    """
+    .. versionadded:: 7.2.0
+
+    Keeps track of the rate limit budget that the OAuth provider reports in
+    the headers of its responses, separately for every token, and delays
+    requests when that budget is used up until the provider replenishes it.
+    This understands the headers sent by GitHub and GitLab
+    (``X-RateLimit-*``), Reddit (``X-Ratelimit-*``), Twitch
+    (``Ratelimit-*``) and Discord (``X-RateLimit-*``, with a separate
+    budget for every ``X-RateLimit-Bucket``).
+
+    Use it as the ``rate_limiter`` of an OAuth 2 blueprint. Requests from
+    all threads are counted against the same budget, so share one rate
+    limiter between all of the requests for a blueprint.
+
+    Args:
+        max_delay: The longest time, in seconds, to delay a request. If the
+            budget won't be replenished before then, or before the
+            ``request_deadline`` of the blueprint, the request fails
+            with :exc:`RateLimitExceeded` instead. Defaults to 60.
+        maxsize: The number of tokens to keep track of. The budgets of the
+            least recently used tokens are forgotten after that.
+    """
+
+    def __init__(self, max_delay=60, maxsize=10000):
+        self.max_delay = max_delay
+        self.maxsize = maxsize
+        self._limits = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _key(self, blueprint, token):
+        if token:
+            return token_lock_key(blueprint, token)
+        return blueprint.name
+
+    def _remember(self, key, value):
+        # called with the lock held
+        self._limits[key] = value
+        self._limits.move_to_end(key)
+        while len(self._limits) > self.maxsize:
+            self._limits.popitem(last=False)
+
+    def acquire(self, blueprint, token, method, url, deadline=None):
+        """
+        Use up one request from the budget for the given token, waiting
+        until the budget is replenished if there is nothing left. No wait is
+        made that would go past ``deadline``, a :func:`time.monotonic` time.
+        """
+        key = self._key(blueprint, token)
+        route = (key, method.upper(), urlsplit(url).path)
+        while True:
+            with self._lock:
+                bucket = self._buckets.get(route)
+                rate_limit = self._limits.get((key, bucket))
+                now = time.time()
+                if (
+                    rate_limit is None
+                    or rate_limit.remaining is None
+                    or rate_limit.reset is None
+                    or rate_limit.reset <= now
+                ):
+                    return
+                if rate_limit.remaining >= 1:
+                    # count this request, in case others are made before
+                    # the provider tells us the new budget
+                    self._remember(
+                        (key, bucket),
+                        rate_limit._replace(remaining=rate_limit.remaining - 1),
+                    )
+                    return
+            delay = rate_limit.reset - now
+            if delay > self.max_delay:
+                raise RateLimitExceeded(
+                    f"{blueprint.name} rate limit exceeded, "
+                    f"resets in {delay:.0f} seconds",
+                    reset=rate_limit.reset,
+                )
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise RateLimitExceeded(
+                    f"{blueprint.name} rate limit exceeded, "
+                    "resets after the request deadline",
+                    reset=rate_limit.reset,
+                )
+            log.debug("%s rate limit exceeded, waiting %.1fs", blueprint.name, delay)
+            time.sleep(delay)
+
+    def update(self, blueprint, token, method, response):
+        """
+        Update the budget for the given token from the headers of a response.
+        """
+        parsed = parse_rate_limit(response.headers)
+        if parsed is None:
+            return
+        rate_limit, bucket = parsed
+        key = self._key(blueprint, token)
+        route = (key, method.upper(), urlsplit(response.url or "").path)
+        with self._lock:
+            if bucket is not None:
+                self._buckets[route] = bucket
+                if len(self._buckets) > self.maxsize:
+                    self._buckets.pop(next(iter(self._buckets)))
+            self._remember((key, bucket), rate_limit)
+
+    def limits(self, blueprint, token=None):
+        """
+        Return the budgets for the given token, as a dict mapping the
+        rate limit bucket (``None`` for providers that have only one) to a
+        :class:`RateLimit`. If ``token`` isn't given, the token for the
+        current user is used.
+        """
+        if token is None:
+            token = blueprint.token
+        key = self._key(blueprint, token)
+        with self._lock:
+            return {
+                bucket: rate_limit
+                for (limit_key, bucket), rate_limit in self._limits.items()
+                if limit_key == key
+            }
@@ -0,0 +1,202 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from .base import _feature
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+
+class BaseRefreshLock(metaclass=ABCMeta):
+    """
+    A refresh lock makes sure that when several requests find that the same
+    OAuth token has expired at the same time, only one of them asks the
+    OAuth provider for a new token. The others wait until that is done,
+    and then use the new token from the token storage.
+    """
+
+    @abstractmethod
+    def lock(self, blueprint, token):
+        """
+        Return a context manager that holds the lock for refreshing ``token``
+        while it is active. The context manager may provide the token that
+        is currently in the token storage, if it can get that more reliably
+        than the token storage itself (for example, by bypassing a cache).
+        Otherwise, it provides ``None``.
+        """
+        raise NotImplementedError()
+
+
+def token_lock_key(blueprint, token):
+    """
+    A string that identifies the given token for the given blueprint,
+    suitable for use as a lock name. Requests for the same user share
+    the same refresh token, so that is what the key is based on.
+    """
+    secret = token.get("refresh_token") or token.get("access_token") or ""
+    digest = hashlib.sha256(secret.encode("utf-8")).hexdigest()
+    return f"{blueprint.name}-{digest}"
+
+
+def _stripe(key, stripes):
+    return int(key.rsplit("-", 1)[1], 16) % stripes
+
+
+class ThreadRefreshLock(BaseRefreshLock):
+    """
+    Coordinates token refreshes between the threads of a single process.
+    Tokens are spread over a fixed number of locks, so the memory used does
+    not grow with the number of users.
+    """
+
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    @contextmanager
+    def lock(self, blueprint, token):
+        stripe = _stripe(token_lock_key(blueprint, token), len(self._locks))
+        with self._locks[stripe]:
+            yield None
+
+
+class FileRefreshLock(BaseRefreshLock):
+    """
+    Coordinates token refreshes between all of the processes on a single
+    machine (like the workers of a Gunicorn server), using
+    :func:`fcntl.flock` on files in the given directory. Tokens are spread
+    over a fixed number of lock files, so the number of files does not grow
+    with the number of users. Not available on Windows.
+
+    Note that every process must see the new token when it reads it from the
+    token storage, so if the token storage uses a cache, that cache must be
+    shared between processes.
+    """
+
+    def __init__(self, directory, stripes=256):
+        if fcntl is None:
+            raise RuntimeError("FileRefreshLock requires the fcntl module")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.stripes = stripes
+
+    def path(self, blueprint, token):
+        stripe = _stripe(token_lock_key(blueprint, token), self.stripes)
+        return os.path.join(self.directory, f"{blueprint.name}-{stripe}.lock")
+
+    @contextmanager
+    def lock(self, blueprint, token):
+        with open(self.path(blueprint, token), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield None
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def refresh_expiring_tokens(blueprint, window=300, max_workers=4):
+    """
+    .. versionadded:: 7.2.0
+
+    Refresh every token stored for the given OAuth 2 blueprint that expires
+    within the next ``window`` seconds, so that users don't have to wait for
+    the token to be refreshed in the middle of one of their requests.
+    The blueprint must have an ``auto_refresh_url``, and its token storage
+    must support
+    :meth:`~flask_dance.consumer.storage.BaseStorage.iter_expiring_tokens`.
+
+    Each token is refreshed with a session made by
+    :meth:`~flask_dance.consumer.OAuth2ConsumerBlueprint.offline_session`,
+    so the request goes through the blueprint's ``session_class``,
+    ``retry_policy``, ``circuit_breaker``, ``instrumentation`` and
+    ``metrics``, and the new token is saved with its ``token_updater``,
+    just like a refresh in the middle of a request. Requests to the OAuth
+    provider are made by a pool of ``max_workers`` threads, but the new
+    tokens are saved to the token storage from the calling thread, so the
+    token storage doesn't need to be thread-safe.
+
+    If the blueprint has a ``refresh_lock``, each token is refreshed while
+    holding it, and saved before it is released, so that a request that
+    finds the same token expired doesn't refresh it a second time. Since
+    the token storage is used while holding the lock, these tokens are
+    refreshed one at a time, in the calling thread.
+
+    This must be called within a Flask application context, but doesn't
+    need a request context.
+
+    Returns a ``(refreshed, failed)`` tuple with the number of tokens that
+    were refreshed, and the number that could not be refreshed.
+    """
+    if not blueprint.auto_refresh_url:
+        raise ValueError(f"{blueprint.name} blueprint has no auto_refresh_url")
+    blueprint.load_config()
+    expiring = blueprint.storage.iter_expiring_tokens(
+        blueprint, before=time.time() + window
+    )
+
+    refreshed = failed = 0
+    refresh_lock = _feature(blueprint, "refresh_lock", BaseRefreshLock)
+    if refresh_lock is not None:
+        for user_id, token in expiring:
+            if not token.get("refresh_token"):
+                continue
+            session = blueprint.offline_session(user_id, token)
+            try:
+                # the session saves the new token for the user
+                session.refresh_expired_token(refresh_lock, auth=session._basic_auth())
+            except Exception:
+                log.exception(
+                    "Failed to refresh %s token for user %s", blueprint.name, user_id
+                )
+                failed += 1
+                continue
+            refreshed += 1
+        return refreshed, failed
+
+    pending = {}
+
+    def finish(futures):
+        nonlocal refreshed, failed
+        for future in futures:
+            user_id, session = pending.pop(future)
+            try:
+                token = future.result()
+            except Exception:
+                log.exception(
+                    "Failed to refresh %s token for user %s", blueprint.name, user_id
+                )
+                failed += 1
+                continue
+            # saved like a refresh in the middle of a request
+            session.token_updater(token)
+            refreshed += 1
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for user_id, token in expiring:
+            if not token.get("refresh_token"):
+                continue
+            session = blueprint.offline_session(user_id, token)
+            future = executor.submit(_refresh_token, session)
+            pending[future] = (user_id, session)
+            # don't load more tokens than the pool can keep busy
+            if len(pending) >= max_workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                finish(done)
+        finish(list(pending))
+
+    return refreshed, failed
+
+
+def _refresh_token(session):
+    # the new token is returned rather than passed to the token updater,
+    # so that it is saved from the calling thread
+    return session.refresh_token(session.auto_refresh_url, auth=session._basic_auth())
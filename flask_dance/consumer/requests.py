@@ -1,12 +1,258 @@
-from functools import wraps
+import contextvars
+import copy
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
 
 from flask import redirect, url_for
 from oauthlib.common import to_unicode
+from requests import Request, Response
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from requests.structures import CaseInsensitiveDict
 from requests_oauthlib import OAuth1Session as BaseOAuth1Session
 from requests_oauthlib import OAuth2Session as BaseOAuth2Session
 from urlobject import URLObject
 from werkzeug.utils import cached_property
 
+from .base import _feature
+from .circuit import CircuitBreaker, circuit_name
+from .instrumentation import _url_attribute, instrument
+from .metrics import count
+from .ratelimit import RateLimiter
+from .refresh import BaseRefreshLock, token_lock_key
+from .retry import RetryPolicy
+from .timeouts import request_deadline, request_timeout
+
+log = logging.getLogger(__name__)
+
+_shared_adapter = None
+_shared_adapter_lock = threading.Lock()
+
+
+def get_shared_adapter():
+    """
+    .. versionadded:: 7.2.0
+
+    Return a :class:`requests.adapters.HTTPAdapter` that is shared by the
+    whole process. Its connection pools live for the life of the process,
+    so sessions that mount it can reuse TCP and TLS connections to the
+    OAuth provider across requests, even though the sessions themselves are
+    thrown away at the end of every request.
+
+    A forked child process gets a fresh adapter, so that connections are
+    never shared between processes. To use it, pass this function itself as
+    the ``transport_adapter`` argument of a consumer blueprint, rather than
+    the adapter it returns, so that the blueprint calls it for every session,
+    and picks up the fresh adapter in a forked child process::
+
+        blueprint = OAuth2ConsumerBlueprint(
+            ...,
+            transport_adapter=get_shared_adapter,
+        )
+    """
+    global _shared_adapter
+    if _shared_adapter is None:
+        with _shared_adapter_lock:
+            if _shared_adapter is None:
+                _shared_adapter = HTTPAdapter()
+    return _shared_adapter
+
+
+def _reset_shared_adapter():
+    global _shared_adapter, _shared_adapter_lock
+    _shared_adapter = None
+    _shared_adapter_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_shared_adapter)
+
+
+# the token updates made by the requests of one session in fan_out(), which
+# are saved by the calling thread, rather than the worker thread
+_fan_out_tokens = contextvars.ContextVar("flask_dance_fan_out_tokens", default=None)
+
+
+def fan_out(calls, max_workers=8, return_exceptions=False):
+    """
+    .. versionadded:: 7.2.0
+
+    Make several requests to OAuth providers at the same time, instead of
+    one after the other, and return their responses in the same order as
+    ``calls``. This is useful for views that call the APIs of several
+    providers, since the time taken is that of the slowest request rather
+    than the sum of all of them. For example::
+
+        github_resp, gitlab_resp = fan_out([
+            (github, "GET", "/user"),
+            (gitlab, "GET", "user", {"params": {"statistics": True}}),
+        ])
+
+    Each call is a ``(session, method, url)`` or
+    ``(session, method, url, kwargs)`` tuple, where ``session`` is a
+    Flask-Dance session, or a proxy to one (like ``github``). The requests
+    are made by a pool of at most ``max_workers`` threads, which see the
+    same Flask application and request context as the caller.
+
+    The token storage is only used from the calling thread: tokens are
+    loaded, and expired tokens are refreshed, before the requests are
+    sent, and the worker threads send them with those tokens. If a token
+    is refreshed anyway while the requests are made, the new token is saved
+    once they are all done. A ``401 Unauthorized`` response is returned
+    as it is, rather than refreshing the token and retrying the request.
+    Calls that use the same session are made one after the other, by the
+    same thread, since a session can't be used by several threads at once.
+
+    If a request raises an exception, that exception is raised once all of
+    the requests are done, unless ``return_exceptions`` is true, in which
+    case it is returned in place of the response.
+    """
+    results = [None] * len(calls)
+    groups = {}
+    for index, call in enumerate(calls):
+        session, method, url, *rest = call
+        kwargs = rest[0] if rest else {}
+        if hasattr(session, "_get_current_object"):
+            # this is a proxy, which only works in the calling thread
+            session = session._get_current_object()
+        group = groups.setdefault(id(session), (session, []))
+        group[1].append((index, method, url, kwargs))
+
+    jobs = []
+    for session, group_calls in groups.values():
+        try:
+            _prepare_fan_out(session)
+        except Exception as exc:
+            for index, *_ in group_calls:
+                results[index] = exc
+            continue
+        jobs.append((contextvars.copy_context(), session, group_calls))
+
+    if jobs:
+        updaters = [_collect_token_updates(session) for _, session, _ in jobs]
+        try:
+            with ThreadPoolExecutor(
+                max_workers=min(max_workers, len(jobs))
+            ) as executor:
+                futures = [
+                    executor.submit(ctx.run, _send_fan_out, session, group_calls)
+                    for ctx, session, group_calls in jobs
+                ]
+        finally:
+            for session, updater in updaters:
+                session.token_updater = updater
+        for (_, session, group_calls), (_, updater), future in zip(
+            jobs, updaters, futures
+        ):
+            responses, tokens = future.result()
+            for (index, *_), response in zip(group_calls, responses):
+                results[index] = response
+            if tokens and updater:
+                updater(tokens[-1])
+
+    for index, result in enumerate(results):
+        if isinstance(result, Exception) and not return_exceptions:
+            raise result
+    return results
+
+
+def _prepare_fan_out(session):
+    # load the token once, here, rather than in every thread
+    session.load_token()
+    if (
+        isinstance(session, OAuth2Session)
+        and _token_expired(session.token)
+        and session.token.get("refresh_token")
+    ):
+        session.refresh_unauthorized_token(auth=session._basic_auth())
+
+
+def _collect_token_updates(session):
+    """
+    Replace the ``token_updater`` of the session with one that collects the
+    new tokens of requests made by :func:`fan_out`, instead of saving them.
+    Returns the session and its original ``token_updater``.
+    """
+    original = getattr(session, "token_updater", None)
+    if original is not None:
+
+        def token_updater(token):
+            tokens = _fan_out_tokens.get()
+            if tokens is None:
+                original(token)
+            else:
+                tokens.append(token)
+
+        session.token_updater = token_updater
+    return session, original
+
+
+def _collect_token(token):
+    # the token updater of the sessions that paginate() uses in other threads
+    _fan_out_tokens.get().append(token)
+
+
+def _send_fan_out(session, calls):
+    tokens = []
+    _fan_out_tokens.set(tokens)
+    responses = []
+    for _, method, url, kwargs in calls:
+        try:
+            responses.append(session.request(method, url, **kwargs))
+        except Exception as exc:
+            responses.append(exc)
+    return responses, tokens
+
+
+def _token_expired(token):
+    expires_at = token and token.get("expires_at")
+    return bool(expires_at) and float(expires_at) < time.time()
+
+
+_CONDITIONAL_HEADERS = {"if-none-match", "if-modified-since"}
+
+
+def _cached_response(entry, not_modified):
+    """
+    Make a response from a cache entry, to return in place of the given
+    ``304 Not Modified`` response.
+    """
+    resp = Response()
+    resp.status_code = 200
+    resp.reason = "OK"
+    resp.headers = CaseInsensitiveDict(entry["headers"])
+    # the 304 response may update some headers, like rate limits,
+    # but it doesn't describe the body
+    for name, value in not_modified.headers.items():
+        if not name.lower().startswith("content-"):
+            resp.headers[name] = value
+    resp._content = entry["content"]
+    resp.encoding = entry["encoding"]
+    resp.url = not_modified.url
+    resp.request = not_modified.request
+    resp.history = not_modified.history
+    resp.elapsed = not_modified.elapsed
+    resp.connection = not_modified.connection
+    return resp
+
+
+def _lookup(data, path):
+    if callable(path):
+        return path(data)
+    if isinstance(data, dict) and path in data:
+        # keys may contain dots, like "@odata.nextLink"
+        return data[path]
+    if path:
+        for key in path.split("."):
+            if not isinstance(data, dict):
+                return None
+            data = data.get(key)
+    return data
+
 
 class OAuth1Session(BaseOAuth1Session):
     """
@@ -96,8 +342,39 @@ class OAuth1Session(BaseOAuth1Session):
     ):
         if should_load_token:
             self.load_token()
-        return super().request(
-            method=method, url=url, data=data, headers=headers, **kwargs
+        timeout = kwargs.pop("timeout", None)
+        base_request = partial(
+            super().request,
+            method=method,
+            url=url,
+            data=data,
+            headers=headers,
+            **kwargs,
+        )
+
+        circuit_breaker = _feature(self.blueprint, "circuit_breaker", CircuitBreaker)
+        full_url = self.base_url.relative(url) if self.base_url else url
+
+        def send():
+            send_request = partial(
+                base_request, timeout=request_timeout(self.blueprint, timeout)
+            )
+            with instrument(
+                self.blueprint, "request", method=method, url=_url_attribute(full_url)
+            ) as attributes:
+                if circuit_breaker is None:
+                    resp = send_request()
+                else:
+                    circuit = circuit_name(self.blueprint, url)
+                    resp = circuit_breaker.call(self.blueprint, circuit, send_request)
+                attributes["status_code"] = resp.status_code
+            return resp
+
+        retry_policy = _feature(self.blueprint, "retry_policy", RetryPolicy)
+        if retry_policy is None:
+            return send()
+        return retry_policy.send(
+            method, send, deadline=request_deadline(self.blueprint)
         )
 
 
@@ -109,12 +386,16 @@ class OAuth2Session(BaseOAuth2Session):
     * handles OAuth2 authentication
       (from :class:`requests_oauthlib.OAuth2Session` superclass)
     * has a ``base_url`` property used for relative URL resolution
+    * revalidates ``GET`` requests with the responses in its
+      ``response_cache``, which the blueprint sets to its own
 
     Note that this is a session between the consumer (your website) and the
     provider (e.g. Google), and *not* a session between a user of your website
     and your website.
     """
 
+    response_cache = None
+
     def __init__(self, blueprint=None, base_url=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.blueprint = blueprint
@@ -184,17 +465,353 @@ class OAuth2Session(BaseOAuth2Session):
 
         return wrapper
 
+    def make_async_session(self):
+        """
+        .. versionadded:: 7.2.0
+
+        Call
+        :meth:`~flask_dance.consumer.OAuth2ConsumerBlueprint.make_async_session`
+        on the blueprint, so that it can be reached through the provider
+        proxies in ``async def`` views. For example::
+
+            async with github.make_async_session() as gh:
+                async with gitlab.make_async_session() as gl:
+                    github_user, gitlab_user = await asyncio.gather(
+                        gh.get("/user"), gl.get("user")
+                    )
+        """
+        return self.blueprint.make_async_session()
+
+    def paginate(
+        self,
+        url,
+        items=None,
+        next_page=None,
+        cursor_param=None,
+        prefetch=False,
+        **kwargs,
+    ):
+        """
+        .. versionadded:: 7.2.0
+
+        Make a ``GET`` request to an API endpoint that splits its results into
+        pages, and lazily yield the results one at a time, requesting each
+        page only when the results of the previous page have been used up.
+        Only one page is held in memory at a time, no matter how many results
+        there are. For example::
+
+            for repo in github.paginate("/user/repos", params={"per_page": 100}):
+                print(repo["full_name"])
+
+        Args:
+            url: The URL of the first page, which is resolved relative to the
+                ``base_url`` like any other request.
+            items: Where to find the results in the JSON body of each page,
+                as a dotted path like ``"value"`` or ``"artists.items"``, or a
+                function that takes the JSON body and returns the results.
+                Defaults to ``None``, which means that the JSON body is the
+                list of results, like it is for GitHub and GitLab.
+            next_page: Where to find the next page in the JSON body of each
+                page, as a dotted path like ``"@odata.nextLink"`` (Microsoft
+                Graph) or ``"next"`` (Spotify), or a function that takes the
+                :class:`requests.Response` and returns it. Defaults to
+                ``None``, which follows the ``next`` link of the ``Link``
+                header, like GitHub and GitLab send. Pagination stops when
+                there is no next page, or a page has no results.
+            cursor_param: If the next page is given as a cursor instead of
+                a URL, this is the name of the query parameter to send it
+                in, along with the other ``params`` of the first request.
+            prefetch: If true, request the next page in a background thread
+                while the results of the current page are being used. The
+                background thread uses a copy of the session with the
+                current token, and doesn't use the token storage: if the
+                token is refreshed anyway, the new token is saved by the
+                calling thread, and a ``401 Unauthorized`` response isn't
+                retried with a refreshed token, like with :func:`fan_out`.
+
+        Any other keyword arguments are passed to every request. A response
+        with an error status raises :exc:`requests.HTTPError`.
+        """
+        params = dict(kwargs.pop("params", None) or {})
+
+        def page_request(cursor):
+            if cursor is None:
+                return url, dict(kwargs, params=params)
+            if cursor_param:
+                return url, dict(kwargs, params={**params, cursor_param: cursor})
+            # the next page URL already contains the query string
+            return cursor, kwargs
+
+        def fetch(cursor):
+            page_url, page_kwargs = page_request(cursor)
+            resp = self.get(page_url, **page_kwargs)
+            resp.raise_for_status()
+            return resp
+
+        def prefetch_page(cursor):
+            # the session can't be used by two threads at once
+            worker = self._prefetch_session()
+            page_url, page_kwargs = page_request(cursor)
+            ctx = contextvars.copy_context()
+            return executor.submit(
+                ctx.run, _send_fan_out, worker, [(0, "GET", page_url, page_kwargs)]
+            )
+
+        def prefetched(upcoming):
+            (resp,), tokens = upcoming.result()
+            if tokens and self.token_updater:
+                # save the refreshed token from the calling thread
+                self.token_updater(tokens[-1])
+            if isinstance(resp, Exception):
+                raise resp
+            resp.raise_for_status()
+            return resp
+
+        def find_next_page(resp, data):
+            if next_page is None:
+                return resp.links.get("next", {}).get("url")
+            if callable(next_page):
+                return next_page(resp)
+            return _lookup(data, next_page) or None
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            resp = fetch(None)
+            while True:
+                data = resp.json()
+                page = _lookup(data, items) or []
+                cursor = find_next_page(resp, data) if page else None
+                upcoming = None
+                if cursor is not None and executor:
+                    upcoming = prefetch_page(cursor)
+                yield from page
+                if cursor is None:
+                    return
+                resp = prefetched(upcoming) if upcoming else fetch(cursor)
+        finally:
+            if executor:
+                executor.shutdown(wait=False)
+
+    def _prefetch_session(self):
+        """
+        Make a copy of this session for :meth:`paginate` to use in another
+        thread. It has its own cookies, headers and OAuth client, with a
+        copy of the current token, and new tokens are collected by the
+        ``token_updater`` instead of being saved.
+        """
+        self.load_token()
+        worker = object.__new__(type(self))
+        worker.__dict__.update(self.__dict__)
+        worker.cookies = self.cookies.copy()
+        worker.headers = self.headers.copy()
+        worker.adapters = self.adapters.copy()
+        worker._client = copy.copy(self._client)
+        worker.token = dict(self.token) if self.token else self.token
+        if self.token_updater:
+            worker.token_updater = _collect_token
+        return worker
+
+    def refresh_expired_token(self, refresh_lock, auth=None):
+        """
+        Refresh the current token, which has expired, while holding the
+        given :class:`~flask_dance.consumer.refresh.BaseRefreshLock`.
+        If the token in the token storage was already replaced by someone
+        else while waiting for the lock, that token is used instead.
+        """
+        expired = self.token
+        with refresh_lock.lock(self.blueprint, expired) as current:
+            if current is None:
+                self.blueprint.forget_token()
+                current = self.blueprint.token
+            if (
+                current
+                and current.get("access_token") != expired.get("access_token")
+                and not _token_expired(current)
+            ):
+                log.debug("token was already refreshed, reusing it")
+                self.token = current
+            else:
+                log.debug("refreshing token at %s", self.auto_refresh_url)
+                token = self.refresh_token(self.auto_refresh_url, auth=auth)
+                self.token_updater(token)
+        return self.load_token()
+
+    def refresh_token(self, token_url, **kwargs):
+        with instrument(self.blueprint, "token.refresh"):
+            token = super().refresh_token(token_url, **kwargs)
+        count(self.blueprint, "token_refreshes")
+        return token
+
+    def _basic_auth(self, auth=None):
+        client_id = self.blueprint.client_id
+        client_secret = self.blueprint.client_secret
+        if auth is None and client_id and client_secret:
+            auth = HTTPBasicAuth(client_id, client_secret)
+        return auth
+
+    def refresh_unauthorized_token(self, auth=None):
+        """
+        .. versionadded:: 7.2.0
+
+        Refresh the current token after the OAuth provider rejected it with
+        ``401 Unauthorized``, even if it hasn't expired yet. Returns true if
+        the token was refreshed. This is used by the ``retry_policy`` of
+        the blueprint.
+        """
+        if not (
+            self.auto_refresh_url
+            and self.token_updater
+            and self.token
+            and self.token.get("refresh_token")
+        ):
+            return False
+        refresh_lock = _feature(self.blueprint, "refresh_lock", BaseRefreshLock)
+        if refresh_lock is not None:
+            return self.refresh_expired_token(refresh_lock, auth=auth)
+        log.debug("refreshing token at %s", self.auto_refresh_url)
+        token = self.refresh_token(self.auto_refresh_url, auth=auth)
+        self.token_updater(token)
+        return self.load_token()
+
     def request(self, method, url, data=None, headers=None, **kwargs):
         if self.base_url:
             url = self.base_url.relative(url)
 
         self.load_token()
-        return super().request(
-            method=method,
+        in_fan_out = _fan_out_tokens.get() is not None
+        refresh_lock = _feature(self.blueprint, "refresh_lock", BaseRefreshLock)
+        if (
+            refresh_lock is not None
+            and not in_fan_out
+            and self.auto_refresh_url
+            and self.token_updater
+            and not kwargs.get("withhold_token")
+            and _token_expired(self.token)
+        ):
+            auth = self._basic_auth(kwargs.get("auth"))
+            self.refresh_expired_token(refresh_lock, auth=auth)
+
+        retry_policy = _feature(self.blueprint, "retry_policy", RetryPolicy)
+        if retry_policy is None or kwargs.get("withhold_token"):
+            # requests for tokens are made by the retried request itself
+            return self._send(method, url, data, headers, **kwargs)
+
+        def send():
+            return self._send(method, url, data, headers, **kwargs)
+
+        def unauthorized(response):
+            auth = self._basic_auth(kwargs.get("auth"))
+            return self.refresh_unauthorized_token(auth=auth)
+
+        return retry_policy.send(
+            method,
+            send,
+            # fan_out() workers don't use the token storage
+            unauthorized=None if in_fan_out else unauthorized,
+            deadline=request_deadline(self.blueprint),
+        )
+
+    def _send(self, method, url, data=None, headers=None, **kwargs):
+        kwargs["timeout"] = request_timeout(self.blueprint, kwargs.get("timeout"))
+        rate_limiter = _feature(self.blueprint, "rate_limiter", RateLimiter)
+        if kwargs.get("withhold_token"):
+            # requests for tokens don't count against the API rate limit
+            rate_limiter = None
+        if rate_limiter is not None:
+            rate_limiter.acquire(
+                self.blueprint,
+                self.token,
+                method,
+                url,
+                deadline=request_deadline(self.blueprint),
+            )
+
+        response_cache = self.response_cache
+        if (
+            response_cache is not None
+            and method.upper() == "GET"
+            and self.token
+            and not kwargs.get("stream")
+            and not kwargs.get("withhold_token")
+            and not _CONDITIONAL_HEADERS & {name.lower() for name in headers or {}}
+        ):
+            send = partial(self.conditional_get, response_cache, url, headers, **kwargs)
+        else:
+            send = partial(
+                super().request,
+                method=method,
+                url=url,
+                data=data,
+                headers=headers,
+                client_id=self.blueprint.client_id,
+                client_secret=self.blueprint.client_secret,
+                **kwargs,
+            )
+
+        circuit_breaker = _feature(self.blueprint, "circuit_breaker", CircuitBreaker)
+        with instrument(
+            self.blueprint, "request", method=method, url=_url_attribute(url)
+        ) as attributes:
+            if circuit_breaker is None:
+                resp = send()
+            else:
+                circuit = circuit_name(self.blueprint, url)
+                resp = circuit_breaker.call(self.blueprint, circuit, send)
+            attributes["status_code"] = resp.status_code
+
+        if rate_limiter is not None:
+            rate_limiter.update(self.blueprint, self.token, method, resp)
+        return resp
+
+    def conditional_get(self, response_cache, url, headers=None, **kwargs):
+        """
+        .. versionadded:: 7.2.0
+
+        Make a ``GET`` request that is revalidated with the ``ETag`` or
+        ``Last-Modified`` header of the last response for the same URL and
+        user in ``response_cache``, if there is one. If the OAuth provider
+        responds with ``304 Not Modified``, the cached response is returned
+        instead. Most OAuth providers, including GitHub, don't count these
+        requests against the rate limit.
+
+        This is used automatically for all ``GET`` requests if the session
+        has a ``response_cache``, which sessions made by the blueprint do if
+        the blueprint has one.
+        """
+        full_url = Request("GET", url, params=kwargs.get("params")).prepare().url
+        # the lock key identifies the user, and doesn't change on refresh
+        key = "flask_dance_response|{lock_key}|{url}".format(
+            lock_key=token_lock_key(self.blueprint, self.token), url=full_url
+        )
+        cached = response_cache.get(key)
+        headers = dict(headers or {})
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        resp = super().request(
+            method="GET",
             url=url,
-            data=data,
             headers=headers,
             client_id=self.blueprint.client_id,
             client_secret=self.blueprint.client_secret,
             **kwargs,
         )
+        if resp.status_code == 304 and cached:
+            log.debug("%s not modified, using cached response", full_url)
+            return _cached_response(cached, resp)
+
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        if resp.status_code == 200 and (etag or last_modified):
+            entry = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "headers": dict(resp.headers),
+                "content": resp.content,
+                "encoding": resp.encoding,
+            }
+            response_cache.set(key, entry)
+        return resp
@@ -0,0 +1,154 @@
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+from requests.exceptions import ConnectionError, Timeout
+
+from .timeouts import DeadlineExceeded
+
+log = logging.getLogger(__name__)
+
+
+class RetryPolicy:
+    """
+    .. versionadded:: 7.2.0
+
+    Retries requests to the OAuth provider that fail for reasons that are
+    likely to be temporary: a connection error, a timeout, or a response
+    with one of the ``statuses`` (by default, ``429 Too Many Requests`` and
+    the ``5xx`` errors that proxies and overloaded servers send). Only
+    requests with one of the ``methods`` are retried, since it must be safe
+    to send them more than once.
+
+    Between attempts, it waits for the time the provider asked for in the
+    ``Retry-After`` header of the response, or else for a random time of
+    up to ``backoff_factor * 2 ** attempt`` seconds, so that many clients
+    don't all retry at the same moment.
+
+    With an OAuth 2 blueprint that has an ``auto_refresh_url``, a
+    ``401 Unauthorized`` response also causes the token to be refreshed,
+    and the request to be retried with the new token, at most once per
+    request.
+
+    Args:
+        total: The number of times to retry a request. Defaults to 3.
+        backoff_factor: Scales the time to wait between attempts.
+            Defaults to 0.5.
+        max_backoff: The longest time to wait between attempts, in seconds.
+            If the provider asks to wait longer than this with
+            ``Retry-After``, the response is returned without retrying.
+            Defaults to 30.
+        deadline: The longest time to spend on a request, including all
+            retries, in seconds. No retry is made that would wait past the
+            deadline. Defaults to ``None``, which means there is no deadline.
+        statuses: The response statuses to retry.
+        methods: The HTTP methods to retry.
+    """
+
+    DEFAULT_STATUSES = frozenset({429, 500, 502, 503, 504})
+    DEFAULT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
+
+    def __init__(
+        self,
+        total=3,
+        backoff_factor=0.5,
+        max_backoff=30,
+        deadline=None,
+        statuses=DEFAULT_STATUSES,
+        methods=DEFAULT_METHODS,
+    ):
+        self.total = total
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(method.upper() for method in methods)
+
+    def backoff(self, attempt):
+        """
+        A random number of seconds to wait before the given retry, where
+        the first retry is attempt 0.
+        """
+        cap = min(self.max_backoff, self.backoff_factor * 2**attempt)
+        return random.uniform(0, cap)
+
+    def retry_after(self, response):
+        """
+        The number of seconds that the ``Retry-After`` header of the response
+        asks to wait, or ``None`` if there is no such header.
+        """
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, retry_at.timestamp() - time.time())
+
+    def send(self, method, send, unauthorized=None, deadline=None):
+        """
+        Call ``send`` to make a request, and call it again for as long as the
+        request should be retried. Returns the last response, or raises the
+        last exception. ``unauthorized`` is called with a
+        ``401 Unauthorized`` response, and should return true if it has
+        fixed the problem, so that the request should be sent again.
+        No retry is made that would wait past ``deadline``, a
+        :func:`time.monotonic` time, in addition to the policy's own deadline.
+        """
+        retryable = method.upper() in self.methods
+        if self.deadline is not None:
+            own_deadline = time.monotonic() + self.deadline
+            deadline = own_deadline if deadline is None else min(deadline, own_deadline)
+        attempt = 0
+        refreshed = False
+        while True:
+            try:
+                response = send()
+            except DeadlineExceeded:
+                raise
+            except (ConnectionError, Timeout):
+                if not retryable or attempt >= self.total:
+                    raise
+                delay = self.backoff(attempt)
+                if not _before(deadline, delay):
+                    raise
+                log.debug("%s request failed, retrying in %.2fs", method, delay)
+            else:
+                if response.status_code == 401 and unauthorized and not refreshed:
+                    refreshed = True
+                    if unauthorized(response):
+                        log.debug("%s request unauthorized, retrying", method)
+                        continue
+                    return response
+                if (
+                    not retryable
+                    or response.status_code not in self.statuses
+                    or attempt >= self.total
+                ):
+                    return response
+                delay = self.retry_after(response)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                elif delay > self.max_backoff:
+                    return response
+                if not _before(deadline, delay):
+                    return response
+                log.debug(
+                    "%s request got %s, retrying in %.2fs",
+                    method,
+                    response.status_code,
+                    delay,
+                )
+                response.close()
+            attempt += 1
+            time.sleep(delay)
+
+
+def _before(deadline, delay):
+    return deadline is None or time.monotonic() + delay <= deadline
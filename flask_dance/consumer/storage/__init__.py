@@ -1,4 +1,5 @@
 from abc import ABCMeta, abstractmethod
+from collections.abc import Mapping
 
 
 class BaseStorage(metaclass=ABCMeta):
@@ -14,6 +15,85 @@ class BaseStorage(metaclass=ABCMeta):
     def delete(self, blueprint):
         return None
 
+    def iter_expiring_tokens(self, blueprint, before, batch_size=1000):
+        """
+        .. versionadded:: 7.2.0
+
+        Yield a ``(user_id, token)`` tuple for every token stored for the given
+        blueprint that expires before the given Unix timestamp, for all users.
+        ``user_id`` is ``None`` for tokens that aren't associated with a user.
+        Storages that can't look up tokens outside of the context of the
+        current user raise :exc:`NotImplementedError`.
+        """
+        raise NotImplementedError()
+
+    def iter_tokens(self, blueprint, user_ids=None, batch_size=1000):
+        """
+        .. versionadded:: 7.2.0
+
+        Yield a ``(user_id, token)`` tuple for every token stored for the given
+        blueprint, or only for the users with the given ``user_ids``, without
+        a request context. This lets background jobs load many tokens with a
+        few queries, ``batch_size`` tokens at a time. ``user_id`` is ``None``
+        for tokens that aren't associated with a user. Storages that can't
+        look up tokens outside of the context of the current user raise
+        :exc:`NotImplementedError`.
+        """
+        raise NotImplementedError()
+
+    def set_many(self, blueprint, tokens, batch_size=1000):
+        """
+        .. versionadded:: 7.2.0
+
+        Store many tokens for the given blueprint at once, without a request
+        context. ``tokens`` is a dict that maps user IDs to tokens, or an
+        iterable of ``(user_id, token)`` tuples, like the one that
+        :meth:`iter_tokens` returns. Storages that can't store tokens
+        outside of the context of the current user raise
+        :exc:`NotImplementedError`.
+        """
+        raise NotImplementedError()
+
+    def delete_expired_tokens(self, blueprint, before, batch_size=1000, sleep=0):
+        """
+        .. versionadded:: 7.2.0
+
+        Delete every token stored for the given blueprint that expired before
+        the given Unix timestamp and can't be refreshed, because it has no
+        ``refresh_token``, for all users. Tokens are deleted ``batch_size``
+        at a time, waiting ``sleep`` seconds between batches. Returns the
+        number of tokens that were deleted. Storages that can't look up
+        tokens outside of the context of the current user raise
+        :exc:`NotImplementedError`.
+        """
+        raise NotImplementedError()
+
+    def delete_orphaned_tokens(self, blueprint, batch_size=1000, sleep=0):
+        """
+        .. versionadded:: 7.2.0
+
+        Delete every token stored for the given blueprint whose user no longer
+        exists, like :meth:`delete_expired_tokens` does. Returns the number of
+        tokens that were deleted. Storages that can't look up tokens outside
+        of the context of the current user raise :exc:`NotImplementedError`.
+        """
+        raise NotImplementedError()
+
+
+def is_unrefreshable(token, before):
+    """
+    .. versionadded:: 7.2.0
+
+    Return ``True`` if the token expired before the given Unix timestamp and
+    has no ``refresh_token``, so that it can't be used any more.
+    """
+    if not token or token.get("refresh_token"):
+        return False
+    try:
+        return float(token["expires_at"]) < before
+    except (KeyError, TypeError, ValueError):
+        return False
+
 
 class NullStorage(BaseStorage):
     """
@@ -31,6 +111,21 @@ class NullStorage(BaseStorage):
     def delete(self, blueprint):
         return None
 
+    def iter_expiring_tokens(self, blueprint, before, batch_size=1000):
+        return iter(())
+
+    def iter_tokens(self, blueprint, user_ids=None, batch_size=1000):
+        return iter(())
+
+    def set_many(self, blueprint, tokens, batch_size=1000):
+        return None
+
+    def delete_expired_tokens(self, blueprint, before, batch_size=1000, sleep=0):
+        return 0
+
+    def delete_orphaned_tokens(self, blueprint, batch_size=1000, sleep=0):
+        return 0
+
 
 class MemoryStorage(BaseStorage):
     """
@@ -53,3 +148,29 @@ class MemoryStorage(BaseStorage):
 
     def delete(self, blueprint):
         self.token = None
+
+    def iter_expiring_tokens(self, blueprint, before, batch_size=1000):
+        expires_at = self.token and self.token.get("expires_at")
+        if expires_at and float(expires_at) < before:
+            yield None, self.token
+
+    def iter_tokens(self, blueprint, user_ids=None, batch_size=1000):
+        # there is only one token, which isn't associated with a user
+        if self.token and (user_ids is None or None in user_ids):
+            yield None, self.token
+
+    def set_many(self, blueprint, tokens, batch_size=1000):
+        if isinstance(tokens, Mapping):
+            tokens = tokens.items()
+        for user_id, token in tokens:
+            self.token = token
+
+    def delete_expired_tokens(self, blueprint, before, batch_size=1000, sleep=0):
+        if is_unrefreshable(self.token, before):
+            self.token = None
+            return 1
+        return 0
+
+    def delete_orphaned_tokens(self, blueprint, batch_size=1000, sleep=0):
+        # the token isn't associated with a user, so it can't be orphaned
+        return 0
@@ -1,11 +1,31 @@
-from datetime import datetime
-
-from sqlalchemy import JSON, Column, DateTime, Integer, String
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import islice
+
+from sqlalchemy import (
+    JSON,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+    and_,
+)
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.orm.exc import NoResultFound
+from werkzeug.utils import cached_property
 
-from flask_dance.consumer.storage import BaseStorage
+from flask_dance.consumer.base import set_expires_at
+from flask_dance.consumer.metrics import count
+from flask_dance.consumer.refresh import BaseRefreshLock
+from flask_dance.consumer.storage import BaseStorage, is_unrefreshable
 from flask_dance.utils import FakeCache, first
 
 try:
@@ -14,6 +34,11 @@ except ImportError:
     AnonymousUserMixin = None
 
 
+# Cached in place of a token when the database has no token for a user,
+# to tell "known to be absent" apart from "not in the cache".
+_ABSENT_TOKEN = "flask_dance_absent_token"
+
+
 class OAuthConsumerMixin:
     """
     A :ref:`SQLAlchemy declarative mixin <sqlalchemy:declarative_mixins>` with
@@ -30,12 +55,48 @@ class OAuthConsumerMixin:
     ``token``
         a :class:`JSON <sqlalchemy.types.JSON>` field to store
         the actual token received from the OAuth provider
+
+    It also declares the indexes that
+    :class:`~flask_dance.consumer.storage.sqla.SQLAlchemyStorage` needs to
+    look up a token without scanning the table:
+
+    ``ix_<table>_provider_user_id``
+        a unique index on ``provider`` and ``user_id``, if the model has a
+        ``user_id`` column
+    ``ix_<table>_provider``
+        otherwise, an index on ``provider``, which is unique if the model
+        doesn't have a ``user`` relationship either
+    ``ix_<table>_provider_expires_at``
+        an index on ``provider`` and ``expires_at``, if the model has an
+        ``expires_at`` column, like models that inherit from
+        :class:`~flask_dance.consumer.storage.sqla.ExpiringOAuthConsumerMixin`
+
+    If your model defines its own ``__table_args__``, these indexes are not
+    declared, so add them to it yourself.
     """
 
     @declared_attr
     def __tablename__(cls):
         return f"flask_dance_{cls.__name__.lower()}"
 
+    @declared_attr
+    def __table_args__(cls):
+        table = cls.__tablename__
+        if hasattr(cls, "user_id"):
+            indexes = [
+                Index(
+                    f"ix_{table}_provider_user_id", "provider", "user_id", unique=True
+                )
+            ]
+        else:
+            unique = not hasattr(cls, "user")
+            indexes = [Index(f"ix_{table}_provider", "provider", unique=unique)]
+        if hasattr(cls, "expires_at"):
+            indexes.append(
+                Index(f"ix_{table}_provider_expires_at", "provider", "expires_at")
+            )
+        return tuple(indexes)
+
     id = Column(Integer, primary_key=True)
     provider = Column(String(50), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -51,6 +112,26 @@ class OAuthConsumerMixin:
         return "<{}>".format(" ".join(parts))
 
 
+class ExpiringOAuthConsumerMixin(OAuthConsumerMixin):
+    """
+    .. versionadded:: 7.2.0
+
+    An :class:`~flask_dance.consumer.storage.sqla.OAuthConsumerMixin` with
+    one more column:
+
+    ``expires_at``
+        the datetime (in UTC) at which the token expires, copied from the
+        ``expires_at`` value of the token by
+        :class:`~flask_dance.consumer.storage.sqla.SQLAlchemyStorage`
+        every time the token is set (or worked out from its ``expires_in``
+        value, if it only has that), so that
+        :meth:`SQLAlchemyStorage.iter_expiring_tokens` can find the tokens
+        that are about to expire without loading every token
+    """
+
+    expires_at = Column(DateTime, nullable=True)
+
+
 class SQLAlchemyStorage(BaseStorage):
     """
     Stores and retrieves OAuth tokens using a relational database through
@@ -68,6 +149,7 @@ class SQLAlchemyStorage(BaseStorage):
         user_required=None,
         anon_user=None,
         cache=None,
+        absent_token_timeout=0,
     ):
         """
         Args:
@@ -111,6 +193,18 @@ class SQLAlchemyStorage(BaseStorage):
             cache:
                 An instance of `Flask-Caching`_. Providing a caching system is
                 highly recommended, but not required.
+            absent_token_timeout:
+                The number of seconds to cache the fact that there is no
+                token in the database for a user, so that checking whether a
+                user who hasn't connected their account is ``authorized``
+                doesn't query the database every time. ``None`` uses the
+                default timeout of the cache. Defaults to ``0``, which never
+                caches the absence of a token. Only turn this on if tokens
+                are always saved through this storage: a token row that your
+                own code adds to the database, like in an
+                :data:`~flask_dance.consumer.oauth_authorized` handler that
+                returns ``False``, isn't seen until the cached absence
+                expires.
 
         .. _Flask-SQLAlchemy: http://pythonhosted.org/Flask-SQLAlchemy/
         .. _Flask-Login: https://flask-login.readthedocs.io/
@@ -126,19 +220,36 @@ class SQLAlchemyStorage(BaseStorage):
             self.user_required = user_required
         self.anon_user = anon_user or AnonymousUserMixin
         self.cache = cache or FakeCache()
+        self.absent_token_timeout = absent_token_timeout
 
     def make_cache_key(self, blueprint, user=None, user_id=None):
-        uid = first([user_id, self.user_id, blueprint.config.get("user_id")])
+        identity = _Identity(self, blueprint, user=user, user_id=user_id)
+        return self._make_cache_key(blueprint, identity)
+
+    def _make_cache_key(self, blueprint, identity):
+        uid = identity.user_id
         if not uid:
-            u = first(
-                _get_real_user(ref, self.anon_user)
-                for ref in (user, self.user, blueprint.config.get("user"))
-            )
+            u = identity.user
             uid = getattr(u, "id", u)
+        return self._token_cache_key(blueprint, uid)
+
+    def _token_cache_key(self, blueprint, user_id):
         return "flask_dance_token|{name}|{user_id}".format(
-            name=blueprint.name, user_id=uid
+            name=blueprint.name, user_id=user_id
         )
 
+    def _filter_by_identity(self, query, identity):
+        # check for user ID
+        if hasattr(self.model, "user_id") and identity.user_id:
+            return query.filter_by(user_id=identity.user_id)
+        # check for user (relationship property)
+        if hasattr(self.model, "user") and identity.user:
+            return query.filter_by(user=identity.user)
+        # if we have the property, but not value, filter by None
+        if hasattr(self.model, "user_id"):
+            return query.filter_by(user_id=None)
+        return query
+
     def get(self, blueprint, user=None, user_id=None):
         """When you have a statement in your code that says
         "if <provider>.authorized:" (for example "if google.authorized:"),
@@ -155,32 +266,30 @@ class SQLAlchemyStorage(BaseStorage):
         :param user_id:
         :return:
         """
+        # the user is resolved at most once, and only if it's needed
+        identity = _Identity(self, blueprint, user=user, user_id=user_id)
+
         # check cache
-        cache_key = self.make_cache_key(blueprint=blueprint, user=user, user_id=user_id)
+        cache_key = self._make_cache_key(blueprint, identity)
         token = self.cache.get(cache_key)
+        if token == _ABSENT_TOKEN:
+            count(blueprint, "storage_cache_hits")
+            return None
         if token:
+            count(blueprint, "storage_cache_hits")
             return token
+        if not isinstance(self.cache, FakeCache):
+            # without a cache, every lookup would count as a miss
+            count(blueprint, "storage_cache_misses")
 
-        # if not cached, make database queries
-        query = self.session.query(self.model).filter_by(provider=blueprint.name)
-        uid = first([user_id, self.user_id, blueprint.config.get("user_id")])
-        u = first(
-            _get_real_user(ref, self.anon_user)
-            for ref in (user, self.user, blueprint.config.get("user"))
-        )
-
-        if self.user_required and not u and not uid:
+        if self.user_required and not identity:
             raise ValueError("Cannot get OAuth token without an associated user")
 
-        # check for user ID
-        if hasattr(self.model, "user_id") and uid:
-            query = query.filter_by(user_id=uid)
-        # check for user (relationship property)
-        elif hasattr(self.model, "user") and u:
-            query = query.filter_by(user=u)
-        # if we have the property, but not value, filter by None
-        elif hasattr(self.model, "user_id"):
-            query = query.filter_by(user_id=None)
+        # if not cached, make database queries. Only the token column is
+        # loaded, so that the row doesn't have to be tracked by the session.
+        query = self.session.query(self.model.token)
+        query = query.filter_by(provider=blueprint.name)
+        query = self._filter_by_identity(query, identity)
         # run query
         try:
             token = query.one().token
@@ -188,75 +297,473 @@ class SQLAlchemyStorage(BaseStorage):
             token = None
 
         # cache the result
-        self.cache.set(cache_key, token)
+        if token:
+            self.cache.set(cache_key, token)
+        elif self.absent_token_timeout != 0:
+            self.cache.set(cache_key, _ABSENT_TOKEN, timeout=self.absent_token_timeout)
 
         return token
 
     def set(self, blueprint, token, user=None, user_id=None):
-        uid = first([user_id, self.user_id, blueprint.config.get("user_id")])
-        u = first(
-            _get_real_user(ref, self.anon_user)
-            for ref in (user, self.user, blueprint.config.get("user"))
-        )
+        identity = _Identity(self, blueprint, user=user, user_id=user_id)
 
-        if self.user_required and not u and not uid:
+        if self.user_required and not identity:
             raise ValueError("Cannot set OAuth token without an associated user")
 
-        # if there was an existing model, delete it
-        existing_query = self.session.query(self.model).filter_by(
-            provider=blueprint.name
-        )
-        # check for user ID
-        has_user_id = hasattr(self.model, "user_id")
-        if has_user_id and uid:
-            existing_query = existing_query.filter_by(user_id=uid)
-        # check for user (relationship property)
-        has_user = hasattr(self.model, "user")
-        if has_user and u:
-            existing_query = existing_query.filter_by(user=u)
-        # queue up delete query -- won't be run until commit()
-        existing_query.delete()
-        # create a new model for this token
-        kwargs = {"provider": blueprint.name, "token": token}
-        if has_user_id and uid:
-            kwargs["user_id"] = uid
-        if has_user and u:
-            kwargs["user"] = u
-        self.session.add(self.model(**kwargs))
-        # commit to delete and add simultaneously
+        if hasattr(self.model, "expires_at"):
+            token = _with_expires_at(token)
+
+        values = {"token": token}
+        if hasattr(self.model, "created_at"):
+            values["created_at"] = datetime.utcnow()
+        if hasattr(self.model, "expires_at"):
+            values["expires_at"] = _expires_at(token)
+
+        upsert = self._upsert(blueprint, identity, values)
+        if upsert is not None:
+            self.session.execute(upsert)
+            self.session.commit()
+        else:
+            # if there is an existing token, update it in place
+            query = self.session.query(self.model).filter_by(provider=blueprint.name)
+            query = self._filter_by_identity(query, identity)
+            try:
+                self._update_or_add(blueprint, identity, query, values)
+            except IntegrityError:
+                # another request added a token for the same user first
+                self.session.rollback()
+                self._update_or_add(blueprint, identity, query, values)
+        # write the new token through to the cache
+        self.cache.set(self._make_cache_key(blueprint, identity), token)
+
+    def _update_or_add(self, blueprint, identity, query, values):
+        updated = query.update(values, synchronize_session=False)
+        # otherwise, create a new model for this token
+        if not updated:
+            kwargs = dict(values, provider=blueprint.name)
+            kwargs.pop("created_at", None)
+            if hasattr(self.model, "user_id") and identity.user_id:
+                kwargs["user_id"] = identity.user_id
+            if hasattr(self.model, "user") and identity.user:
+                kwargs["user"] = identity.user
+            self.session.add(self.model(**kwargs))
         self.session.commit()
-        # invalidate cache
-        self.cache.delete(
-            self.make_cache_key(blueprint=blueprint, user=user, user_id=user_id)
+
+    def _upsert(self, blueprint, identity, values):
+        """
+        Make an ``INSERT ... ON CONFLICT DO UPDATE`` statement (or MySQL's
+        ``ON DUPLICATE KEY UPDATE``) that sets the token in one query, without
+        racing other requests that set the first token for the same user.
+        Returns ``None`` if the database doesn't support that, or the table
+        doesn't have a unique index on ``provider`` and the user to detect
+        the conflict with.
+        """
+        mapper = sa_inspect(self.model)
+        row = {"provider": blueprint.name}
+        if hasattr(self.model, "user_id"):
+            user_id = self._user_key(identity)
+            if user_id is None:
+                # NULLs never conflict in a unique index
+                return None
+            row["user_id"] = user_id
+        elif hasattr(self.model, "user"):
+            return None
+        row.update(values)
+        keys = [mapper.columns[key] for key in ("provider", "user_id") if key in row]
+        if not _has_unique_index(mapper.local_table, keys):
+            return None
+        columns = {mapper.columns[key].name: value for key, value in row.items()}
+        updates = [mapper.columns[key].name for key in values]
+
+        dialect = self.session.get_bind(mapper=mapper).dialect.name
+        try:
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            elif dialect == "sqlite":
+                from sqlalchemy.dialects.sqlite import insert
+            elif dialect == "mysql":
+                from sqlalchemy.dialects.mysql import insert
+            else:
+                return None
+        except ImportError:
+            # this version of SQLAlchemy can't make upserts for the database
+            return None
+        stmt = insert(mapper.local_table).values(columns)
+        if dialect == "mysql":
+            return stmt.on_duplicate_key_update(
+                {name: stmt.inserted[name] for name in updates}
+            )
+        return stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={name: stmt.excluded[name] for name in updates},
         )
 
+    def _user_key(self, identity):
+        """
+        The value of the ``user_id`` column for the user, which may have to
+        be looked up on the user object.
+        """
+        if identity.user_id:
+            return identity.user_id
+        user = identity.user
+        if user is None or not hasattr(self.model, "user"):
+            return None
+        pairs = self.model.user.property.local_remote_pairs
+        if len(pairs) != 1:
+            return None
+        remote = sa_inspect(user).mapper.get_property_by_column(pairs[0][1])
+        return getattr(user, remote.key)
+
     def delete(self, blueprint, user=None, user_id=None):
-        query = self.session.query(self.model).filter_by(provider=blueprint.name)
-        uid = first([user_id, self.user_id, blueprint.config.get("user_id")])
-        u = first(
-            _get_real_user(ref, self.anon_user)
-            for ref in (user, self.user, blueprint.config.get("user"))
-        )
+        identity = _Identity(self, blueprint, user=user, user_id=user_id)
 
-        if self.user_required and not u and not uid:
+        if self.user_required and not identity:
             raise ValueError("Cannot delete OAuth token without an associated user")
 
-        # check for user ID
-        if hasattr(self.model, "user_id") and uid:
-            query = query.filter_by(user_id=uid)
-        # check for user (relationship property)
-        elif hasattr(self.model, "user") and u:
-            query = query.filter_by(user=u)
-        # if we have the property, but not value, filter by None
-        elif hasattr(self.model, "user_id"):
-            query = query.filter_by(user_id=None)
+        query = self.session.query(self.model).filter_by(provider=blueprint.name)
+        query = self._filter_by_identity(query, identity)
         # run query
         query.delete()
         self.session.commit()
         # invalidate cache
-        self.cache.delete(
-            self.make_cache_key(blueprint=blueprint, user=user, user_id=user_id)
+        self.cache.delete(self._make_cache_key(blueprint, identity))
+
+    def iter_expiring_tokens(self, blueprint, before, batch_size=1000):
+        """
+        Yield a ``(user_id, token)`` tuple for every token for the given
+        blueprint that expires before the given Unix timestamp.
+
+        If the model has an ``expires_at`` column, like models that inherit
+        from :class:`ExpiringOAuthConsumerMixin`, only the expiring tokens
+        are loaded, ``batch_size`` at a time, soonest to expire first, with
+        keyset pagination on the ``(provider, expires_at)`` index. Tokens
+        that are set while this runs, for example because they were
+        refreshed, are not skipped or yielded twice. Otherwise, all rows are
+        loaded with :meth:`iter_tokens`, and the ``expires_at`` value of each
+        token is checked in Python.
+        """
+        if hasattr(self.model, "expires_at"):
+            yield from self._query_expiring_tokens(blueprint, before, batch_size)
+            return
+        for user_id, token in self.iter_tokens(blueprint, batch_size=batch_size):
+            expires_at = token.get("expires_at")
+            if expires_at and float(expires_at) < before:
+                yield user_id, token
+
+    def _query_expiring_tokens(self, blueprint, before, batch_size):
+        pk = sa_inspect(self.model).primary_key[0]
+        expires_at = self.model.expires_at
+        # only load the columns that are needed, so that the rows don't
+        # have to be tracked by the session
+        columns = [pk, expires_at, self.model.token]
+        if hasattr(self.model, "user_id"):
+            columns.append(self.model.user_id)
+        query = (
+            self.session.query(*columns)
+            .filter(self.model.provider == blueprint.name)
+            .filter(expires_at < _utc_datetime(before))
+            .order_by(expires_at, pk)
+        )
+        last = None
+        while True:
+            batch_query = query
+            if last is not None:
+                last_expires_at, last_pk = last
+                batch_query = query.filter(
+                    or_(
+                        expires_at > last_expires_at,
+                        and_(expires_at == last_expires_at, pk > last_pk),
+                    )
+                )
+            rows = batch_query.limit(batch_size).all()
+            if not rows:
+                return
+            for row in rows:
+                user_id = row[3] if len(row) > 3 else None
+                yield user_id, dict(row[2])
+            last = (rows[-1][1], rows[-1][0])
+
+    def iter_tokens(self, blueprint, user_ids=None, batch_size=1000):
+        """
+        Yield a ``(user_id, token)`` tuple for every token for the given
+        blueprint. All rows are loaded ``batch_size`` at a time, in primary
+        key order, with keyset pagination, so that each query is as fast as
+        the first. If ``user_ids`` are given, the tokens of ``batch_size`` of
+        them are loaded with each query instead, which requires the model to
+        have a ``user_id`` column.
+        """
+        query = self.session.query(self.model).filter_by(provider=blueprint.name)
+        if user_ids is not None:
+            if not hasattr(self.model, "user_id"):
+                raise ValueError("Cannot look up OAuth tokens without a user_id column")
+            for batch in _batched(user_ids, batch_size):
+                for row in query.filter(self._user_id_in(batch)):
+                    yield row.user_id, dict(row.token)
+            return
+
+        pk = sa_inspect(self.model).primary_key[0]
+        query = query.order_by(pk)
+        last = None
+        while True:
+            batch_query = query if last is None else query.filter(pk > last)
+            rows = batch_query.limit(batch_size).all()
+            if not rows:
+                return
+            for row in rows:
+                yield getattr(row, "user_id", None), dict(row.token)
+            last = getattr(rows[-1], pk.key)
+
+    def set_many(self, blueprint, tokens, batch_size=1000):
+        """
+        Store many tokens for the given blueprint at once. For each batch of
+        ``batch_size`` tokens, the existing rows are loaded with one query,
+        updated in place or added, and committed together, instead of
+        querying and committing once per token. The new tokens are written
+        through to the cache. The model must have a ``user_id`` column.
+        """
+        if not hasattr(self.model, "user_id"):
+            raise ValueError("Cannot set OAuth tokens without a user_id column")
+        if isinstance(tokens, Mapping):
+            tokens = tokens.items()
+        query = self.session.query(self.model).filter_by(provider=blueprint.name)
+        for batch in _batched(tokens, batch_size):
+            # if a user has more than one token, the last one wins
+            batch = dict(batch)
+            if hasattr(self.model, "expires_at"):
+                batch = {
+                    user_id: _with_expires_at(token) for user_id, token in batch.items()
+                }
+            rows = query.filter(self._user_id_in(batch))
+            existing = {row.user_id: row for row in rows}
+            created_at = datetime.utcnow()
+            for user_id, token in batch.items():
+                row = existing.get(user_id)
+                if row is None:
+                    row = self.model(provider=blueprint.name, user_id=user_id)
+                    self.session.add(row)
+                row.token = token
+                if hasattr(self.model, "created_at"):
+                    row.created_at = created_at
+                if hasattr(self.model, "expires_at"):
+                    row.expires_at = _expires_at(token)
+            self.session.commit()
+            for user_id, token in batch.items():
+                self.cache.set(self._token_cache_key(blueprint, user_id), token)
+
+    def delete_expired_tokens(self, blueprint, before, batch_size=1000, sleep=0):
+        """
+        Delete every token for the given blueprint that expired before the
+        given Unix timestamp and has no ``refresh_token``. Rows are checked
+        ``batch_size`` at a time, in primary key order, and the tokens to
+        delete in each batch are deleted with one query and committed,
+        waiting ``sleep`` seconds between batches, so that other
+        transactions aren't kept waiting for the table. If the model has an
+        ``expires_at`` column, only the rows that have expired are checked.
+        Returns the number of tokens that were deleted.
+        """
+        condition = None
+        if hasattr(self.model, "expires_at"):
+            condition = self.model.expires_at < _utc_datetime(before)
+        return self._delete_in_batches(
+            blueprint,
+            condition,
+            lambda token: is_unrefreshable(token, before),
+            batch_size,
+            sleep,
+        )
+
+    def delete_orphaned_tokens(self, blueprint, batch_size=1000, sleep=0):
+        """
+        Delete every token for the given blueprint whose user no longer
+        exists, in batches, like :meth:`delete_expired_tokens` does. This
+        requires the model to have a ``user`` relationship. If this storage
+        requires a user, tokens that aren't associated with a user are
+        deleted as well, since deleting a user through the ORM may leave its
+        tokens behind with a ``NULL`` user. Returns the number of tokens that
+        were deleted.
+        """
+        if not hasattr(self.model, "user"):
+            # tokens that don't belong to users can't be orphaned
+            return 0
+        relationship = self.model.user.property
+        has_user_key = and_(
+            *(column.isnot(None) for column in relationship.local_columns)
+        )
+        condition = and_(has_user_key, ~self.model.user.has())
+        if self.user_required:
+            condition = or_(condition, ~has_user_key)
+        return self._delete_in_batches(blueprint, condition, None, batch_size, sleep)
+
+    def _delete_in_batches(self, blueprint, condition, check, batch_size, sleep):
+        pk = sa_inspect(self.model).primary_key[0]
+        columns = [pk, self.model.token]
+        if hasattr(self.model, "user_id"):
+            columns.append(self.model.user_id)
+        query = self.session.query(*columns).filter(
+            self.model.provider == blueprint.name
+        )
+        if condition is not None:
+            query = query.filter(condition)
+        query = query.order_by(pk)
+        deleted = 0
+        last = None
+        while True:
+            batch_query = query if last is None else query.filter(pk > last)
+            rows = batch_query.limit(batch_size).all()
+            if not rows:
+                return deleted
+            last = rows[-1][0]
+            doomed = [row for row in rows if check is None or check(row[1])]
+            if doomed:
+                self.session.query(self.model).filter(
+                    pk.in_([row[0] for row in doomed])
+                ).delete(synchronize_session=False)
+                self.session.commit()
+                for row in doomed:
+                    user_id = row[2] if len(row) > 2 else None
+                    self.cache.delete(self._token_cache_key(blueprint, user_id))
+                deleted += len(doomed)
+            if len(rows) < batch_size:
+                return deleted
+            if sleep:
+                time.sleep(sleep)
+
+    def _user_id_in(self, user_ids):
+        user_ids = list(user_ids)
+        column = self.model.user_id
+        condition = column.in_([uid for uid in user_ids if uid is not None])
+        if None in user_ids:
+            condition = or_(condition, column.is_(None))
+        return condition
+
+
+class SQLAlchemyRefreshLock(BaseRefreshLock):
+    """
+    Coordinates token refreshes between all processes that share a database,
+    by locking the database row for the token with ``SELECT ... FOR UPDATE``.
+    The blueprint must use
+    :class:`~flask_dance.consumer.storage.sqla.SQLAlchemyStorage`. The token
+    is read straight from the locked row, so this works even if each process
+    has its own cache.
+
+    The lock is held in the transaction of the storage's database session,
+    so that transaction is committed when the lock is released (just like
+    :meth:`SQLAlchemyStorage.set` does), or rolled back if refreshing the
+    token failed. Databases that don't support ``SELECT ... FOR UPDATE``,
+    like SQLite, don't lock anything.
+    """
+
+    @contextmanager
+    def lock(self, blueprint, token):
+        storage = blueprint.storage
+        identity = _Identity(storage, blueprint)
+        query = storage.session.query(storage.model).filter_by(provider=blueprint.name)
+        query = storage._filter_by_identity(query, identity)
+        row = query.with_for_update().populate_existing().one_or_none()
+        try:
+            yield dict(row.token) if row else None
+        except Exception:
+            storage.session.rollback()
+            raise
+        else:
+            storage.session.commit()
+
+
+def backfill_expires_at(model, session, batch_size=1000):
+    """
+    .. versionadded:: 7.2.0
+
+    Copy the ``expires_at`` value of every token into the ``expires_at``
+    column of the given model, ``batch_size`` rows at a time, committing
+    after each batch. :class:`SQLAlchemyStorage` keeps the column up to
+    date from then on, so this only needs to run once, after the column was
+    added to an existing table, like in an Alembic migration. Returns the
+    number of rows that were updated.
+    """
+    pk = sa_inspect(model).primary_key[0]
+    query = session.query(pk, model.token).order_by(pk)
+    updated = 0
+    last = None
+    while True:
+        batch_query = query if last is None else query.filter(pk > last)
+        rows = batch_query.limit(batch_size).all()
+        if not rows:
+            return updated
+        mappings = [{pk.key: row[0], "expires_at": _expires_at(row[1])} for row in rows]
+        session.bulk_update_mappings(model, mappings)
+        session.commit()
+        updated += len(mappings)
+        last = rows[-1][0]
+
+
+class _Identity:
+    """
+    The user that a single storage operation applies to. The user ID is
+    looked up eagerly, since that is cheap. The user object may require calling
+    a function or a user loader (like Flask-Login's ``current_user``), so it is
+    only looked up the first time it is needed, and then reused.
+    """
+
+    def __init__(self, storage, blueprint, user=None, user_id=None):
+        self.user_id = first(
+            [user_id, storage.user_id, blueprint.config.get("user_id")]
         )
+        self._user_refs = (user, storage.user, blueprint.config.get("user"))
+        self._anon_user = storage.anon_user
+
+    @cached_property
+    def user(self):
+        return first(_get_real_user(ref, self._anon_user) for ref in self._user_refs)
+
+    def __bool__(self):
+        return bool(self.user_id or self.user)
+
+
+def _with_expires_at(token):
+    """
+    If the token only has an ``expires_in`` value, return a copy of it with
+    an ``expires_at`` value as well, worked out the same way as when a token
+    is assigned to a blueprint. Otherwise, return the token.
+    """
+    if token and token.get("expires_in") and not token.get("expires_at"):
+        token = set_expires_at(dict(token))
+    return token
+
+
+def _has_unique_index(table, columns):
+    wanted = {column.name for column in columns}
+    for index in table.indexes:
+        if index.unique and {column.name for column in index.columns} == wanted:
+            return True
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint):
+            if {column.name for column in constraint.columns} == wanted:
+                return True
+    return False
+
+
+def _expires_at(token):
+    """
+    The ``expires_at`` value of the token, as a naive datetime in UTC, or
+    ``None`` if the token doesn't have a valid one.
+    """
+    try:
+        return _utc_datetime(float(token["expires_at"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _utc_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
 
 
 def _get_real_user(user, anon_user=None):
@@ -0,0 +1,78 @@
+import time
+from numbers import Real
+
+import flask
+from requests.exceptions import Timeout
+
+
+class DeadlineExceeded(Timeout):
+    """
+    Raised instead of making a request to the OAuth provider, when the
+    ``request_deadline`` of the blueprint has already passed for the current
+    Flask request.
+    """
+
+
+def request_deadline(blueprint):
+    """
+    .. versionadded:: 7.2.0
+
+    Return the :func:`time.monotonic` time by which all requests to OAuth
+    providers for the current Flask request must be done, according to the
+    ``request_deadline`` of the given blueprint, or ``None`` if there is no
+    deadline. The time is counted from the first request to any OAuth
+    provider during the current Flask request, so the deadline bounds the
+    total time spent waiting for OAuth providers, including token refreshes.
+    """
+    seconds = _setting(blueprint, "request_deadline", allow_tuple=False)
+    if seconds is None or not flask.has_request_context():
+        return None
+    started = flask.g.get("flask_dance_started")
+    if started is None:
+        started = flask.g.flask_dance_started = time.monotonic()
+    return started + seconds
+
+
+def request_timeout(blueprint, timeout=None):
+    """
+    .. versionadded:: 7.2.0
+
+    Return the timeout to use for a request to the OAuth provider, in the
+    format that Requests expects: either a number of seconds, or a
+    ``(connect, read)`` tuple. If ``timeout`` is ``None``, the ``timeout`` of
+    the blueprint is used instead. Either way, it is shortened if necessary,
+    so that the request can't go on past the :func:`request_deadline`.
+    Raises :exc:`DeadlineExceeded` if the deadline has already passed.
+    """
+    if timeout is None:
+        timeout = _setting(blueprint, "timeout", allow_tuple=True)
+    deadline = request_deadline(blueprint)
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded(
+            f"{blueprint.name} request deadline of "
+            f"{blueprint.request_deadline} seconds exceeded"
+        )
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):
+        return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+    return min(timeout, remaining)
+
+
+def _setting(blueprint, name, allow_tuple):
+    # only use a number of seconds (or a ``(connect, read)`` tuple of them),
+    # so that stand-ins for blueprints (like mocks) don't turn it on
+    value = getattr(blueprint, name, None)
+    if isinstance(value, Real) and not isinstance(value, bool):
+        return value
+    if (
+        allow_tuple
+        and isinstance(value, tuple)
+        and len(value) == 2
+        and all(t is None or isinstance(t, Real) for t in value)
+    ):
+        return value
+    return None
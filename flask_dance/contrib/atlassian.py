@@ -77,10 +77,10 @@ def make_atlassian_blueprint(
     atlassian_bp.from_config["client_secret"] = "ATLASSIAN_OAUTH_CLIENT_SECRET"
 
     @atlassian_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_atlassian = atlassian_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_atlassian = atlassian_bp
 
     return atlassian_bp
 
 
-atlassian = LocalProxy(lambda: g.flask_dance_atlassian)
+atlassian = LocalProxy(lambda: g.flask_dance_atlassian.session)
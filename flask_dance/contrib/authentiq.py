@@ -75,10 +75,10 @@ def make_authentiq_blueprint(
     authentiq_bp.from_config["client_secret"] = "AUTHENTIQ_OAUTH_CLIENT_SECRET"
 
     @authentiq_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_authentiq = authentiq_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_authentiq = authentiq_bp
 
     return authentiq_bp
 
 
-authentiq = LocalProxy(lambda: g.flask_dance_authentiq)
+authentiq = LocalProxy(lambda: g.flask_dance_authentiq.session)
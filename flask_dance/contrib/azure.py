@@ -113,10 +113,10 @@ def make_azure_blueprint(
     azure_bp.from_config["client_secret"] = "AZURE_OAUTH_CLIENT_SECRET"
 
     @azure_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_azure = azure_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_azure = azure_bp
 
     return azure_bp
 
 
-azure = LocalProxy(lambda: g.flask_dance_azure)
+azure = LocalProxy(lambda: g.flask_dance_azure.session)
@@ -74,10 +74,10 @@ def make_dexcom_blueprint(
     dexcom_bp.auto_refresh_url = dexcom_bp.token_url
 
     @dexcom_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_dexcom = dexcom_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_dexcom = dexcom_bp
 
     return dexcom_bp
 
 
-dexcom = LocalProxy(lambda: g.flask_dance_dexcom)
+dexcom = LocalProxy(lambda: g.flask_dance_dexcom.session)
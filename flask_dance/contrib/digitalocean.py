@@ -74,10 +74,10 @@ def make_digitalocean_blueprint(
     digitalocean_bp.from_config["client_secret"] = "DIGITALOCEAN_OAUTH_CLIENT_SECRET"
 
     @digitalocean_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_digitalocean = digitalocean_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_digitalocean = digitalocean_bp
 
     return digitalocean_bp
 
 
-digitalocean = LocalProxy(lambda: g.flask_dance_digitalocean)
+digitalocean = LocalProxy(lambda: g.flask_dance_digitalocean.session)
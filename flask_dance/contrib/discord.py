@@ -81,10 +81,10 @@ def make_discord_blueprint(
     discord_bp.from_config["client_secret"] = "DISCORD_OAUTH_CLIENT_SECRET"
 
     @discord_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_discord = discord_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_discord = discord_bp
 
     return discord_bp
 
 
-discord = LocalProxy(lambda: g.flask_dance_discord)
+discord = LocalProxy(lambda: g.flask_dance_discord.session)
@@ -101,10 +101,10 @@ def make_dropbox_blueprint(
     dropbox_bp.from_config["client_secret"] = "DROPBOX_OAUTH_CLIENT_SECRET"
 
     @dropbox_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_dropbox = dropbox_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_dropbox = dropbox_bp
 
     return dropbox_bp
 
 
-dropbox = LocalProxy(lambda: g.flask_dance_dropbox)
+dropbox = LocalProxy(lambda: g.flask_dance_dropbox.session)
@@ -79,10 +79,10 @@ def make_facebook_blueprint(
     facebook_bp.from_config["client_secret"] = "FACEBOOK_OAUTH_CLIENT_SECRET"
 
     @facebook_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_facebook = facebook_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_facebook = facebook_bp
 
     return facebook_bp
 
 
-facebook = LocalProxy(lambda: g.flask_dance_facebook)
+facebook = LocalProxy(lambda: g.flask_dance_facebook.session)
@@ -73,10 +73,10 @@ def make_fitbit_blueprint(
     fitbit_bp.auto_refresh_url = fitbit_bp.token_url
 
     @fitbit_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_fitbit = fitbit_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_fitbit = fitbit_bp
 
     return fitbit_bp
 
 
-fitbit = LocalProxy(lambda: g.flask_dance_fitbit)
+fitbit = LocalProxy(lambda: g.flask_dance_fitbit.session)
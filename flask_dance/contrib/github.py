@@ -72,10 +72,10 @@ def make_github_blueprint(
     github_bp.from_config["client_secret"] = "GITHUB_OAUTH_CLIENT_SECRET"
 
     @github_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_github = github_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_github = github_bp
 
     return github_bp
 
 
-github = LocalProxy(lambda: g.flask_dance_github)
+github = LocalProxy(lambda: g.flask_dance_github.session)
@@ -96,10 +96,10 @@ def make_gitlab_blueprint(
     gitlab_bp.from_config["client_secret"] = "GITLAB_OAUTH_CLIENT_SECRET"
 
     @gitlab_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_gitlab = gitlab_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_gitlab = gitlab_bp
 
     return gitlab_bp
 
 
-gitlab = LocalProxy(lambda: g.flask_dance_gitlab)
+gitlab = LocalProxy(lambda: g.flask_dance_gitlab.session)
@@ -112,10 +112,10 @@ def make_google_blueprint(
     google_bp.from_config["client_secret"] = "GOOGLE_OAUTH_CLIENT_SECRET"
 
     @google_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_google = google_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_google = google_bp
 
     return google_bp
 
 
-google = LocalProxy(lambda: g.flask_dance_google)
+google = LocalProxy(lambda: g.flask_dance_google.session)
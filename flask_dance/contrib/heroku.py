@@ -84,10 +84,10 @@ def make_heroku_blueprint(
     heroku_bp.from_config["client_secret"] = "HEROKU_OAUTH_CLIENT_SECRET"
 
     @heroku_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_heroku = heroku_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_heroku = heroku_bp
 
     return heroku_bp
 
 
-heroku = LocalProxy(lambda: g.flask_dance_heroku)
+heroku = LocalProxy(lambda: g.flask_dance_heroku.session)
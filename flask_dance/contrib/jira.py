@@ -93,10 +93,10 @@ def make_jira_blueprint(
     jira_bp.from_config["rsa_key"] = "JIRA_OAUTH_RSA_KEY"
 
     @jira_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_jira = jira_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_jira = jira_bp
 
     return jira_bp
 
 
-jira = LocalProxy(lambda: g.flask_dance_jira)
+jira = LocalProxy(lambda: g.flask_dance_jira.session)
@@ -73,10 +73,10 @@ def make_linkedin_blueprint(
     linkedin_bp.from_config["client_secret"] = "LINKEDIN_OAUTH_CLIENT_SECRET"
 
     @linkedin_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_linkedin = linkedin_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_linkedin = linkedin_bp
 
     return linkedin_bp
 
 
-linkedin = LocalProxy(lambda: g.flask_dance_linkedin)
+linkedin = LocalProxy(lambda: g.flask_dance_linkedin.session)
@@ -74,10 +74,10 @@ def make_meetup_blueprint(
     meetup_bp.from_config["client_secret"] = "MEETUP_OAUTH_CLIENT_SECRET"
 
     @meetup_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_meetup = meetup_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_meetup = meetup_bp
 
     return meetup_bp
 
 
-meetup = LocalProxy(lambda: g.flask_dance_meetup)
+meetup = LocalProxy(lambda: g.flask_dance_meetup.session)
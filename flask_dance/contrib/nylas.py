@@ -75,10 +75,10 @@ def make_nylas_blueprint(
     nylas_bp.from_config["client_secret"] = "NYLAS_OAUTH_CLIENT_SECRET"
 
     @nylas_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_nylas = nylas_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_nylas = nylas_bp
 
     return nylas_bp
 
 
-nylas = LocalProxy(lambda: g.flask_dance_nylas)
+nylas = LocalProxy(lambda: g.flask_dance_nylas.session)
@@ -88,10 +88,10 @@ def make_orcid_blueprint(
     orcid_bp.from_config["client_secret"] = "ORCID_OAUTH_CLIENT_SECRET"
 
     @orcid_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_orcid = orcid_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_orcid = orcid_bp
 
     return orcid_bp
 
 
-orcid = LocalProxy(lambda: g.flask_dance_orcid)
+orcid = LocalProxy(lambda: g.flask_dance_orcid.session)
@@ -72,10 +72,10 @@ def make_osm_blueprint(
     osm_bp.from_config["client_secret"] = "OSM_OAUTH_CLIENT_SECRET"
 
     @osm_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_osm = osm_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_osm = osm_bp
 
     return osm_bp
 
 
-osm = LocalProxy(lambda: g.flask_dance_osm)
+osm = LocalProxy(lambda: g.flask_dance_osm.session)
@@ -104,10 +104,10 @@ def make_reddit_blueprint(
     reddit_bp.user_agent = user_agent
 
     @reddit_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_reddit = reddit_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_reddit = reddit_bp
 
     return reddit_bp
 
 
-reddit = LocalProxy(lambda: g.flask_dance_reddit)
+reddit = LocalProxy(lambda: g.flask_dance_reddit.session)
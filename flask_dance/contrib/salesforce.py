@@ -87,10 +87,10 @@ def make_salesforce_blueprint(
     salesforce_bp.from_config["client_secret"] = "SALESFORCE_OAUTH_CLIENT_SECRET"
 
     @salesforce_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_salesforce = salesforce_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_salesforce = salesforce_bp
 
     return salesforce_bp
 
 
-salesforce = LocalProxy(lambda: g.flask_dance_salesforce)
+salesforce = LocalProxy(lambda: g.flask_dance_salesforce.session)
@@ -86,10 +86,10 @@ def make_slack_blueprint(
     slack_bp.from_config["client_secret"] = "SLACK_OAUTH_CLIENT_SECRET"
 
     @slack_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_slack = slack_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_slack = slack_bp
 
     return slack_bp
 
 
-slack = LocalProxy(lambda: g.flask_dance_slack)
+slack = LocalProxy(lambda: g.flask_dance_slack.session)
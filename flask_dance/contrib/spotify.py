@@ -72,10 +72,10 @@ def make_spotify_blueprint(
     spotify_bp.from_config["client_secret"] = "SPOTIFY_OAUTH_CLIENT_SECRET"
 
     @spotify_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_spotify = spotify_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_spotify = spotify_bp
 
     return spotify_bp
 
 
-spotify = LocalProxy(lambda: g.flask_dance_spotify)
+spotify = LocalProxy(lambda: g.flask_dance_spotify.session)
@@ -97,10 +97,10 @@ def make_strava_blueprint(
     strava_bp.user_agent = user_agent
 
     @strava_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_strava = strava_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_strava = strava_bp
 
     return strava_bp
 
 
-strava = LocalProxy(lambda: g.flask_dance_strava)
+strava = LocalProxy(lambda: g.flask_dance_strava.session)
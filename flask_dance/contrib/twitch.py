@@ -98,10 +98,10 @@ def make_twitch_blueprint(
     }
 
     @twitch_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_twitch = twitch_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_twitch = twitch_bp
 
     return twitch_bp
 
 
-twitch = LocalProxy(lambda: g.flask_dance_twitch)
+twitch = LocalProxy(lambda: g.flask_dance_twitch.session)
@@ -94,13 +94,13 @@ def make_zoho_blueprint(
     zoho_bp.from_config["client_secret"] = "ZOHO_OAUTH_CLIENT_SECRET"
 
     @zoho_bp.before_app_request
-    def set_applocal_session():
-        g.flask_dance_zoho = zoho_bp.session
+    def set_applocal_blueprint():
+        g.flask_dance_zoho = zoho_bp
 
     return zoho_bp
 
 
-zoho = LocalProxy(lambda: g.flask_dance_zoho)
+zoho = LocalProxy(lambda: g.flask_dance_zoho.session)
 
 
 class ZohoWebClient(WebApplicationClient):
@@ -1,4 +1,6 @@
 import functools
+import threading
+from collections import OrderedDict
 
 
 class FakeCache:
@@ -10,13 +12,53 @@ class FakeCache:
     def get(self, key):
         return None
 
-    def set(self, key, value):
+    def set(self, key, value, timeout=None):
         return None
 
     def delete(self, key):
         return None
 
 
+class LRUCache:
+    """
+    .. versionadded:: 7.2.0
+
+    An in-memory cache with the same ``get``, ``set`` and ``delete`` methods
+    as Flask-Caching, which holds at most ``maxsize`` values. When it is full,
+    the least recently used value is thrown away to make room. Values never
+    expire, so the ``timeout`` argument of ``set`` is ignored. It is local to
+    a single process, and safe to use from several threads.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
 def first(iterable, default=None, key=None):
     """
     Return the first truthy value of an iterable.
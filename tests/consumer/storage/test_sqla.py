@@ -3,6 +3,8 @@ import pytest
 sa = pytest.importorskip("sqlalchemy")
 
 import os
+import time
+from datetime import datetime, timezone
 
 import flask
 import responses
@@ -16,10 +18,18 @@ from flask_login import (
     logout_user,
 )
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import event
+from sqlalchemy import event, text
 
+from flask_dance.cli import dance
 from flask_dance.consumer import OAuth2ConsumerBlueprint, oauth_authorized, oauth_error
-from flask_dance.consumer.storage.sqla import OAuthConsumerMixin, SQLAlchemyStorage
+from flask_dance.consumer.metrics import MetricsRegistry
+from flask_dance.consumer.storage.sqla import (
+    ExpiringOAuthConsumerMixin,
+    OAuthConsumerMixin,
+    SQLAlchemyRefreshLock,
+    SQLAlchemyStorage,
+    backfill_expires_at,
+)
 
 try:
     import blinker
@@ -129,7 +139,7 @@ def test_sqla_storage_without_user(app, db, blueprint, request):
                 "/oauth_done",
             )
 
-    assert len(queries) == 2
+    assert len(queries) == 1
 
     # check the database
     authorizations = OAuth.query.all()
@@ -212,7 +222,7 @@ def test_sqla_storage(app, db, blueprint, request):
                 "/oauth_done",
             )
 
-    assert len(queries) == 3
+    assert len(queries) == 2
 
     # check the database
     alice = User.query.first()
@@ -352,7 +362,7 @@ def test_sqla_flask_login(app, db, blueprint, request):
                 "/oauth_done",
             )
 
-    assert len(queries) == 5
+    assert len(queries) == 4
 
     # lets do it again, with Bob as the logged in user -- he gets a different token
     if "_login_user" in flask.g:
@@ -380,7 +390,7 @@ def test_sqla_flask_login(app, db, blueprint, request):
                 "/oauth_done",
             )
 
-    assert len(queries) == 5
+    assert len(queries) == 4
 
     # check the database
     authorizations = OAuth.query.all()
@@ -520,7 +530,7 @@ def test_sqla_flask_login_anon_to_authed(app, db, blueprint, request):
                 "/oauth_done",
             )
 
-    assert len(queries) == 5
+    assert len(queries) == 4
 
     # check the database
     users = User.query.all()
@@ -731,7 +741,8 @@ def test_sqla_overwrite_token(app, db, blueprint, request):
                 "/oauth_done",
             )
 
-    assert len(queries) == 2
+    # the existing token is updated in place
+    assert len(queries) == 1
 
     # check that the database record was overwritten
     authorizations = OAuth.query.all()
@@ -753,6 +764,7 @@ def test_sqla_cache(app, db, blueprint, request):
         pass
 
     blueprint.storage = SQLAlchemyStorage(OAuth, db.session, cache=cache)
+    blueprint.metrics = MetricsRegistry()
 
     db.create_all()
 
@@ -779,7 +791,7 @@ def test_sqla_cache(app, db, blueprint, request):
                 "/oauth_done",
             )
 
-    assert len(queries) == 2
+    assert len(queries) == 1
 
     expected_token = {"access_token": "foobar", "token_type": "bearer", "scope": [""]}
 
@@ -791,18 +803,793 @@ def test_sqla_cache(app, db, blueprint, request):
     assert isinstance(oauth.token, dict)
     assert oauth.token == expected_token
 
-    # cache should be invalidated
-    assert cache.get("flask_dance_token|test-service|None") is None
+    # the new token should be written through to the cache
+    assert cache.get("flask_dance_token|test-service|None") == expected_token
+
+    # so references to the token should not generate SQL queries
+    with record_queries(db.engine) as queries:
+        assert blueprint.token == expected_token
+    assert len(queries) == 0
 
-    # first reference to the token should generate SQL queries
+    # after the cache is cleared, the first reference should query the database
+    cache.clear()
     with record_queries(db.engine) as queries:
         assert blueprint.token == expected_token
     assert len(queries) == 1
 
-    # should now be in the cache
+    # should now be in the cache again
     assert cache.get("flask_dance_token|test-service|None") == expected_token
 
-    # subsequent references should not generate SQL queries
+    assert blueprint.metrics.get("storage_cache_hits", "test-service") == 1
+    assert blueprint.metrics.get("storage_cache_misses", "test-service") == 1
+
+
+def test_sqla_no_cache_metrics(app, db, blueprint, request):
+    class OAuth(OAuthConsumerMixin, db.Model):
+        pass
+
+    blueprint.storage = SQLAlchemyStorage(OAuth, db.session)
+    blueprint.metrics = MetricsRegistry()
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    blueprint.token = {"access_token": "foobar", "token_type": "bearer"}
+    assert blueprint.token == {"access_token": "foobar", "token_type": "bearer"}
+    assert blueprint.metrics.get("storage_cache_hits", "test-service") == 0
+    assert blueprint.metrics.get("storage_cache_misses", "test-service") == 0
+
+
+def test_sqla_cache_absent_token(app, db, blueprint, request):
+    cache = Cache(app)
+
+    class OAuth(OAuthConsumerMixin, db.Model):
+        pass
+
+    blueprint.storage = SQLAlchemyStorage(
+        OAuth, db.session, cache=cache, absent_token_timeout=60
+    )
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    # first reference to the missing token should generate SQL queries
     with record_queries(db.engine) as queries:
-        assert blueprint.token == expected_token
+        assert blueprint.token is None
+    assert len(queries) == 1
+
+    # subsequent references should not
+    with record_queries(db.engine) as queries:
+        assert blueprint.token is None
+        assert blueprint.token is None
+        assert not blueprint.session.authorized
     assert len(queries) == 0
+
+    # setting a token should replace the cached absence
+    blueprint.token = {"access_token": "foobar", "token_type": "bearer"}
+    assert blueprint.token == {"access_token": "foobar", "token_type": "bearer"}
+
+
+def test_sqla_cache_absent_token_disabled(app, db, blueprint, request):
+    cache = Cache(app)
+
+    class OAuth(OAuthConsumerMixin, db.Model):
+        pass
+
+    # the absence of a token isn't cached by default
+    blueprint.storage = SQLAlchemyStorage(OAuth, db.session, cache=cache)
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    with record_queries(db.engine) as queries:
+        assert blueprint.token is None
+        assert blueprint.token is None
+    assert len(queries) == 2
+
+
+def test_sqla_set_updates_only_current_user(app, db, blueprint, request):
+    class User(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        name = db.Column(db.String(80))
+
+    class OAuth(OAuthConsumerMixin, db.Model):
+        user_id = db.Column(db.Integer, db.ForeignKey(User.id))
+        user = db.relationship(User)
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    alice = User(name="Alice")
+    alice_oauth = OAuth(
+        user=alice, token={"access_token": "alice123"}, provider="test-service"
+    )
+    bob = User(name="Bob")
+    bob_oauth = OAuth(
+        user=bob, token={"access_token": "bob456"}, provider="test-service"
+    )
+    db.session.add_all([alice, bob, alice_oauth, bob_oauth])
+    db.session.commit()
+
+    blueprint.storage = SQLAlchemyStorage(OAuth, db.session, user_id=alice.id)
+    with record_queries(db.engine) as queries:
+        blueprint.token = {"access_token": "alice789"}
+    assert len(queries) == 1
+    assert queries[0].startswith("INSERT")
+    assert "ON CONFLICT" in queries[0]
+
+    assert OAuth.query.count() == 2
+    assert OAuth.query.filter_by(user=alice).one().token == {"access_token": "alice789"}
+    assert OAuth.query.filter_by(user=bob).one().token == {"access_token": "bob456"}
+
+
+def test_sqla_set_retries_after_integrity_error(app, db, blueprint, request):
+    class OAuth(OAuthConsumerMixin, db.Model):
+        # without the unique index in the metadata, tokens aren't upserted
+        __table_args__ = ()
+
+    db.create_all()
+    db.session.execute(
+        text(
+            "CREATE UNIQUE INDEX ix_flask_dance_oauth_provider "
+            "ON flask_dance_oauth (provider)"
+        )
+    )
+    db.session.commit()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    conflicts = []
+
+    def add_conflicting_token(session, flush_context, instances):
+        # another request stores a token between the UPDATE and the INSERT
+        conflicts.append(True)
+        session.connection().execute(
+            OAuth.__table__.insert().values(
+                provider="test-service", token={"access_token": "other"}
+            )
+        )
+
+    event.listen(db.session, "before_flush", add_conflicting_token, once=True)
+    blueprint.storage = SQLAlchemyStorage(OAuth, db.session)
+    with record_queries(db.engine) as queries:
+        blueprint.token = {"access_token": "foobar"}
+
+    assert conflicts
+    assert [query.split()[0] for query in queries] == [
+        "UPDATE",
+        "INSERT",
+        "INSERT",
+        "UPDATE",
+        "INSERT",
+    ]
+    authorizations = OAuth.query.all()
+    assert len(authorizations) == 1
+    assert authorizations[0].token == {"access_token": "foobar"}
+
+
+def test_sqla_resolves_user_once(app, db, blueprint, request):
+    class User(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        name = db.Column(db.String(80))
+
+    class OAuth(OAuthConsumerMixin, db.Model):
+        user_id = db.Column(db.Integer, db.ForeignKey(User.id))
+        user = db.relationship(User)
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    alice = User(name="Alice")
+    db.session.add(alice)
+    db.session.commit()
+
+    calls = []
+
+    def load_user():
+        calls.append(alice)
+        return alice
+
+    blueprint.storage = SQLAlchemyStorage(OAuth, db.session, user=load_user)
+
+    assert not blueprint.session.authorized
+    assert len(calls) == 1
+
+    del calls[:]
+    blueprint.token = {"access_token": "alice123"}
+    assert len(calls) == 1
+
+    del calls[:]
+    del blueprint.token
+    assert len(calls) == 1
+
+
+def test_sqla_refresh_lock(app, db, request):
+    class OAuth(OAuthConsumerMixin, db.Model):
+        pass
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    blueprint = OAuth2ConsumerBlueprint(
+        "refresh-service",
+        __name__,
+        client_id="client_id",
+        client_secret="client_secret",
+        base_url="https://example.com",
+        auto_refresh_url="https://example.com/oauth/refresh",
+        storage=SQLAlchemyStorage(OAuth, db.session),
+        refresh_lock=SQLAlchemyRefreshLock(),
+    )
+    app.register_blueprint(blueprint)
+    responses.add(responses.GET, "https://example.com/user")
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/refresh",
+        body='{"access_token":"fresh","token_type":"bearer","expires_in":3600}',
+    )
+    expired = {
+        "access_token": "expired",
+        "refresh_token": "refresh-me",
+        "token_type": "bearer",
+        "expires_in": -10,
+        "expires_at": time.time() - 10,
+    }
+    db.session.add(OAuth(provider="refresh-service", token=expired))
+    db.session.commit()
+
+    with app.test_request_context("/"):
+        blueprint.session.get("/user")
+
+    assert len(responses.calls) == 2
+    assert responses.calls[1].request.headers["Authorization"] == "Bearer fresh"
+    oauth = OAuth.query.one()
+    assert oauth.token["access_token"] == "fresh"
+    assert oauth.token["expires_at"] > time.time()
+
+
+def test_sqla_iter_expiring_tokens(app, db, blueprint, request):
+    class User(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+
+    class OAuth(OAuthConsumerMixin, db.Model):
+        user_id = db.Column(db.Integer, db.ForeignKey(User.id))
+        user = db.relationship(User)
+
+    blueprint.storage = SQLAlchemyStorage(OAuth, db.session)
+    blueprint.auto_refresh_url = "https://example.com/oauth/refresh"
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    now = time.time()
+    for user_id, expires_at in [(1, now + 60), (2, now + 3600), (3, now - 10)]:
+        db.session.add(User(id=user_id))
+        token = {
+            "access_token": f"token-{user_id}",
+            "refresh_token": f"refresh-{user_id}",
+            "token_type": "bearer",
+            "expires_at": expires_at,
+        }
+        db.session.add(OAuth(provider="test-service", user_id=user_id, token=token))
+    db.session.add(OAuth(provider="other-service", token={"expires_at": now}))
+    db.session.commit()
+
+    expiring = blueprint.storage.iter_expiring_tokens(
+        blueprint, before=now + 300, batch_size=1
+    )
+    assert sorted(user_id for user_id, token in expiring) == [1, 3]
+
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/refresh",
+        body='{"access_token":"fresh","token_type":"bearer","expires_in":3600}',
+    )
+    app.cli.add_command(dance)
+    result = app.test_cli_runner().invoke(args=["dance", "refresh"])
+    assert result.exit_code == 0, result.output
+    assert "test-service: refreshed 2 tokens, 0 failed" in result.output
+
+    tokens = {oauth.user_id: oauth.token for oauth in OAuth.query}
+    assert tokens[1]["access_token"] == "fresh"
+    assert tokens[2]["access_token"] == "token-2"
+    assert tokens[3]["access_token"] == "fresh"
+    assert tokens[3]["refresh_token"] == "refresh-3"
+    assert OAuth.query.filter_by(provider="test-service").count() == 3
+
+
+def test_sqla_iter_tokens(app, db, blueprint, request):
+    class User(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+
+    class OAuth(OAuthConsumerMixin, db.Model):
+        user_id = db.Column(db.Integer, db.ForeignKey(User.id))
+        user = db.relationship(User)
+
+    blueprint.storage = SQLAlchemyStorage(OAuth, db.session)
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    for user_id in range(1, 6):
+        db.session.add(User(id=user_id))
+        token = {"access_token": f"token-{user_id}"}
+        db.session.add(OAuth(provider="test-service", user_id=user_id, token=token))
+    db.session.add(OAuth(provider="other-service", user_id=1, token={}))
+    db.session.commit()
+
+    with record_queries(db.engine) as queries:
+        tokens = list(blueprint.storage.iter_tokens(blueprint, batch_size=2))
+    assert tokens == [
+        (user_id, {"access_token": f"token-{user_id}"}) for user_id in range(1, 6)
+    ]
+    # three full or partial batches, and an empty one
+    assert len(queries) == 4
+
+    with record_queries(db.engine) as queries:
+        tokens = blueprint.storage.iter_tokens(
+            blueprint, user_ids=[5, 2, 9, 4], batch_size=3
+        )
+        assert sorted(user_id for user_id, token in tokens) == [2, 4, 5]
+    assert len(queries) == 2
+
+
+def test_sqla_set_many(app, db, blueprint, request):
+    cache = Cache(app)
+
+    class User(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+
+    class OAuth(OAuthConsumerMixin, db.Model):
+        user_id = db.Column(db.Integer, db.ForeignKey(User.id))
+        user = db.relationship(User)
+
+    blueprint.storage = SQLAlchemyStorage(OAuth, db.session, cache=cache)
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    for user_id in range(1, 5):
+        db.session.add(User(id=user_id))
+    db.session.add(OAuth(provider="test-service", user_id=1, token={"old": True}))
+    db.session.add(OAuth(provider="other-service", user_id=2, token={"other": True}))
+    db.session.commit()
+
+    tokens = {user_id: {"access_token": f"token-{user_id}"} for user_id in (1, 2, 3)}
+    with record_queries(db.engine) as queries:
+        blueprint.storage.set_many(blueprint, tokens, batch_size=2)
+    # for each batch, one select, and the inserts and updates
+    selects = [query for query in queries if query.lstrip().startswith("SELECT")]
+    assert len(selects) == 2
+
+    stored = {
+        oauth.user_id: oauth.token
+        for oauth in OAuth.query.filter_by(provider="test-service")
+    }
+    assert stored == tokens
+    assert OAuth.query.count() == 4
+    assert OAuth.query.filter_by(provider="other-service").one().token == {
+        "other": True
+    }
+    # the new tokens are written through to the cache
+    assert cache.get("flask_dance_token|test-service|3") == tokens[3]
+    with record_queries(db.engine) as queries:
+        assert blueprint.storage.get(blueprint, user_id=1) == tokens[1]
+    assert len(queries) == 0
+
+
+def test_sqla_offline_session(app, db, blueprint, request):
+    class User(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+
+    class OAuth(OAuthConsumerMixin, db.Model):
+        user_id = db.Column(db.Integer, db.ForeignKey(User.id))
+        user = db.relationship(User)
+
+    blueprint.storage = SQLAlchemyStorage(OAuth, db.session)
+    blueprint.auto_refresh_url = "https://example.com/oauth/refresh"
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    for user_id in (1, 2):
+        db.session.add(User(id=user_id))
+        token = {
+            "access_token": f"token-{user_id}",
+            "refresh_token": f"refresh-{user_id}",
+            "token_type": "bearer",
+            "expires_in": 3600,
+            "expires_at": time.time() + 3600 if user_id == 1 else time.time() - 10,
+        }
+        db.session.add(OAuth(provider="test-service", user_id=user_id, token=token))
+    db.session.commit()
+
+    responses.add(responses.GET, "https://example.com/user")
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/refresh",
+        body='{"access_token":"fresh","token_type":"bearer","expires_in":3600}',
+    )
+
+    # outside of any request, each session loads the token of its own user
+    sessions = [blueprint.offline_session(user_id=user_id) for user_id in (1, 2)]
+    for sess in sessions:
+        sess.get("https://example.com/user")
+
+    urls = [call.request.url for call in responses.calls]
+    assert urls == [
+        "https://example.com/user",
+        "https://example.com/oauth/refresh",
+        "https://example.com/user",
+    ]
+    assert responses.calls[0].request.headers["Authorization"] == "Bearer token-1"
+    assert responses.calls[2].request.headers["Authorization"] == "Bearer fresh"
+    tokens = {oauth.user_id: oauth.token for oauth in OAuth.query}
+    assert tokens[1]["access_token"] == "token-1"
+    assert tokens[2]["access_token"] == "fresh"
+    assert tokens[2]["refresh_token"] == "refresh-2"
+
+
+def test_sqla_mixin_indexes(db):
+    class User(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+
+    class OAuth(OAuthConsumerMixin, db.Model):
+        user_id = db.Column(db.Integer, db.ForeignKey(User.id))
+        user = db.relationship(User)
+
+    class Token(OAuthConsumerMixin, db.Model):
+        pass
+
+    class Grant(ExpiringOAuthConsumerMixin, db.Model):
+        user = db.relationship(User)
+        owner_id = db.Column(db.Integer, db.ForeignKey(User.id))
+
+    def indexes(model):
+        return {
+            index.name: ([column.name for column in index.columns], index.unique)
+            for index in model.__table__.indexes
+        }
+
+    assert indexes(OAuth) == {
+        "ix_flask_dance_oauth_provider_user_id": (["provider", "user_id"], True)
+    }
+    assert indexes(Token) == {"ix_flask_dance_token_provider": (["provider"], True)}
+    # tokens of different users can't share a unique index on the provider
+    assert indexes(Grant) == {
+        "ix_flask_dance_grant_provider": (["provider"], False),
+        "ix_flask_dance_grant_provider_expires_at": (
+            ["provider", "expires_at"],
+            False,
+        ),
+    }
+
+
+def test_sqla_get_loads_token_column(app, db, blueprint, request):
+    class User(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+
+    class OAuth(OAuthConsumerMixin, db.Model):
+        user_id = db.Column(db.Integer, db.ForeignKey(User.id))
+        user = db.relationship(User)
+
+    blueprint.storage = SQLAlchemyStorage(OAuth, db.session, user_id=1)
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    db.session.add(User(id=1))
+    db.session.add(OAuth(provider="test-service", user_id=1, token={"a": "b"}))
+    db.session.commit()
+    db.session.expunge_all()
+
+    with record_queries(db.engine) as queries:
+        assert blueprint.storage.get(blueprint) == {"a": "b"}
+    assert len(queries) == 1
+    selected = queries[0].split("FROM")[0]
+    assert "token" in selected
+    assert "created_at" not in selected
+    # the row isn't loaded into the session
+    assert not list(db.session.identity_map.values())
+
+
+def test_sqla_expires_at_column(app, db, blueprint, request):
+    class User(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+
+    class OAuth(ExpiringOAuthConsumerMixin, db.Model):
+        user_id = db.Column(db.Integer, db.ForeignKey(User.id))
+        user = db.relationship(User)
+
+    blueprint.storage = SQLAlchemyStorage(OAuth, db.session)
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    for user_id in (1, 2, 3):
+        db.session.add(User(id=user_id))
+    db.session.commit()
+
+    def expires_at(user_id):
+        return OAuth.query.filter_by(user_id=user_id).one().expires_at
+
+    # inserted, then updated in place
+    blueprint.storage.set(blueprint, {"expires_at": 1700000000}, user_id=1)
+    assert expires_at(1) == datetime(2023, 11, 14, 22, 13, 20)
+    blueprint.storage.set(blueprint, {"expires_at": 1700000060.5}, user_id=1)
+    db.session.expire_all()
+    assert expires_at(1) == datetime(2023, 11, 14, 22, 14, 20, 500000)
+    blueprint.storage.set(blueprint, {"access_token": "forever"}, user_id=1)
+    db.session.expire_all()
+    assert expires_at(1) is None
+
+    blueprint.storage.set_many(
+        blueprint, {2: {"expires_at": 1700000000}, 3: {"expires_at": "soon"}}
+    )
+    assert expires_at(2) == datetime(2023, 11, 14, 22, 13, 20)
+    assert expires_at(3) is None
+
+
+def test_sqla_backfill_expires_at(app, db, request):
+    class OAuth(ExpiringOAuthConsumerMixin, db.Model):
+        user_id = db.Column(db.Integer)
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    for user_id in range(5):
+        token = {"access_token": "abc"}
+        if user_id != 3:
+            token["expires_at"] = 1700000000 + user_id
+        db.session.add(OAuth(provider="test-service", user_id=user_id, token=token))
+    db.session.commit()
+    assert OAuth.query.filter(OAuth.expires_at.isnot(None)).count() == 0
+
+    with record_queries(db.engine) as queries:
+        assert backfill_expires_at(OAuth, db.session, batch_size=2) == 5
+    selects = [query for query in queries if query.lstrip().startswith("SELECT")]
+    assert len(selects) == 4
+
+    db.session.expire_all()
+    expected = {
+        user_id: datetime.fromtimestamp(1700000000 + user_id, timezone.utc).replace(
+            tzinfo=None
+        )
+        for user_id in range(5)
+    }
+    expected[3] = None
+    assert {oauth.user_id: oauth.expires_at for oauth in OAuth.query} == expected
+
+
+def test_sqla_iter_expiring_tokens_column(app, db, blueprint, request):
+    class User(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+
+    class OAuth(ExpiringOAuthConsumerMixin, db.Model):
+        user_id = db.Column(db.Integer, db.ForeignKey(User.id))
+        user = db.relationship(User)
+
+    blueprint.storage = SQLAlchemyStorage(OAuth, db.session)
+    blueprint.auto_refresh_url = "https://example.com/oauth/refresh"
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    now = time.time()
+    expiry = {1: now + 60, 2: now + 3600, 3: now - 10, 4: now + 60, 5: None}
+    tokens = {}
+    for user_id, expires_at in expiry.items():
+        db.session.add(User(id=user_id))
+        tokens[user_id] = {
+            "access_token": f"token-{user_id}",
+            "refresh_token": f"refresh-{user_id}",
+            "token_type": "bearer",
+        }
+        if expires_at:
+            tokens[user_id]["expires_at"] = expires_at
+    db.session.commit()
+    blueprint.storage.set_many(blueprint, tokens)
+    blueprint.storage.set(blueprint, {"expires_at": now}, user_id=None)
+
+    with record_queries(db.engine) as queries:
+        expiring = list(
+            blueprint.storage.iter_expiring_tokens(
+                blueprint, before=now + 300, batch_size=2
+            )
+        )
+    # soonest to expire first, and only the expiring rows are loaded
+    assert [user_id for user_id, token in expiring] == [3, None, 1, 4]
+    assert expiring[0][1] == tokens[3]
+    assert len(queries) == 3
+    assert "expires_at <" in queries[0]
+
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/refresh",
+        body='{"access_token":"fresh","token_type":"bearer","expires_in":3600}',
+    )
+    db.session.query(OAuth).filter_by(user_id=None).delete()
+    db.session.commit()
+    app.cli.add_command(dance)
+    result = app.test_cli_runner().invoke(args=["dance", "refresh"])
+    assert result.exit_code == 0, result.output
+    assert "test-service: refreshed 3 tokens, 0 failed" in result.output
+    assert list(blueprint.storage.iter_expiring_tokens(blueprint, now + 300)) == []
+    oauth = OAuth.query.filter_by(user_id=3).one()
+    assert oauth.token["access_token"] == "fresh"
+    assert oauth.expires_at > datetime.utcnow()
+
+
+def test_sqla_expires_at_from_expires_in(app, db, blueprint, request):
+    class OAuth(ExpiringOAuthConsumerMixin, db.Model):
+        user_id = db.Column(db.Integer)
+
+    blueprint.storage = SQLAlchemyStorage(OAuth, db.session)
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    token = {"access_token": "abc", "expires_in": 3600}
+    blueprint.storage.set(blueprint, token, user_id=1)
+    blueprint.storage.set_many(blueprint, {2: token})
+    # the token that was passed in isn't changed
+    assert token == {"access_token": "abc", "expires_in": 3600}
+
+    for oauth in OAuth.query:
+        assert oauth.token["expires_at"] == pytest.approx(time.time() + 3600, abs=5)
+        expected = datetime.fromtimestamp(oauth.token["expires_at"], timezone.utc)
+        assert oauth.expires_at == expected.replace(tzinfo=None)
+
+
+@pytest.mark.parametrize("mixin", [OAuthConsumerMixin, ExpiringOAuthConsumerMixin])
+def test_sqla_gc(app, db, blueprint, request, monkeypatch, mixin):
+    cache = Cache(app)
+
+    class User(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+
+    class OAuth(mixin, db.Model):
+        user_id = db.Column(db.Integer, db.ForeignKey(User.id))
+        user = db.relationship(User)
+
+    blueprint.storage = SQLAlchemyStorage(OAuth, db.session, cache=cache)
+
+    db.create_all()
+
+    def done():
+        db.session.remove()
+        db.drop_all()
+
+    request.addfinalizer(done)
+
+    now = time.time()
+    tokens = {
+        1: {"access_token": "expired", "expires_at": now - 60},
+        2: {
+            "access_token": "refreshable",
+            "expires_at": now - 60,
+            "refresh_token": "r",
+        },
+        3: {"access_token": "valid", "expires_at": now + 60},
+        4: {"access_token": "forever"},
+        5: {"access_token": "expired-too", "expires_at": now - 3600},
+        6: {"access_token": "deleted-user"},
+    }
+    for user_id in tokens:
+        db.session.add(User(id=user_id))
+    db.session.commit()
+    blueprint.storage.set_many(blueprint, tokens)
+    blueprint.storage.set(
+        blueprint, {"access_token": "no-user", "expires_at": now - 60}, user_id=None
+    )
+    db.session.add(OAuth(provider="other-service", user_id=1, token=tokens[1]))
+    # SQLite doesn't enforce foreign keys, so this leaves the token behind
+    User.query.filter_by(id=6).delete()
+    db.session.commit()
+    assert cache.get("flask_dance_token|test-service|1") == tokens[1]
+
+    sleeps = []
+    monkeypatch.setattr("flask_dance.consumer.storage.sqla.time.sleep", sleeps.append)
+    app.cli.add_command(dance)
+    result = app.test_cli_runner().invoke(
+        args=["dance", "gc", "--batch-size", "2", "--sleep", "0.5"]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "test-service: deleted 3 expired tokens, 1 orphaned tokens" in result.output
+    remaining = {
+        oauth.user_id: oauth.token["access_token"]
+        for oauth in OAuth.query.filter_by(provider="test-service")
+    }
+    assert remaining == {2: "refreshable", 3: "valid", 4: "forever"}
+    assert OAuth.query.filter_by(provider="other-service").count() == 1
+    # deleted tokens are removed from the cache
+    assert cache.get("flask_dance_token|test-service|1") is None
+    assert sleeps and set(sleeps) == {0.5}
+
+    # tokens without a user are orphaned too, if the storage requires a user
+    OAuth.query.filter_by(provider="other-service").delete()
+    db.session.add(OAuth(provider="test-service", user_id=None, token=tokens[4]))
+    db.session.commit()
+    blueprint.storage.user_required = True
+    assert blueprint.storage.delete_orphaned_tokens(blueprint) == 1
+    assert blueprint.storage.delete_expired_tokens(blueprint, time.time()) == 0
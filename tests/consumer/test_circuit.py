@@ -0,0 +1,240 @@
+from unittest import mock
+
+import flask
+import pytest
+import responses
+from requests.exceptions import ConnectionError
+
+from flask_dance.consumer import (
+    OAuth1ConsumerBlueprint,
+    OAuth2ConsumerBlueprint,
+    oauth_error,
+)
+from flask_dance.consumer.circuit import CircuitBreaker, CircuitOpen, circuit_name
+from flask_dance.consumer.storage import MemoryStorage
+from flask_dance.utils import LRUCache
+
+try:
+    import blinker
+except ImportError:
+    blinker = None
+requires_blinker = pytest.mark.skipif(not blinker, reason="requires blinker")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    clock = FakeClock()
+    with mock.patch("flask_dance.consumer.circuit.time.time", clock):
+        yield clock
+
+
+def make_app(circuit_breaker):
+    app = flask.Flask(__name__)
+    app.secret_key = "secret"
+    bp = OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client_id",
+        client_secret="client_secret",
+        base_url="https://example.com",
+        authorization_url="https://example.com/oauth/authorize",
+        token_url="https://example.com/oauth/access_token",
+        storage=MemoryStorage({"access_token": "deadbeef", "token_type": "bearer"}),
+        circuit_breaker=circuit_breaker,
+    )
+    app.register_blueprint(bp, url_prefix="/login")
+    app.config["SERVER_NAME"] = "a.b.c"
+    return app, bp
+
+
+def test_circuit_name():
+    app, bp = make_app(None)
+    assert circuit_name(bp, "https://example.com/oauth/access_token") == "token"
+    assert circuit_name(bp, "https://example.com/user") == "api"
+
+
+@responses.activate
+def test_circuit_opens(clock):
+    responses.add(responses.GET, "https://example.com/user", status=503)
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=30)
+    app, bp = make_app(breaker)
+
+    for _ in range(3):
+        assert bp.session.get("/user").status_code == 503
+    assert breaker.state(bp) == "open"
+
+    with pytest.raises(CircuitOpen) as excinfo:
+        bp.session.get("/user")
+    assert excinfo.value.circuit == "api"
+    assert excinfo.value.retry_at == clock.now + 30
+    assert len(responses.calls) == 3
+    # the token endpoint has a circuit of its own
+    assert breaker.state(bp, "token") == "closed"
+
+
+@responses.activate
+def test_circuit_success_resets_failures(clock):
+    responses.add(responses.GET, "https://example.com/user", status=500)
+    responses.add(responses.GET, "https://example.com/user")
+    responses.add(responses.GET, "https://example.com/user", status=500)
+    breaker = CircuitBreaker(failure_threshold=2)
+    app, bp = make_app(breaker)
+
+    bp.session.get("/user")
+    bp.session.get("/user")
+    bp.session.get("/user")
+    assert breaker.state(bp) == "closed"
+
+
+@responses.activate
+def test_circuit_half_open(clock):
+    responses.add(
+        responses.GET, "https://example.com/user", body=ConnectionError("refused")
+    )
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+    app, bp = make_app(breaker)
+
+    with pytest.raises(ConnectionError):
+        bp.session.get("/user")
+    assert breaker.state(bp) == "open"
+
+    clock.now += 30
+    assert breaker.state(bp) == "half-open"
+    # the probe fails, so the circuit opens again
+    with pytest.raises(ConnectionError):
+        bp.session.get("/user")
+    assert breaker.state(bp) == "open"
+    with pytest.raises(CircuitOpen):
+        bp.session.get("/user")
+    assert len(responses.calls) == 2
+
+    clock.now += 30
+    responses.replace(responses.GET, "https://example.com/user", json={"ok": True})
+    assert bp.session.get("/user").json() == {"ok": True}
+    assert breaker.state(bp) == "closed"
+
+
+@responses.activate
+def test_circuit_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+    app, bp = make_app(breaker)
+    responses.add(responses.GET, "https://example.com/user", status=502)
+    bp.session.get("/user")
+    clock.now += 30
+
+    def probe(request):
+        # while the probe is in flight, other requests still fail fast
+        with pytest.raises(CircuitOpen):
+            bp.session.get("/other")
+        return (200, {}, "ok")
+
+    responses.add_callback(responses.GET, "https://example.com/probe", probe)
+    assert bp.session.get("/probe").text == "ok"
+    assert breaker.state(bp) == "closed"
+
+
+@responses.activate
+def test_circuit_shared_backend(clock):
+    responses.add(responses.GET, "https://example.com/user", status=503)
+    backend = LRUCache()
+    app, bp = make_app(CircuitBreaker(failure_threshold=1, backend=backend))
+    bp.session.get("/user")
+
+    # another process, with its own breaker and the same backend
+    other = CircuitBreaker(failure_threshold=1, backend=backend)
+    assert other.state(bp) == "open"
+    other.reset(bp)
+    assert bp.circuit_breaker.state(bp) == "closed"
+
+
+@requires_blinker
+@responses.activate
+def test_circuit_open_authorized(request, clock):
+    responses.add(responses.POST, "https://example.com/oauth/access_token", status=503)
+    breaker = CircuitBreaker(failure_threshold=1)
+    app, bp = make_app(breaker)
+
+    calls = []
+
+    def callback(*args, **kwargs):
+        calls.append((args, kwargs))
+
+    oauth_error.connect(callback)
+    request.addfinalizer(lambda: oauth_error.disconnect(callback))
+
+    for _ in range(2):
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess["test-service_oauth_state"] = "random-string"
+            resp = client.get(
+                "/login/test-service/authorized?code=secret-code&state=random-string",
+                base_url="https://a.b.c",
+            )
+
+    assert len(responses.calls) == 1
+    assert resp.status_code == 302
+    assert len(calls) == 1
+    assert calls[0][0] == (bp,)
+    assert calls[0][1] == {
+        "error": "circuit_open",
+        "error_description": "test-service token circuit is open",
+    }
+
+
+@requires_blinker
+@responses.activate
+def test_circuit_open_oauth1_login(request, clock):
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/request_token",
+        body=ConnectionError("refused"),
+    )
+    app = flask.Flask(__name__)
+    app.secret_key = "secret"
+    bp = OAuth1ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_key="client_key",
+        client_secret="client_secret",
+        base_url="https://example.com",
+        request_token_url="https://example.com/oauth/request_token",
+        access_token_url="https://example.com/oauth/access_token",
+        authorization_url="https://example.com/oauth/authorize",
+        redirect_url="/finished",
+        circuit_breaker=CircuitBreaker(failure_threshold=1),
+    )
+    app.register_blueprint(bp, url_prefix="/login")
+
+    calls = []
+
+    def callback(*args, **kwargs):
+        calls.append((args, kwargs))
+
+    oauth_error.connect(callback)
+    request.addfinalizer(lambda: oauth_error.disconnect(callback))
+
+    with app.test_client() as client:
+        resp = client.get("/login/test-service", base_url="https://a.b.c")
+        assert resp.status_code == 500
+        resp = client.get("/login/test-service", base_url="https://a.b.c")
+
+    assert resp.status_code == 302
+    assert resp.headers["Location"].endswith("/finished")
+    assert calls == [
+        (
+            (bp,),
+            {
+                "message": "test-service token circuit is open",
+                "response": None,
+                "error": "circuit_open",
+            },
+        )
+    ]
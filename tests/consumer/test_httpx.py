@@ -0,0 +1,181 @@
+import asyncio
+import time
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+import flask
+
+from flask_dance.consumer import OAuth2ConsumerBlueprint
+from flask_dance.consumer.httpx import AsyncOAuth2Session
+from flask_dance.consumer.storage import MemoryStorage
+from flask_dance.consumer.timeouts import DeadlineExceeded
+from flask_dance.contrib.github import github, make_github_blueprint
+from flask_dance.contrib.gitlab import gitlab, make_gitlab_blueprint
+
+FAKE_OAUTH2_TOKEN = {
+    "access_token": "deadbeef",
+    "scope": ["custom"],
+    "token_type": "bearer",
+}
+
+
+class StubProvider:
+    """
+    An httpx transport that answers API requests with the request's
+    Authorization header, and token refreshes with a fresh token.
+    """
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.requests = []
+
+    async def __call__(self, request):
+        self.requests.append(request)
+        await asyncio.sleep(self.delay)
+        if request.url.path.endswith("/oauth/refresh"):
+            token = {
+                "access_token": "fresh",
+                "token_type": "bearer",
+                "expires_in": 3600,
+            }
+            return httpx.Response(200, json=token)
+        auth = request.headers.get("Authorization")
+        return httpx.Response(200, json={"url": str(request.url), "auth": auth})
+
+    @property
+    def transport(self):
+        return httpx.MockTransport(self)
+
+
+def make_app(provider, **kwargs):
+    bp = OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client_id",
+        client_secret="client_secret",
+        base_url="https://example.com/api/",
+        async_session_kwargs={"transport": provider.transport},
+        **kwargs,
+    )
+    app = flask.Flask(__name__)
+    app.register_blueprint(bp, url_prefix="/login")
+    return app, bp
+
+
+def test_async_session_request():
+    provider = StubProvider()
+    app, bp = make_app(provider, storage=MemoryStorage(FAKE_OAUTH2_TOKEN))
+
+    async def view():
+        async with bp.make_async_session() as session:
+            assert session.authorized
+            resp = await session.get("user")
+            return resp.json()
+
+    with app.test_request_context("/"):
+        data = asyncio.run(view())
+
+    assert data == {
+        "url": "https://example.com/api/user",
+        "auth": "Bearer deadbeef",
+    }
+
+
+def test_async_session_not_authorized():
+    app, bp = make_app(StubProvider())
+    with app.test_request_context("/"):
+        session = bp.make_async_session()
+        assert isinstance(session, AsyncOAuth2Session)
+        assert not session.authorized
+
+
+def test_async_session_refresh_once():
+    provider = StubProvider(delay=0.01)
+    expired = {
+        "access_token": "expired",
+        "refresh_token": "refresh-me",
+        "token_type": "bearer",
+        "expires_in": -10,
+        "expires_at": time.time() - 10,
+    }
+    storage = MemoryStorage(expired)
+    app, bp = make_app(
+        provider,
+        storage=storage,
+        auto_refresh_url="https://example.com/oauth/refresh",
+    )
+
+    async def view():
+        async with bp.make_async_session() as session:
+            return await asyncio.gather(*(session.get(f"/item/{i}") for i in range(3)))
+
+    with app.test_request_context("/"):
+        responses = asyncio.run(view())
+
+    assert [resp.json()["auth"] for resp in responses] == ["Bearer fresh"] * 3
+    refreshes = [r for r in provider.requests if r.url.path == "/oauth/refresh"]
+    assert len(refreshes) == 1
+    assert b"refresh_token=refresh-me" in refreshes[0].content
+    assert storage.token["access_token"] == "fresh"
+    assert storage.token["refresh_token"] == "refresh-me"
+
+
+def test_async_session_closed():
+    app, bp = make_app(StubProvider(), storage=MemoryStorage(FAKE_OAUTH2_TOKEN))
+
+    async def view():
+        async with bp.make_async_session() as session:
+            await session.get("user")
+        return session
+
+    with app.test_request_context("/"):
+        first = asyncio.run(view())
+        second = asyncio.run(view())
+
+    # each view gets its own session, and closes it in its own event loop
+    assert first is not second
+    assert first.is_closed and second.is_closed
+    assert "async_session" not in vars(bp)
+
+
+def test_async_session_request_deadline():
+    app, bp = make_app(
+        StubProvider(delay=1),
+        storage=MemoryStorage(FAKE_OAUTH2_TOKEN),
+        request_deadline=0.05,
+    )
+
+    async def view():
+        async with bp.make_async_session() as session:
+            with pytest.raises(DeadlineExceeded):
+                await session.get("slow")
+            with pytest.raises(DeadlineExceeded):
+                await session.get("slow")
+
+    start = time.monotonic()
+    with app.test_request_context("/"):
+        asyncio.run(view())
+    assert time.monotonic() - start < 0.5
+
+
+def test_async_session_through_proxies():
+    provider = StubProvider()
+    app = flask.Flask(__name__)
+    for make_blueprint in (make_github_blueprint, make_gitlab_blueprint):
+        bp = make_blueprint(storage=MemoryStorage(FAKE_OAUTH2_TOKEN))
+        bp.async_session_kwargs = {"transport": provider.transport}
+        app.register_blueprint(bp)
+
+    async def view():
+        async with github.make_async_session() as gh:
+            async with gitlab.make_async_session() as gl:
+                return await asyncio.gather(gh.get("/user"), gl.get("user"))
+
+    with app.test_request_context("/"):
+        app.preprocess_request()
+        github_resp, gitlab_resp = asyncio.run(view())
+
+    assert github_resp.json()["url"] == "https://api.github.com/user"
+    assert gitlab_resp.json()["url"] == "https://gitlab.com/api/v4/user"
@@ -0,0 +1,183 @@
+import time
+from contextlib import contextmanager
+
+import flask
+import pytest
+import responses
+from requests.exceptions import ConnectionError
+
+from flask_dance.consumer import OAuth2ConsumerBlueprint
+from flask_dance.consumer.instrumentation import (
+    Instrumentation,
+    OpenTelemetryInstrumentation,
+)
+from flask_dance.consumer.storage import MemoryStorage
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, name, blueprint, duration, attributes, error):
+        assert duration >= 0
+        self.calls.append((name, blueprint.name, dict(attributes), error))
+
+    @property
+    def names(self):
+        return [call[0] for call in self.calls]
+
+
+def make_app(instrumentation, token=None, **kwargs):
+    app = flask.Flask(__name__)
+    app.secret_key = "secret"
+    bp = OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client_id",
+        client_secret="client_secret",
+        base_url="https://example.com",
+        authorization_url="https://example.com/oauth/authorize",
+        token_url="https://example.com/oauth/access_token",
+        storage=MemoryStorage(token),
+        instrumentation=instrumentation,
+        **kwargs,
+    )
+    app.register_blueprint(bp, url_prefix="/login")
+    app.config["SERVER_NAME"] = "a.b.c"
+    return app, bp
+
+
+@responses.activate
+def test_instrument_authorized():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/access_token",
+        json={"access_token": "foobar", "token_type": "bearer"},
+    )
+    recorder = Recorder()
+    app, bp = make_app(Instrumentation(recorder))
+
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess["test-service_oauth_state"] = "random-string"
+        client.get(
+            "/login/test-service/authorized?code=secret-code&state=random-string",
+            base_url="https://a.b.c",
+        )
+
+    assert recorder.names == [
+        "request",
+        "token.fetch",
+        "signal.oauth_authorized",
+        "storage.set",
+    ]
+    assert recorder.calls[0][1:] == (
+        "test-service",
+        {
+            "blueprint": "test-service",
+            "method": "POST",
+            "url": "https://example.com/oauth/access_token",
+            "status_code": 200,
+        },
+        None,
+    )
+    assert recorder.calls[3][2] == {
+        "blueprint": "test-service",
+        "storage": "MemoryStorage",
+    }
+
+
+@responses.activate
+def test_instrument_refresh():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/refresh",
+        json={"access_token": "fresh", "token_type": "bearer", "expires_in": 3600},
+    )
+    responses.add(responses.GET, "https://example.com/user")
+    recorder = Recorder()
+    token = {
+        "access_token": "expired",
+        "refresh_token": "refresh-me",
+        "token_type": "bearer",
+        "expires_in": -10,
+        "expires_at": time.time() - 10,
+    }
+    app, bp = make_app(
+        Instrumentation(recorder),
+        token=token,
+        auto_refresh_url="https://example.com/oauth/refresh",
+    )
+
+    with app.test_request_context("/"):
+        bp.session.get("/user?secret=1")
+
+    assert recorder.names == [
+        "storage.get",
+        "request",
+        "token.refresh",
+        "storage.set",
+        "request",
+    ]
+    assert recorder.calls[-1][2]["url"] == "https://example.com/user"
+
+
+@responses.activate
+def test_instrument_error():
+    responses.add(
+        responses.GET, "https://example.com/user", body=ConnectionError("refused")
+    )
+    recorder = Recorder()
+    app, bp = make_app(Instrumentation(recorder), token={"access_token": "a"})
+
+    with app.test_request_context("/"):
+        with pytest.raises(ConnectionError):
+            bp.session.get("/user")
+
+    name, _, attributes, error = recorder.calls[-1]
+    assert name == "request"
+    assert "status_code" not in attributes
+    assert isinstance(error, ConnectionError)
+
+
+class FakeSpan:
+    def __init__(self, name):
+        self.name = name
+        self.attributes = {}
+
+    def set_attributes(self, attributes):
+        self.attributes.update(attributes)
+
+
+class FakeTracer:
+    def __init__(self):
+        self.spans = []
+
+    @contextmanager
+    def start_as_current_span(self, name):
+        span = FakeSpan(name)
+        self.spans.append(span)
+        yield span
+
+
+@responses.activate
+def test_opentelemetry_instrumentation():
+    responses.add(responses.GET, "https://example.com/user", status=404)
+    tracer = FakeTracer()
+    app, bp = make_app(
+        OpenTelemetryInstrumentation(tracer), token={"access_token": "a"}
+    )
+
+    with app.test_request_context("/"):
+        bp.session.get("/user")
+
+    assert [span.name for span in tracer.spans] == [
+        "flask_dance.storage.get",
+        "flask_dance.request",
+    ]
+    assert tracer.spans[1].attributes == {
+        "flask_dance.blueprint": "test-service",
+        "flask_dance.method": "GET",
+        "flask_dance.url": "https://example.com/user",
+        "flask_dance.status_code": 404,
+    }
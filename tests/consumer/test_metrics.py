@@ -0,0 +1,150 @@
+import threading
+import time
+
+import flask
+import responses
+
+from flask_dance.consumer import OAuth2ConsumerBlueprint
+from flask_dance.consumer.metrics import MetricsRegistry, prometheus_text
+from flask_dance.consumer.storage import MemoryStorage
+
+
+def make_app(token=None, **kwargs):
+    app = flask.Flask(__name__)
+    app.secret_key = "secret"
+    bp = OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client_id",
+        client_secret="client_secret",
+        base_url="https://example.com",
+        authorization_url="https://example.com/oauth/authorize",
+        token_url="https://example.com/oauth/access_token",
+        storage=MemoryStorage(token),
+        metrics=MetricsRegistry(),
+        **kwargs,
+    )
+    app.register_blueprint(bp, url_prefix="/login")
+    app.config["SERVER_NAME"] = "a.b.c"
+    return app, bp
+
+
+def test_registry_threads():
+    metrics = MetricsRegistry()
+
+    def work():
+        for _ in range(1000):
+            metrics.inc("logins_started", "github")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    metrics.inc("logins_started", "google", 2)
+    for thread in threads:
+        thread.join()
+
+    # a new thread folds the counts of the finished ones together
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    assert len(metrics._shards) <= 2
+
+    assert metrics.counters() == {
+        ("logins_started", "github"): 5000,
+        ("logins_started", "google"): 2,
+    }
+    metrics.clear()
+    assert metrics.get("logins_started", "github") == 0
+
+
+def test_prometheus_text():
+    metrics = MetricsRegistry()
+    metrics.inc("token_refreshes", "github", 3)
+    metrics.inc("token_refreshes", 'we"ird')
+    metrics.inc("logins_started", "github")
+
+    assert prometheus_text(metrics) == (
+        "# HELP flask_dance_logins_started_total "
+        "Users sent to the OAuth provider by the login view.\n"
+        "# TYPE flask_dance_logins_started_total counter\n"
+        'flask_dance_logins_started_total{blueprint="github"} 1\n'
+        "# HELP flask_dance_token_refreshes_total OAuth 2 tokens refreshed.\n"
+        "# TYPE flask_dance_token_refreshes_total counter\n"
+        'flask_dance_token_refreshes_total{blueprint="github"} 3\n'
+        'flask_dance_token_refreshes_total{blueprint="we\\"ird"} 1\n'
+    )
+    assert prometheus_text(MetricsRegistry()) == ""
+
+
+@responses.activate
+def test_dance_funnel():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/access_token",
+        json={"access_token": "foobar", "token_type": "bearer"},
+    )
+    app, bp = make_app()
+
+    with app.test_client() as client:
+        # there is no state in the session before the login view
+        client.get(
+            "/login/test-service/authorized?code=secret-code&state=random-string",
+            base_url="https://a.b.c",
+        )
+        client.get("/login/test-service", base_url="https://a.b.c")
+        client.get(
+            "/login/test-service/authorized?error=access_denied",
+            base_url="https://a.b.c",
+        )
+        client.get("/login/test-service", base_url="https://a.b.c")
+        with client.session_transaction() as sess:
+            state = sess["test-service_oauth_state"]
+        client.get(
+            f"/login/test-service/authorized?code=secret-code&state={state}",
+            base_url="https://a.b.c",
+        )
+
+    assert bp.metrics.counters() == {
+        ("logins_started", "test-service"): 2,
+        ("state_missing", "test-service"): 1,
+        ("authorizations_failed", "test-service"): 1,
+        ("authorizations_succeeded", "test-service"): 1,
+    }
+
+
+def test_pkce_verifier_missing():
+    app, bp = make_app(use_pkce=True)
+
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess["test-service_oauth_state"] = "random-string"
+        client.get(
+            "/login/test-service/authorized?code=secret-code&state=random-string",
+            base_url="https://a.b.c",
+        )
+
+    assert bp.metrics.get("pkce_verifier_missing", "test-service") == 1
+
+
+@responses.activate
+def test_token_refreshes():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/refresh",
+        json={"access_token": "fresh", "token_type": "bearer", "expires_in": 3600},
+    )
+    responses.add(responses.GET, "https://example.com/user")
+    token = {
+        "access_token": "expired",
+        "refresh_token": "refresh-me",
+        "token_type": "bearer",
+        "expires_in": -10,
+        "expires_at": time.time() - 10,
+    }
+    app, bp = make_app(token, auto_refresh_url="https://example.com/oauth/refresh")
+
+    with app.test_request_context("/"):
+        bp.session.get("/user")
+        bp.session.get("/user")
+
+    assert bp.metrics.get("token_refreshes", "test-service") == 1
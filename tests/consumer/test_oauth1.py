@@ -13,7 +13,7 @@ from flask_dance.consumer import (
     oauth_before_login,
     oauth_error,
 )
-from flask_dance.consumer.requests import OAuth1Session
+from flask_dance.consumer.requests import OAuth1Session, get_shared_adapter
 from flask_dance.consumer.storage import MemoryStorage
 
 try:
@@ -584,3 +584,16 @@ def test_rule_kwargs():
     ]
     assert all(rule.host == "example2.com" for rule in rules)
     assert len(rules) == 2
+
+
+def test_transport_adapter():
+    adapter = get_shared_adapter()
+    bp = OAuth1ConsumerBlueprint(
+        "test",
+        __name__,
+        client_key="client_key",
+        client_secret="client_secret",
+        base_url="https://example.com",
+        transport_adapter=adapter,
+    )
+    assert bp.session.get_adapter("https://example.com") is adapter
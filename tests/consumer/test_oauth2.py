@@ -1,5 +1,6 @@
 import json
 import re
+import time
 from unittest import mock
 from urllib.parse import parse_qsl
 
@@ -18,7 +19,7 @@ from flask_dance.consumer import (
     oauth_before_login,
     oauth_error,
 )
-from flask_dance.consumer.requests import OAuth2Session
+from flask_dance.consumer.requests import OAuth2Session, get_shared_adapter
 from flask_dance.consumer.storage import MemoryStorage
 
 try:
@@ -849,3 +850,137 @@ def test_rule_kwargs():
     ]
     assert all(rule.host == "example2.com" for rule in rules)
     assert len(rules) == 2
+
+
+def test_transport_adapter_shared_across_requests():
+    adapter = get_shared_adapter()
+    app, bp = make_app(transport_adapter=adapter)
+
+    with app.test_request_context("/"):
+        first_session = bp.session
+        assert first_session.get_adapter("https://example.com") is adapter
+        assert first_session.get_adapter("http://example.com") is adapter
+
+    with app.test_request_context("/"):
+        second_session = bp.session
+        assert second_session is not first_session
+        assert second_session.get_adapter("https://example.com") is adapter
+
+
+def test_no_transport_adapter():
+    app, bp = make_app()
+    with app.test_request_context("/"):
+        adapter = bp.session.get_adapter("https://example.com")
+        assert adapter is not get_shared_adapter()
+
+
+def test_load_config_only_when_changed():
+    app, bp = make_app()
+    bp.from_config["client_secret"] = "CLIENT_SECRET"
+    app.config["CLIENT_SECRET"] = "from-config"
+
+    with app.test_request_context("/"):
+        app.preprocess_request()
+        assert bp.client_secret == "from-config"
+
+    # unchanged config is not loaded again
+    bp.client_secret = "manual"
+    with app.test_request_context("/"):
+        app.preprocess_request()
+        assert bp.client_secret == "manual"
+
+    # changed config is
+    app.config["CLIENT_SECRET"] = "changed"
+    with app.test_request_context("/"):
+        app.preprocess_request()
+        assert bp.client_secret == "changed"
+
+
+def test_load_config_dotpath_every_request():
+    app, bp = make_app()
+    bp.from_config["session.client_id"] = "CLIENT_ID"
+    app.config["CLIENT_ID"] = "from-config"
+
+    for _ in range(2):
+        with app.test_request_context("/"):
+            app.preprocess_request()
+            assert bp.session.client_id == "from-config"
+
+
+def test_token_loaded_once_per_request():
+    storage = MemoryStorage({"access_token": "foobar", "token_type": "bearer"})
+    storage.get = mock.Mock(wraps=storage.get)
+    app, bp = make_app(storage=storage)
+
+    with app.test_request_context("/"):
+        assert bp.token["access_token"] == "foobar"
+        assert bp.session.authorized
+        assert bp.token["access_token"] == "foobar"
+        assert bp.session.access_token == "foobar"
+        assert storage.get.call_count == 1
+
+        # setting the token forgets the loaded token
+        bp.token = {"access_token": "abcdef", "token_type": "bearer"}
+        assert bp.token["access_token"] == "abcdef"
+        assert bp.session.access_token == "abcdef"
+        assert storage.get.call_count == 2
+
+        # as does changing the config
+        bp.config["user_id"] = 1
+        assert bp.token["access_token"] == "abcdef"
+        assert storage.get.call_count == 3
+
+        # and deleting the token
+        del bp.token
+        assert bp.token is None
+        assert not bp.session.authorized
+        assert storage.get.call_count == 4
+
+    # the next request loads the token again
+    with app.test_request_context("/"):
+        assert bp.token is None
+        assert storage.get.call_count == 5
+
+
+@responses.activate
+def test_offline_session():
+    responses.add(responses.GET, "https://example.com/user")
+    app, bp = make_app(storage=MemoryStorage({"access_token": "stored"}))
+
+    # no request context, and not even an application context
+    sess = bp.offline_session(token={"access_token": "mine", "token_type": "bearer"})
+    sess.get("/user")
+
+    assert responses.calls[0].request.headers["Authorization"] == "Bearer mine"
+    assert sess.get_adapter("https://example.com") is get_shared_adapter()
+    assert bp.offline_session() is not sess
+    assert bp.offline_session().token == {"access_token": "stored"}
+
+
+@responses.activate
+def test_offline_session_refresh():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/refresh",
+        json={"access_token": "fresh", "token_type": "bearer", "expires_in": 3600},
+    )
+    responses.add(responses.GET, "https://example.com/user")
+    storage = MemoryStorage()
+    app, bp = make_app(
+        storage=storage, auto_refresh_url="https://example.com/oauth/refresh"
+    )
+    token = {
+        "access_token": "expired",
+        "refresh_token": "refresh-me",
+        "token_type": "bearer",
+        "expires_in": -10,
+        "expires_at": time.time() - 10,
+    }
+
+    with app.app_context():
+        sess = bp.offline_session(user_id=42, token=token)
+        sess.get("/user")
+
+    assert responses.calls[1].request.headers["Authorization"] == "Bearer fresh"
+    assert storage.token["access_token"] == "fresh"
+    assert storage.token["expires_at"] > time.time()
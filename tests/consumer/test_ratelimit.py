@@ -0,0 +1,183 @@
+import time
+from unittest import mock
+
+import flask
+import pytest
+import responses
+from requests.structures import CaseInsensitiveDict
+
+from flask_dance.consumer import OAuth2ConsumerBlueprint
+from flask_dance.consumer.ratelimit import (
+    RateLimit,
+    RateLimiter,
+    RateLimitExceeded,
+    parse_rate_limit,
+)
+from flask_dance.consumer.storage import MemoryStorage
+
+NOW = 1700000000
+
+
+@pytest.mark.parametrize(
+    "headers,expected",
+    [
+        # GitHub
+        (
+            {
+                "X-RateLimit-Limit": "5000",
+                "X-RateLimit-Remaining": "4999",
+                "X-RateLimit-Reset": str(NOW + 3600),
+            },
+            (RateLimit(5000, 4999, NOW + 3600), None),
+        ),
+        # Twitch
+        (
+            {
+                "Ratelimit-Limit": "800",
+                "Ratelimit-Remaining": "799",
+                "Ratelimit-Reset": str(NOW + 60),
+            },
+            (RateLimit(800, 799, NOW + 60), None),
+        ),
+        # Reddit, which sends the number of seconds until the reset
+        (
+            {
+                "X-Ratelimit-Used": "2",
+                "X-Ratelimit-Remaining": "598.0",
+                "X-Ratelimit-Reset": "540",
+            },
+            (RateLimit(None, 598, NOW + 540), None),
+        ),
+        # Discord
+        (
+            {
+                "X-RateLimit-Limit": "5",
+                "X-RateLimit-Remaining": "4",
+                "X-RateLimit-Reset": str(NOW + 1.5),
+                "X-RateLimit-Reset-After": "1.25",
+                "X-RateLimit-Bucket": "abcd1234",
+            },
+            (RateLimit(5, 4, NOW + 1.25), "abcd1234"),
+        ),
+        ({"Content-Type": "application/json"}, None),
+    ],
+)
+def test_parse_rate_limit(headers, expected):
+    headers = CaseInsensitiveDict(headers)
+    assert parse_rate_limit(headers, now=NOW) == expected
+
+
+def make_blueprint(rate_limiter, token="deadbeef"):
+    return OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client_id",
+        base_url="https://example.com",
+        storage=MemoryStorage({"access_token": token, "token_type": "bearer"}),
+        rate_limiter=rate_limiter,
+    )
+
+
+def add_response(path, remaining, reset, bucket=None):
+    headers = {"X-RateLimit-Remaining": str(remaining), "X-RateLimit-Reset": str(reset)}
+    if bucket:
+        headers["X-RateLimit-Bucket"] = bucket
+    responses.add(responses.GET, "https://example.com" + path, headers=headers)
+
+
+@responses.activate
+def test_rate_limiter_waits_for_reset():
+    reset = time.time() + 5
+    add_response("/user", remaining=1, reset=reset)
+    add_response("/user", remaining=0, reset=reset)
+    limiter = RateLimiter()
+    bp = make_blueprint(limiter)
+
+    clock = [reset - 2]
+
+    def sleep(delay):
+        clock[0] += delay
+        add_response("/user", remaining=5000, reset=reset + 3600)
+
+    with mock.patch("flask_dance.consumer.ratelimit.time") as fake_time:
+        fake_time.time.side_effect = lambda: clock[0]
+        fake_time.sleep.side_effect = sleep
+        bp.session.get("/user")
+        bp.session.get("/user")
+        assert not fake_time.sleep.called
+        assert limiter.limits(bp)[None].remaining == 0
+        # the budget is used up, so wait for it to be replenished
+        bp.session.get("/user")
+
+    fake_time.sleep.assert_called_once_with(2)
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_rate_limiter_exceeded():
+    add_response("/user", remaining=0, reset=time.time() + 3600)
+    limiter = RateLimiter(max_delay=60)
+    bp = make_blueprint(limiter)
+
+    bp.session.get("/user")
+    with pytest.raises(RateLimitExceeded):
+        bp.session.get("/user")
+    assert len(responses.calls) == 1
+
+    # other tokens have their own budget
+    other = make_blueprint(limiter, token="other")
+    other.session.get("/user")
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_rate_limiter_request_deadline():
+    add_response("/user", remaining=0, reset=time.time() + 30)
+    limiter = RateLimiter(max_delay=60)
+    bp = make_blueprint(limiter)
+    bp.request_deadline = 5
+    app = flask.Flask(__name__)
+    app.register_blueprint(bp)
+
+    with app.test_request_context("/"):
+        bp.session.get("/user")
+        # the budget is replenished within max_delay, but after the deadline
+        with mock.patch("flask_dance.consumer.ratelimit.time.sleep") as sleep:
+            with pytest.raises(RateLimitExceeded):
+                bp.session.get("/user")
+        assert not sleep.called
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_rate_limiter_counts_requests():
+    add_response("/user", remaining=2, reset=time.time() + 3600)
+    limiter = RateLimiter()
+    bp = make_blueprint(limiter)
+    bp.session.get("/user")
+
+    limiter.acquire(bp, bp.token, "GET", "https://example.com/user")
+    limiter.acquire(bp, bp.token, "GET", "https://example.com/user")
+    assert limiter.limits(bp)[None].remaining == 0
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(bp, bp.token, "GET", "https://example.com/user")
+
+
+@responses.activate
+def test_rate_limiter_buckets():
+    add_response(
+        "/channels/1/messages", remaining=0, reset=time.time() + 3600, bucket="a"
+    )
+    add_response("/users/@me", remaining=10, reset=time.time() + 3600, bucket="b")
+    limiter = RateLimiter()
+    bp = make_blueprint(limiter)
+
+    bp.session.get("/channels/1/messages")
+    bp.session.get("/users/@me")
+    bp.session.get("/users/@me")
+    with pytest.raises(RateLimitExceeded):
+        bp.session.get("/channels/1/messages")
+
+    limits = limiter.limits(bp)
+    assert limits["a"].remaining == 0
+    assert limits["b"].remaining == 10
@@ -0,0 +1,342 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import flask
+import pytest
+import responses
+
+from flask_dance.consumer import OAuth2ConsumerBlueprint, OAuth2Session
+from flask_dance.consumer.instrumentation import Instrumentation
+from flask_dance.consumer.metrics import MetricsRegistry
+from flask_dance.consumer.refresh import (
+    BaseRefreshLock,
+    FileRefreshLock,
+    ThreadRefreshLock,
+    refresh_expiring_tokens,
+    token_lock_key,
+)
+from flask_dance.consumer.storage import MemoryStorage
+
+EXPIRED_TOKEN = {
+    "access_token": "expired",
+    "refresh_token": "refresh-me",
+    "token_type": "bearer",
+    "expires_in": -10,
+}
+
+
+def expired_token():
+    token = dict(EXPIRED_TOKEN)
+    token["expires_at"] = time.time() - 10
+    return token
+
+
+def make_app(**kwargs):
+    blueprint = OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client_id",
+        client_secret="client_secret",
+        base_url="https://example.com",
+        token_url="https://example.com/oauth/access_token",
+        auto_refresh_url="https://example.com/oauth/access_token",
+        **kwargs,
+    )
+    app = flask.Flask(__name__)
+    app.secret_key = "secret"
+    app.register_blueprint(blueprint, url_prefix="/login")
+    return app, blueprint
+
+
+@responses.activate
+def test_refresh_with_lock():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/access_token",
+        body=json.dumps(
+            {
+                "access_token": "fresh",
+                "refresh_token": "refresh-again",
+                "token_type": "bearer",
+                "expires_in": 3600,
+            }
+        ),
+    )
+    responses.add(responses.GET, "https://example.com/user")
+    storage = MemoryStorage(expired_token())
+    app, bp = make_app(storage=storage, refresh_lock=ThreadRefreshLock())
+
+    with app.test_request_context("/"):
+        bp.session.get("/user")
+
+    assert len(responses.calls) == 2
+    refresh_request = responses.calls[0].request
+    assert refresh_request.url == "https://example.com/oauth/access_token"
+    assert "refresh_token=refresh-me" in refresh_request.body
+    assert responses.calls[1].request.headers["Authorization"] == "Bearer fresh"
+    assert storage.token["access_token"] == "fresh"
+    assert storage.token["expires_at"] > time.time()
+
+
+@responses.activate
+def test_refresh_with_lock_already_refreshed():
+    responses.add(responses.GET, "https://example.com/user")
+    storage = MemoryStorage(expired_token())
+
+    class OtherWorkerRefreshed(BaseRefreshLock):
+        "While waiting for the lock, another worker refreshes the token"
+
+        @contextmanager
+        def lock(self, blueprint, token):
+            storage.token = {
+                "access_token": "refreshed-elsewhere",
+                "token_type": "bearer",
+                "expires_in": 3600,
+                "expires_at": time.time() + 3600,
+            }
+            yield None
+
+    app, bp = make_app(storage=storage, refresh_lock=OtherWorkerRefreshed())
+
+    with app.test_request_context("/"):
+        bp.session.get("/user")
+
+    # no refresh request, just the API call with the new token
+    assert len(responses.calls) == 1
+    request = responses.calls[0].request
+    assert request.headers["Authorization"] == "Bearer refreshed-elsewhere"
+
+
+@responses.activate
+def test_no_refresh_when_not_expired():
+    responses.add(responses.GET, "https://example.com/user")
+    token = {
+        "access_token": "valid",
+        "token_type": "bearer",
+        "expires_at": time.time() + 3600,
+    }
+    app, bp = make_app(storage=MemoryStorage(token), refresh_lock=ThreadRefreshLock())
+
+    with app.test_request_context("/"):
+        bp.session.get("/user")
+
+    assert len(responses.calls) == 1
+
+
+def test_token_lock_key():
+    bp = OAuth2ConsumerBlueprint("test-service", __name__)
+    key = token_lock_key(bp, {"access_token": "a", "refresh_token": "secret"})
+    assert key.startswith("test-service-")
+    assert "secret" not in key
+    assert key == token_lock_key(bp, {"access_token": "b", "refresh_token": "secret"})
+    assert key != token_lock_key(bp, {"access_token": "a", "refresh_token": "other"})
+
+
+def assert_mutually_exclusive(refresh_lock):
+    bp = OAuth2ConsumerBlueprint("test-service", __name__)
+    token = {"refresh_token": "secret"}
+    first_has_lock = threading.Event()
+    release_first = threading.Event()
+    events = []
+
+    def first():
+        with refresh_lock.lock(bp, token):
+            events.append("first acquired")
+            first_has_lock.set()
+            release_first.wait(5)
+            events.append("first released")
+
+    def second():
+        first_has_lock.wait(5)
+        with refresh_lock.lock(bp, token):
+            events.append("second acquired")
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    for thread in threads:
+        thread.start()
+    first_has_lock.wait(5)
+    time.sleep(0.05)
+    release_first.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert events == ["first acquired", "first released", "second acquired"]
+
+
+def test_thread_refresh_lock():
+    assert_mutually_exclusive(ThreadRefreshLock())
+
+
+def test_file_refresh_lock(tmp_path):
+    pytest.importorskip("fcntl")
+    refresh_lock = FileRefreshLock(str(tmp_path / "locks"))
+    assert_mutually_exclusive(refresh_lock)
+    assert len(list((tmp_path / "locks").iterdir())) == 1
+
+
+@responses.activate
+def test_refresh_expiring_tokens():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/access_token",
+        body='{"access_token":"fresh","token_type":"bearer","expires_in":3600}',
+    )
+    token = {
+        "access_token": "expiring",
+        "refresh_token": "refresh-me",
+        "token_type": "bearer",
+        "expires_at": time.time() + 60,
+    }
+    storage = MemoryStorage(token)
+    app, bp = make_app(storage=storage)
+
+    with app.app_context():
+        assert refresh_expiring_tokens(bp, window=300) == (1, 0)
+
+    assert len(responses.calls) == 1
+    assert "refresh_token=refresh-me" in responses.calls[0].request.body
+    assert storage.token["access_token"] == "fresh"
+    # the refresh token is kept, if the provider doesn't send a new one
+    assert storage.token["refresh_token"] == "refresh-me"
+    assert storage.token["expires_at"] > time.time() + 3000
+
+
+@responses.activate
+def test_refresh_expiring_tokens_uses_blueprint_session():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/access_token",
+        body='{"access_token":"fresh","token_type":"bearer","expires_in":3600}',
+    )
+
+    class AgentSession(OAuth2Session):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.headers["User-Agent"] = "myapp/1.0"
+
+    metrics = MetricsRegistry()
+    storage = MemoryStorage(expired_token())
+    app, bp = make_app(storage=storage, session_class=AgentSession, metrics=metrics)
+
+    with app.app_context():
+        assert refresh_expiring_tokens(bp, window=300) == (1, 0)
+
+    assert responses.calls[0].request.headers["User-Agent"] == "myapp/1.0"
+    assert metrics.get("token_refreshes", "test-service") == 1
+    assert storage.token["access_token"] == "fresh"
+
+
+@responses.activate
+def test_refresh_expiring_tokens_uses_token_updater():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/access_token",
+        body='{"access_token":"fresh","token_type":"bearer","expires_in":3600}',
+    )
+    steps = []
+    instrumentation = Instrumentation(lambda name, *args: steps.append(name))
+    storage = MemoryStorage(expired_token())
+    app, bp = make_app(storage=storage, instrumentation=instrumentation)
+    updated = []
+
+    def session_created(session):
+        original = session.token_updater
+
+        def token_updater(token):
+            updated.append(token["access_token"])
+            original(token)
+
+        session.token_updater = token_updater
+        return session
+
+    bp.session_created = session_created
+
+    with app.app_context():
+        assert refresh_expiring_tokens(bp, window=300) == (1, 0)
+
+    # the token is saved the same way as a refresh during a request
+    assert updated == ["fresh"]
+    assert "storage.set" in steps
+    assert storage.token["access_token"] == "fresh"
+
+
+@responses.activate
+def test_refresh_expiring_tokens_with_lock():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/access_token",
+        body='{"access_token":"fresh","token_type":"bearer","expires_in":3600}',
+    )
+    saved_while_locked = []
+
+    class RecordingLock(BaseRefreshLock):
+        locked = False
+
+        @contextmanager
+        def lock(self, blueprint, token):
+            self.locked = True
+            try:
+                yield None
+            finally:
+                self.locked = False
+
+    refresh_lock = RecordingLock()
+
+    class RecordingStorage(MemoryStorage):
+        def set(self, blueprint, token):
+            saved_while_locked.append(refresh_lock.locked)
+            super().set(blueprint, token)
+
+    storage = RecordingStorage(expired_token())
+    app, bp = make_app(storage=storage, refresh_lock=refresh_lock)
+
+    with app.app_context():
+        assert refresh_expiring_tokens(bp, window=300) == (1, 0)
+
+    assert len(responses.calls) == 1
+    assert storage.token["access_token"] == "fresh"
+    assert saved_while_locked == [True]
+
+
+@responses.activate
+def test_refresh_expiring_tokens_outside_window():
+    token = {
+        "access_token": "valid",
+        "refresh_token": "refresh-me",
+        "token_type": "bearer",
+        "expires_at": time.time() + 3600,
+    }
+    storage = MemoryStorage(token)
+    app, bp = make_app(storage=storage)
+
+    with app.app_context():
+        assert refresh_expiring_tokens(bp, window=300) == (0, 0)
+
+    assert len(responses.calls) == 0
+    assert storage.token["access_token"] == "valid"
+
+
+@responses.activate
+def test_refresh_expiring_tokens_failure():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/access_token",
+        status=400,
+        body='{"error":"invalid_grant"}',
+    )
+    storage = MemoryStorage(expired_token())
+    app, bp = make_app(storage=storage)
+
+    with app.app_context():
+        assert refresh_expiring_tokens(bp, window=300) == (0, 1)
+
+    assert storage.token["access_token"] == "expired"
+
+
+def test_refresh_expiring_tokens_unsupported_storage():
+    app, bp = make_app()
+    with app.app_context():
+        with pytest.raises(NotImplementedError):
+            refresh_expiring_tokens(bp)
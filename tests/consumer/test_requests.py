@@ -1,9 +1,24 @@
+import threading
+import time
 from unittest import mock
 
+import flask
 import pytest
 import responses
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, HTTPError
+from responses import matchers
+from werkzeug.local import LocalProxy
 
-from flask_dance.consumer.requests import OAuth1Session, OAuth2Session
+from flask_dance.consumer import OAuth2ConsumerBlueprint
+from flask_dance.consumer.requests import (
+    OAuth1Session,
+    OAuth2Session,
+    fan_out,
+    get_shared_adapter,
+)
+from flask_dance.consumer.storage import MemoryStorage
+from flask_dance.utils import LRUCache
 
 FAKE_OAUTH1_TOKEN = {"oauth_token": "abcdefg", "oauth_token_secret": "hijklmnop"}
 FAKE_OAUTH2_TOKEN = {
@@ -40,6 +55,21 @@ def test_oauth1session_request():
     assert sess.load_token.called
 
 
+@responses.activate
+def test_oauth1session_request_ignores_mock_features():
+    responses.add(responses.GET, "https://example.com/test", body="ok")
+
+    # every attribute of a mock is set, but none of them are real features
+    bp = mock.Mock(token=None)
+    sess = OAuth1Session(client_key="ckey", client_secret="csec", blueprint=bp)
+    resp = sess.get("https://example.com/test")
+    assert resp.text == "ok"
+    assert len(responses.calls) == 1
+    assert not bp.retry_policy.send.called
+    assert not bp.circuit_breaker.call.called
+    assert not bp.instrumentation.span.called
+
+
 @responses.activate
 def test_oauth1session_should_load_token():
     responses.add(responses.GET, "https://example.com/test")
@@ -51,6 +81,42 @@ def test_oauth1session_should_load_token():
     assert not sess.load_token.called
 
 
+@responses.activate
+def test_oauth2session_request_ignores_mock_features():
+    responses.add(responses.GET, "https://example.com/user", json={"login": "o"})
+
+    # a mock blueprint has a response_cache attribute, but it isn't a cache
+    bp = mock.Mock(token=FAKE_OAUTH2_TOKEN)
+    sess = OAuth2Session(client_id="cid", blueprint=bp)
+    resp = sess.get("https://example.com/user")
+    assert resp.status_code == 200
+    assert resp.json() == {"login": "o"}
+    assert not bp.response_cache.get.called
+
+
+@responses.activate
+def test_oauth2session_refresh_ignores_mock_lock():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/token",
+        json={"access_token": "new", "token_type": "bearer", "expires_in": 3600},
+    )
+    responses.add(responses.GET, "https://example.com/user")
+
+    token = dict(FAKE_OAUTH2_TOKEN, refresh_token="refresh", expires_at=1)
+    bp = mock.Mock(token=token, client_id="cid", client_secret="secret")
+    updater = mock.Mock()
+    sess = OAuth2Session(
+        client_id="cid",
+        blueprint=bp,
+        auto_refresh_url="https://example.com/oauth/token",
+        token_updater=updater,
+    )
+    assert sess.get("https://example.com/user").status_code == 200
+    assert updater.call_args[0][0]["access_token"] == "new"
+    assert not bp.refresh_lock.lock.called
+
+
 def test_oauth2session_authorized():
     bp = mock.Mock(token=FAKE_OAUTH2_TOKEN)
     sess = OAuth2Session(client_id="cid", blueprint=bp)
@@ -85,3 +151,463 @@ def test_oauth2session_unset_access_token():
     bp = mock.Mock(token=None)
     sess = OAuth2Session(client_id="cid", blueprint=bp)
     assert sess.access_token == None
+
+
+def test_get_shared_adapter():
+    adapter = get_shared_adapter()
+    assert isinstance(adapter, HTTPAdapter)
+    assert get_shared_adapter() is adapter
+
+
+def test_get_shared_adapter_after_fork(monkeypatch):
+    app = flask.Flask(__name__)
+    app.secret_key = "secret"
+    bp = OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client_id",
+        base_url="https://example.com",
+        transport_adapter=get_shared_adapter,
+    )
+    app.register_blueprint(bp)
+
+    parent_adapter = get_shared_adapter()
+    with app.test_request_context("/"):
+        assert bp.session.get_adapter("https://example.com") is parent_adapter
+
+    # what a forked child process does
+    monkeypatch.setattr("flask_dance.consumer.requests._shared_adapter", None)
+    child_adapter = get_shared_adapter()
+    assert child_adapter is not parent_adapter
+    with app.test_request_context("/"):
+        assert bp.session.get_adapter("https://example.com") is child_adapter
+    session = bp.offline_session(1, {"access_token": "abc"})
+    assert session.get_adapter("https://example.com") is child_adapter
+
+
+def make_fan_out_app():
+    app = flask.Flask(__name__)
+    app.secret_key = "secret"
+    for name in ("first", "second"):
+        bp = OAuth2ConsumerBlueprint(
+            name,
+            __name__,
+            client_id="client_id",
+            base_url=f"https://{name}.example.com",
+            storage=MemoryStorage({"access_token": name, "token_type": "bearer"}),
+        )
+        app.register_blueprint(bp, url_prefix=f"/{name}")
+
+        @app.before_request
+        def set_applocal_blueprint(bp=bp):
+            setattr(flask.g, f"test_{bp.name}", bp)
+
+    return app
+
+
+@responses.activate
+def test_fan_out():
+    responses.add(responses.GET, "https://first.example.com/user", body="one")
+    responses.add(responses.POST, "https://second.example.com/item", body="two")
+    app = make_fan_out_app()
+    # like the proxies in flask_dance.contrib, these only work in a request
+    first = LocalProxy(lambda: flask.g.test_first.session)
+    second = LocalProxy(lambda: flask.g.test_second.session)
+
+    with app.test_request_context("/"):
+        app.preprocess_request()
+        results = fan_out(
+            [
+                (first, "GET", "/user"),
+                (second, "POST", "/item", {"data": {"name": "thing"}}),
+            ]
+        )
+
+    assert [resp.text for resp in results] == ["one", "two"]
+    headers = {call.request.url: call.request.headers for call in responses.calls}
+    assert headers["https://first.example.com/user"]["Authorization"] == "Bearer first"
+    assert (
+        headers["https://second.example.com/item"]["Authorization"] == "Bearer second"
+    )
+
+
+@responses.activate
+def test_fan_out_exceptions():
+    responses.add(responses.GET, "https://first.example.com/user", body="one")
+    app = make_fan_out_app()
+
+    with app.test_request_context("/"):
+        sessions = [bp.session for bp in app.blueprints.values()]
+        calls = [(sessions[0], "GET", "/user"), (sessions[1], "GET", "/missing")]
+        with pytest.raises(ConnectionError):
+            fan_out(calls)
+        results = fan_out(calls, return_exceptions=True)
+
+    assert results[0].text == "one"
+    assert isinstance(results[1], ConnectionError)
+
+
+def test_fan_out_nothing():
+    assert fan_out([]) == []
+
+
+class ThreadRecordingStorage(MemoryStorage):
+    def __init__(self, token):
+        super().__init__(token)
+        self.set_threads = []
+
+    def set(self, blueprint, token):
+        self.set_threads.append(threading.current_thread())
+        super().set(blueprint, token)
+
+
+@responses.activate
+def test_fan_out_refreshes_in_calling_thread():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/token",
+        body='{"access_token":"fresh","token_type":"bearer","expires_in":3600}',
+    )
+    responses.add(responses.GET, "https://example.com/user", body="me")
+    storage = ThreadRecordingStorage(
+        {
+            "access_token": "expired",
+            "refresh_token": "refresh-me",
+            "token_type": "bearer",
+            "expires_at": time.time() - 10,
+        }
+    )
+    bp = OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client_id",
+        client_secret="client_secret",
+        base_url="https://example.com",
+        auto_refresh_url="https://example.com/oauth/token",
+        storage=storage,
+    )
+    app = flask.Flask(__name__)
+    app.register_blueprint(bp, url_prefix="/login")
+
+    with app.test_request_context("/"):
+        results = fan_out([(bp.session, "GET", "/user")])
+
+    assert results[0].text == "me"
+    assert responses.calls[1].request.headers["Authorization"] == "Bearer fresh"
+    assert storage.set_threads == [threading.current_thread()]
+
+
+@responses.activate
+def test_fan_out_collects_token_updates():
+    storage = ThreadRecordingStorage({"access_token": "old", "token_type": "bearer"})
+    bp = OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client_id",
+        base_url="https://example.com",
+        storage=storage,
+    )
+    app = flask.Flask(__name__)
+    app.register_blueprint(bp, url_prefix="/login")
+    active = []
+    overlapped = []
+
+    def callback(request):
+        # a session is never used by two threads at once
+        overlapped.append(bool(active))
+        active.append(request)
+        time.sleep(0.01)
+        # like requests-oauthlib does after refreshing an expired token
+        bp.session.token_updater({"access_token": request.url[-1]})
+        active.pop()
+        return (200, {}, "ok")
+
+    responses.add_callback(responses.GET, "https://example.com/1", callback)
+    responses.add_callback(responses.GET, "https://example.com/2", callback)
+
+    with app.test_request_context("/"):
+        session = bp.session
+        results = fan_out([(session, "GET", "/1"), (session, "GET", "/2")])
+        updater = session.token_updater
+
+    assert [resp.text for resp in results] == ["ok", "ok"]
+    assert overlapped == [False, False]
+    # the last token is saved once, from the calling thread
+    assert storage.set_threads == [threading.current_thread()]
+    assert storage.token["access_token"] == "2"
+    # the original token updater is put back
+    assert updater.__name__ == "token_updater"
+    assert updater.__qualname__.startswith("OAuth2ConsumerBlueprint")
+
+
+def make_paginating_session():
+    bp = OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="cid",
+        base_url="https://example.com",
+        storage=MemoryStorage(FAKE_OAUTH2_TOKEN),
+    )
+    return OAuth2Session(client_id="cid", blueprint=bp, base_url="https://example.com")
+
+
+@responses.activate
+def test_oauth2session_paginate_link_header():
+    responses.add(
+        responses.GET,
+        "https://example.com/repos",
+        json=[1, 2],
+        headers={"Link": '<https://example.com/repos?per_page=2&page=2>; rel="next"'},
+        match=[matchers.query_param_matcher({"per_page": "2"})],
+    )
+    responses.add(
+        responses.GET,
+        "https://example.com/repos",
+        json=[3],
+        match=[matchers.query_param_matcher({"per_page": "2", "page": "2"})],
+    )
+    sess = make_paginating_session()
+
+    results = sess.paginate("/repos", params={"per_page": 2})
+    assert next(results) == 1
+    # pages are only requested when they are needed
+    assert len(responses.calls) == 1
+    assert list(results) == [2, 3]
+    assert len(responses.calls) == 2
+    assert responses.calls[1].request.headers["Authorization"] == "Bearer deadbeef"
+
+
+@responses.activate
+def test_oauth2session_paginate_next_url():
+    responses.add(
+        responses.GET,
+        "https://example.com/me/messages",
+        json={
+            "value": ["a", "b"],
+            "@odata.nextLink": "https://example.com/me/messages?$skiptoken=abc",
+        },
+        match=[matchers.query_param_matcher({})],
+    )
+    responses.add(
+        responses.GET,
+        "https://example.com/me/messages",
+        json={"value": ["c"]},
+        match=[matchers.query_param_matcher({"$skiptoken": "abc"})],
+    )
+    sess = make_paginating_session()
+
+    results = sess.paginate("/me/messages", items="value", next_page="@odata.nextLink")
+    assert list(results) == ["a", "b", "c"]
+
+
+@responses.activate
+def test_oauth2session_paginate_cursor():
+    responses.add(
+        responses.GET,
+        "https://example.com/conversations",
+        json={"channels": ["a", "b"], "response_metadata": {"next_cursor": "xyz"}},
+        match=[matchers.query_param_matcher({"limit": "2"})],
+    )
+    responses.add(
+        responses.GET,
+        "https://example.com/conversations",
+        json={"channels": ["c"], "response_metadata": {"next_cursor": ""}},
+        match=[matchers.query_param_matcher({"limit": "2", "cursor": "xyz"})],
+    )
+    sess = make_paginating_session()
+
+    results = sess.paginate(
+        "/conversations",
+        params={"limit": 2},
+        items="channels",
+        next_page="response_metadata.next_cursor",
+        cursor_param="cursor",
+        prefetch=True,
+    )
+    assert list(results) == ["a", "b", "c"]
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_oauth2session_paginate_prefetch():
+    responses.add(
+        responses.GET,
+        "https://example.com/items",
+        json={"items": [1], "next": "https://example.com/items?page=2"},
+        match=[matchers.query_param_matcher({})],
+    )
+    responses.add(
+        responses.GET,
+        "https://example.com/items",
+        json={"items": [2], "next": None},
+        match=[matchers.query_param_matcher({"page": "2"})],
+    )
+    sess = make_paginating_session()
+
+    results = sess.paginate("/items", items="items", next_page="next", prefetch=True)
+    assert next(results) == 1
+    # the second page is requested while the first is being used
+    for _ in range(100):
+        if len(responses.calls) == 2:
+            break
+        time.sleep(0.01)
+    assert len(responses.calls) == 2
+    assert list(results) == [2]
+
+
+@responses.activate
+def test_oauth2session_paginate_prefetch_saves_tokens_in_calling_thread():
+    storage = ThreadRecordingStorage({"access_token": "old", "token_type": "bearer"})
+    bp = OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client_id",
+        base_url="https://example.com",
+        auto_refresh_url="https://example.com/oauth/token",
+        storage=storage,
+    )
+    app = flask.Flask(__name__)
+    app.register_blueprint(bp, url_prefix="/login")
+    threads = []
+
+    def first_page(request):
+        threads.append(threading.current_thread())
+        # the token expires before the second page is requested
+        bp.session.token = {
+            "access_token": "old",
+            "refresh_token": "refresh-me",
+            "token_type": "bearer",
+            "expires_at": time.time() - 10,
+        }
+        return (200, {}, '{"items": [1], "next": "https://example.com/items?page=2"}')
+
+    def second_page(request):
+        threads.append(threading.current_thread())
+        assert request.headers["Authorization"] == "Bearer fresh"
+        return (200, {}, '{"items": [2], "next": null}')
+
+    responses.add_callback(
+        responses.GET,
+        "https://example.com/items",
+        first_page,
+        match=[matchers.query_param_matcher({})],
+    )
+    responses.add_callback(
+        responses.GET,
+        "https://example.com/items",
+        second_page,
+        match=[matchers.query_param_matcher({"page": "2"})],
+    )
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/token",
+        body='{"access_token":"fresh","token_type":"bearer","expires_in":3600}',
+    )
+
+    with app.test_request_context("/"):
+        session = bp.session
+        results = session.paginate(
+            "/items", items="items", next_page="next", prefetch=True
+        )
+        assert list(results) == [1, 2]
+        assert session.access_token == "fresh"
+
+    # the second page is requested by another thread, with its own session
+    assert threads[0] is threading.current_thread()
+    assert threads[1] is not threading.current_thread()
+    # but the refreshed token is saved by the calling thread
+    assert storage.set_threads == [threading.current_thread()]
+    assert storage.token["access_token"] == "fresh"
+
+
+@responses.activate
+def test_oauth2session_paginate_error():
+    responses.add(responses.GET, "https://example.com/repos", status=401)
+    sess = make_paginating_session()
+
+    with pytest.raises(HTTPError):
+        list(sess.paginate("/repos"))
+
+
+def make_caching_blueprint(token=FAKE_OAUTH2_TOKEN):
+    return OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client_id",
+        base_url="https://example.com",
+        storage=MemoryStorage(token),
+        response_cache=LRUCache(),
+    )
+
+
+@responses.activate
+def test_oauth2session_response_cache():
+    responses.add(
+        responses.GET,
+        "https://example.com/user",
+        json={"login": "octocat"},
+        headers={"ETag": '"abc"', "X-RateLimit-Remaining": "59"},
+    )
+    responses.add(
+        responses.GET,
+        "https://example.com/user",
+        status=304,
+        headers={"ETag": '"abc"', "X-RateLimit-Remaining": "58"},
+    )
+    bp = make_caching_blueprint()
+
+    first = bp.session.get("/user")
+    second = bp.session.get("/user")
+
+    assert "If-None-Match" not in responses.calls[0].request.headers
+    assert responses.calls[1].request.headers["If-None-Match"] == '"abc"'
+    assert responses.calls[1].request.headers["Authorization"] == "Bearer deadbeef"
+    assert second.status_code == 200
+    assert second.json() == first.json() == {"login": "octocat"}
+    assert second.headers["X-RateLimit-Remaining"] == "58"
+
+
+@responses.activate
+def test_oauth2session_response_cache_modified():
+    responses.add(
+        responses.GET,
+        "https://example.com/user",
+        json={"login": "octocat"},
+        headers={"Last-Modified": "Tue, 01 Oct 2024 00:00:00 GMT"},
+    )
+    responses.add(
+        responses.GET,
+        "https://example.com/user",
+        json={"login": "monalisa"},
+        headers={"Last-Modified": "Wed, 02 Oct 2024 00:00:00 GMT"},
+    )
+    responses.add(responses.GET, "https://example.com/user", status=304)
+    bp = make_caching_blueprint()
+
+    assert bp.session.get("/user").json() == {"login": "octocat"}
+    assert bp.session.get("/user").json() == {"login": "monalisa"}
+    assert bp.session.get("/user").json() == {"login": "monalisa"}
+    assert (
+        responses.calls[2].request.headers["If-Modified-Since"]
+        == "Wed, 02 Oct 2024 00:00:00 GMT"
+    )
+
+
+@responses.activate
+def test_oauth2session_response_cache_per_user():
+    responses.add(
+        responses.GET,
+        "https://example.com/user",
+        json={"login": "octocat"},
+        headers={"ETag": '"abc"'},
+    )
+    bp = make_caching_blueprint()
+    bp.session.get("/user")
+
+    bp.storage = MemoryStorage({"access_token": "other", "token_type": "bearer"})
+    bp.session.get("/user")
+    assert "If-None-Match" not in responses.calls[1].request.headers
+    # other methods are never cached
+    responses.add(responses.POST, "https://example.com/user")
+    bp.session.post("/user")
+    assert "If-None-Match" not in responses.calls[2].request.headers
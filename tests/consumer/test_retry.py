@@ -0,0 +1,177 @@
+from unittest import mock
+
+import pytest
+import responses
+from requests.exceptions import ConnectionError
+
+from flask_dance.consumer import OAuth1ConsumerBlueprint, OAuth2ConsumerBlueprint
+from flask_dance.consumer.retry import RetryPolicy
+from flask_dance.consumer.storage import MemoryStorage
+
+FAKE_OAUTH2_TOKEN = {
+    "access_token": "deadbeef",
+    "refresh_token": "refresh-me",
+    "token_type": "bearer",
+}
+
+
+@pytest.fixture
+def sleep():
+    with mock.patch("flask_dance.consumer.retry.time.sleep") as sleep:
+        yield sleep
+
+
+def make_blueprint(retry_policy, **kwargs):
+    return OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client_id",
+        client_secret="client_secret",
+        base_url="https://example.com",
+        storage=MemoryStorage(dict(FAKE_OAUTH2_TOKEN)),
+        retry_policy=retry_policy,
+        **kwargs,
+    )
+
+
+@responses.activate
+def test_retry_server_error(sleep):
+    responses.add(responses.GET, "https://example.com/user", status=503)
+    responses.add(responses.GET, "https://example.com/user", status=502)
+    responses.add(responses.GET, "https://example.com/user", json={"ok": True})
+    bp = make_blueprint(RetryPolicy(backoff_factor=1))
+
+    resp = bp.session.get("/user")
+
+    assert resp.json() == {"ok": True}
+    assert len(responses.calls) == 3
+    assert sleep.call_count == 2
+    # the backoff is random, but grows with every attempt
+    assert 0 <= sleep.call_args_list[0][0][0] <= 1
+    assert 0 <= sleep.call_args_list[1][0][0] <= 2
+
+
+@responses.activate
+def test_retry_after(sleep):
+    responses.add(
+        responses.GET,
+        "https://example.com/user",
+        status=429,
+        headers={"Retry-After": "7"},
+    )
+    responses.add(responses.GET, "https://example.com/user")
+    bp = make_blueprint(RetryPolicy())
+
+    assert bp.session.get("/user").status_code == 200
+    sleep.assert_called_once_with(7.0)
+
+
+@responses.activate
+def test_retry_after_too_long(sleep):
+    responses.add(
+        responses.GET,
+        "https://example.com/user",
+        status=429,
+        headers={"Retry-After": "3600"},
+    )
+    bp = make_blueprint(RetryPolicy(max_backoff=30))
+
+    assert bp.session.get("/user").status_code == 429
+    assert not sleep.called
+
+
+@responses.activate
+def test_retry_gives_up(sleep):
+    responses.add(responses.GET, "https://example.com/user", status=500)
+    bp = make_blueprint(RetryPolicy(total=2))
+
+    assert bp.session.get("/user").status_code == 500
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_retry_deadline(sleep):
+    responses.add(
+        responses.GET,
+        "https://example.com/user",
+        status=503,
+        headers={"Retry-After": "5"},
+    )
+    bp = make_blueprint(RetryPolicy(deadline=2))
+
+    assert bp.session.get("/user").status_code == 503
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_no_retry_post(sleep):
+    responses.add(responses.POST, "https://example.com/issues", status=503)
+    bp = make_blueprint(RetryPolicy())
+
+    assert bp.session.post("/issues").status_code == 503
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_retry_connection_error(sleep):
+    responses.add(
+        responses.GET, "https://example.com/user", body=ConnectionError("reset")
+    )
+    responses.add(responses.GET, "https://example.com/user")
+    bp = make_blueprint(RetryPolicy())
+
+    assert bp.session.get("/user").status_code == 200
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_retry_refreshes_once_on_unauthorized(sleep):
+    responses.add(responses.GET, "https://example.com/user", status=401)
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/refresh",
+        json={"access_token": "fresh", "token_type": "bearer", "expires_in": 3600},
+    )
+    bp = make_blueprint(
+        RetryPolicy(), auto_refresh_url="https://example.com/oauth/refresh"
+    )
+
+    # the provider keeps rejecting the token, so only refresh it once
+    assert bp.session.get("/user").status_code == 401
+
+    urls = [call.request.url for call in responses.calls]
+    assert urls == [
+        "https://example.com/user",
+        "https://example.com/oauth/refresh",
+        "https://example.com/user",
+    ]
+    assert responses.calls[2].request.headers["Authorization"] == "Bearer fresh"
+    assert bp.storage.token["access_token"] == "fresh"
+    assert not sleep.called
+
+
+@responses.activate
+def test_no_refresh_without_auto_refresh_url(sleep):
+    responses.add(responses.GET, "https://example.com/user", status=401)
+    bp = make_blueprint(RetryPolicy())
+
+    assert bp.session.get("/user").status_code == 401
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_retry_oauth1(sleep):
+    responses.add(responses.GET, "https://example.com/user", status=502)
+    responses.add(responses.GET, "https://example.com/user")
+    bp = OAuth1ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_key="client_key",
+        client_secret="client_secret",
+        base_url="https://example.com",
+        storage=MemoryStorage({"oauth_token": "a", "oauth_token_secret": "b"}),
+        retry_policy=RetryPolicy(),
+    )
+
+    assert bp.session.get("/user").status_code == 200
+    assert len(responses.calls) == 2
@@ -0,0 +1,155 @@
+from unittest import mock
+
+import flask
+import pytest
+import responses
+
+from flask_dance.consumer import OAuth1ConsumerBlueprint, OAuth2ConsumerBlueprint
+from flask_dance.consumer.requests import OAuth2Session
+from flask_dance.consumer.retry import RetryPolicy
+from flask_dance.consumer.storage import MemoryStorage
+from flask_dance.consumer.timeouts import (
+    DeadlineExceeded,
+    request_deadline,
+    request_timeout,
+)
+
+FAKE_OAUTH2_TOKEN = {"access_token": "deadbeef", "token_type": "bearer"}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    clock = FakeClock()
+    with mock.patch("flask_dance.consumer.timeouts.time.monotonic", clock):
+        yield clock
+
+
+def make_app(**kwargs):
+    app = flask.Flask(__name__)
+    app.secret_key = "secret"
+    bp = OAuth2ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_id="client_id",
+        client_secret="client_secret",
+        base_url="https://example.com",
+        authorization_url="https://example.com/oauth/authorize",
+        token_url="https://example.com/oauth/access_token",
+        storage=MemoryStorage(FAKE_OAUTH2_TOKEN),
+        **kwargs,
+    )
+    app.register_blueprint(bp, url_prefix="/login")
+    app.config["SERVER_NAME"] = "a.b.c"
+    return app, bp
+
+
+@responses.activate
+def test_default_timeout():
+    responses.add(responses.GET, "https://example.com/user")
+    app, bp = make_app(timeout=(3.05, 10))
+
+    with app.test_request_context("/"):
+        bp.session.get("/user")
+        bp.session.get("/user", timeout=1)
+
+    assert responses.calls[0].request.req_kwargs["timeout"] == (3.05, 10)
+    assert responses.calls[1].request.req_kwargs["timeout"] == 1
+
+
+@responses.activate
+def test_default_timeout_oauth1():
+    responses.add(responses.GET, "https://example.com/user")
+    bp = OAuth1ConsumerBlueprint(
+        "test-service",
+        __name__,
+        client_key="client_key",
+        client_secret="client_secret",
+        base_url="https://example.com",
+        storage=MemoryStorage({"oauth_token": "a", "oauth_token_secret": "b"}),
+        timeout=5,
+    )
+
+    bp.session.get("/user")
+    assert responses.calls[0].request.req_kwargs["timeout"] == 5
+
+
+@responses.activate
+def test_fetch_token_timeout():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/access_token",
+        json={"access_token": "foobar", "token_type": "bearer"},
+    )
+    app, bp = make_app(timeout=5)
+
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess["test-service_oauth_state"] = "random-string"
+        resp = client.get(
+            "/login/test-service/authorized?code=secret-code&state=random-string",
+            base_url="https://a.b.c",
+        )
+
+    assert responses.calls[0].request.req_kwargs["timeout"] == 5
+
+
+@responses.activate
+def test_request_deadline(clock):
+    responses.add(responses.GET, "https://example.com/user")
+    app, bp = make_app(timeout=(3.05, 10), request_deadline=8)
+
+    with app.test_request_context("/"):
+        bp.session.get("/user")
+        clock.now += 6
+        bp.session.get("/user")
+        clock.now += 2
+        with pytest.raises(DeadlineExceeded):
+            bp.session.get("/user")
+
+    assert responses.calls[0].request.req_kwargs["timeout"] == (3.05, 8)
+    assert responses.calls[1].request.req_kwargs["timeout"] == (2, 2)
+    assert len(responses.calls) == 2
+
+    # every Flask request gets its own deadline
+    with app.test_request_context("/"):
+        bp.session.get("/user")
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_request_deadline_not_retried(clock):
+    responses.add(responses.GET, "https://example.com/user", status=503)
+    app, bp = make_app(request_deadline=5, retry_policy=RetryPolicy(backoff_factor=0))
+
+    def sleep(seconds):
+        clock.now += 3
+
+    with mock.patch("flask_dance.consumer.retry.time.sleep", sleep):
+        with app.test_request_context("/"):
+            with pytest.raises(DeadlineExceeded):
+                bp.session.get("/user")
+
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_mock_blueprint_has_no_timeouts():
+    responses.add(responses.GET, "https://example.com/user")
+    bp = mock.Mock(token=FAKE_OAUTH2_TOKEN)
+    app = flask.Flask(__name__)
+
+    with app.test_request_context("/"):
+        assert request_deadline(bp) is None
+        assert request_timeout(bp) is None
+        assert request_timeout(bp, 5) == 5
+        sess = OAuth2Session(client_id="cid", blueprint=bp)
+        assert sess.get("https://example.com/user").status_code == 200
+    assert responses.calls[0].request.req_kwargs["timeout"] is None
@@ -82,3 +82,22 @@ def test_context_local(make_app):
         github.get("https://google.com")
         request = responses.calls[1].request
         assert request.headers["Authorization"] == "Bearer app2"
+
+
+def test_session_created_lazily(make_app):
+    app = make_app("foo", "bar")
+    github_bp = app.blueprints["github"]
+
+    @app.route("/health")
+    def health():
+        return "ok"
+
+    with app.test_client() as client:
+        client.get("/health")
+        assert "session" not in github_bp.__dict__
+
+    with app.test_request_context("/"):
+        app.preprocess_request()
+        assert "session" not in github_bp.__dict__
+        assert github.client_id == "foo"
+        assert "session" in github_bp.__dict__
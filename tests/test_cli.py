@@ -0,0 +1,101 @@
+import time
+
+import flask
+import responses
+
+from flask_dance.cli import dance
+from flask_dance.consumer import OAuth2ConsumerBlueprint
+from flask_dance.consumer.storage import MemoryStorage
+
+
+def make_app(**blueprints):
+    app = flask.Flask(__name__)
+    for name, kwargs in blueprints.items():
+        bp = OAuth2ConsumerBlueprint(
+            name,
+            __name__,
+            client_id="client_id",
+            client_secret="client_secret",
+            base_url="https://example.com",
+            **kwargs,
+        )
+        app.register_blueprint(bp, url_prefix=f"/{name}")
+    app.cli.add_command(dance)
+    return app
+
+
+@responses.activate
+def test_refresh():
+    responses.add(
+        responses.POST,
+        "https://example.com/oauth/refresh",
+        body='{"access_token":"fresh","token_type":"bearer","expires_in":3600}',
+    )
+    storage = MemoryStorage(
+        {
+            "access_token": "expiring",
+            "refresh_token": "refresh-me",
+            "token_type": "bearer",
+            "expires_at": time.time() + 60,
+        }
+    )
+    app = make_app(
+        refreshing={
+            "auto_refresh_url": "https://example.com/oauth/refresh",
+            "storage": storage,
+        },
+        not_refreshing={},
+        unsupported={"auto_refresh_url": "https://example.com/oauth/refresh"},
+    )
+
+    result = app.test_cli_runner().invoke(args=["dance", "refresh"])
+
+    assert result.exit_code == 0, result.output
+    assert "refreshing: refreshed 1 tokens, 0 failed" in result.output
+    assert "unsupported: skipped, token storage can't list tokens" in result.output
+    assert "not_refreshing" not in result.output
+    assert storage.token["access_token"] == "fresh"
+
+
+def test_refresh_unknown_blueprint():
+    app = make_app(known={"auto_refresh_url": "https://example.com/oauth/refresh"})
+
+    result = app.test_cli_runner().invoke(
+        args=["dance", "refresh", "--blueprint", "unknown"]
+    )
+
+    assert result.exit_code == 2
+    assert "no such blueprint: unknown" in result.output
+
+
+def test_gc():
+    expired = {"access_token": "expired", "expires_at": time.time() - 60}
+    refreshable = dict(expired, refresh_token="refresh-me")
+    storages = {
+        "expired": MemoryStorage(expired),
+        "refreshable": MemoryStorage(refreshable),
+    }
+    app = make_app(
+        **{name: {"storage": storage} for name, storage in storages.items()},
+        unsupported={},
+    )
+
+    result = app.test_cli_runner().invoke(args=["dance", "gc", "--sleep", "0"])
+
+    assert result.exit_code == 0, result.output
+    assert "expired: deleted 1 expired tokens, 0 orphaned tokens" in result.output
+    assert "refreshable: deleted 0 expired tokens" in result.output
+    assert "unsupported: skipped, token storage can't list tokens" in result.output
+    assert storages["expired"].token is None
+    assert storages["refreshable"].token == refreshable
+
+
+def test_gc_grace():
+    storage = MemoryStorage({"access_token": "a", "expires_at": time.time() - 60})
+    app = make_app(recent={"storage": storage})
+
+    result = app.test_cli_runner().invoke(args=["dance", "gc", "--grace", "3600"])
+
+    assert result.exit_code == 0, result.output
+    assert "recent: deleted 0 expired tokens" in result.output
+    assert storage.token is not None
@@ -1,6 +1,6 @@
 import pytest
 
-from flask_dance.utils import FakeCache, first, getattrd
+from flask_dance.utils import FakeCache, LRUCache, first, getattrd
 
 
 def test_first():
@@ -31,3 +31,19 @@ def test_getattrd():
     assert getattrd(A, "Q", default=42) == 42
     with pytest.raises(AttributeError):
         assert getattrd(A, "Q")
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    # "b" is now the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    cache.delete("a")
+    assert cache.get("a") is None
+    cache.clear()
+    assert cache.get("c") is None